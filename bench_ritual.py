@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# bench_ritual.py — charge simulée : N joueurs jouent le rituel complet
+# -----------------------------------------------------
+# Par joueur :
+#   GET  /questions/random?count=15&telegram_user_id=…
+#   POST /ritual/start
+#   POST /ritual/complete   (15 réponses réalistes + feedback)
+#   bot.handle_webapp_data  (payload rituel, puis payload feedback)
+#
+# - Cible : `server.app` (client de test Flask, pas de socket) et les
+#   handlers du bot, upstreams servis par standin_server.StandIn via
+#   upstream.install_adapter() : aucun appel réseau réel
+# - Rapport : débit, p50 / p95 / p99 par endpoint, appels upstream par
+#   rituel (write-behind vidé avant comptage) ; JSON pour comparer les runs
+#
+#   python bench_ritual.py --players 200 --concurrency 32 \
+#       --airtable-latency lognormal:150,0.4 --notion-latency lognormal:350,0.5
+#
+# Sert à dimensionner les workers gunicorn : débit par process à
+# latence upstream réaliste.
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+BENCH_ENV = {
+    "AIRTABLE_API_URL": "http://standin.local/v0",
+    "NOTION_API_URL": "http://standin.local/v1",
+    "AIRTABLE_API_KEY": "bench",
+    "AIRTABLE_BASE_ID": "appBENCH",
+    "AIRTABLE_TABLE_ID": "questions",
+    "NOTION_API_KEY": "bench",
+    "NOTION_EXAMS_DB_ID": "bench-exams",
+    "TELEGRAM_BOT_TOKEN": "0:bench",
+    "QUESTIONS_SNAPSHOT_PATH": "",
+    "HEALTH_PROBE_SECONDS": "3600",
+    "METRICS_DIR": "",
+}
+
+
+def percentile(sorted_values, p):
+    """Rang le plus proche ; `sorted_values` trié."""
+    if not sorted_values:
+        return None
+    k = math.ceil(p / 100.0 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, k))]
+
+
+def summarize(samples, wall_s):
+    out = {}
+    for name, rows in sorted(samples.items()):
+        lat = sorted(ms for ms, _ in rows)
+        errors = sum(1 for _, ok in rows if not ok)
+        out[name] = {
+            "count": len(rows),
+            "errors": errors,
+            "rps": round(len(rows) / wall_s, 2) if wall_s else None,
+            "mean_ms": round(sum(lat) / len(lat), 2) if lat else None,
+            "p50_ms": round(percentile(lat, 50), 2) if lat else None,
+            "p95_ms": round(percentile(lat, 95), 2) if lat else None,
+            "p99_ms": round(percentile(lat, 99), 2) if lat else None,
+            "max_ms": round(lat[-1], 2) if lat else None,
+        }
+    return out
+
+
+class Recorder:
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, elapsed_ms, ok):
+        with self._lock:
+            self.samples.setdefault(name, []).append((elapsed_ms, ok))
+
+    def timed(self, name, fn, ok=lambda r: True):
+        t0 = time.perf_counter()
+        try:
+            res = fn()
+        except Exception:
+            self.add(name, (time.perf_counter() - t0) * 1000, False)
+            raise
+        self.add(name, (time.perf_counter() - t0) * 1000, ok(res))
+        return res
+
+
+# -------------------------------------------------
+# Bot : faux Update / Context pour handle_webapp_data
+# -------------------------------------------------
+class _Message:
+
+    def __init__(self, data):
+        self.web_app_data = SimpleNamespace(data=data)
+        self.text = None
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def _update(user_id, data):
+    user = SimpleNamespace(id=user_id, first_name="Bench",
+                           last_name=str(user_id), username=None)
+    msg = _Message(data)
+    return SimpleNamespace(effective_user=user, effective_message=msg,
+                           message=msg), msg
+
+
+class BotLoop:
+    """Event loop du bot dans un thread ; les joueurs y soumettent leurs
+    updates comme le ferait python-telegram-bot."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       name="bench-bot-loop", daemon=True)
+        self.thread.start()
+
+    def run(self, coro, timeout=120):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+# -------------------------------------------------
+# Scénario
+# -------------------------------------------------
+def build_answers(questions, rng):
+    answers = []
+    for q in questions:
+        correct = q.get("correct_index")
+        selected = correct if rng.random() < 0.6 else rng.randrange(4)
+        answers.append({
+            "question_id": q.get("id"),
+            "selected_index": selected,
+            "correct_index": correct,
+            "is_correct": selected == correct,
+            "time_ms": int(rng.uniform(4000, 40000)),
+        })
+    return answers
+
+
+def play(player_no, ctx):
+    server, rec, rng = ctx["server"], ctx["recorder"], random.Random(player_no)
+    client = server.app.test_client()
+    uid = 700000000 + player_no
+    count = ctx["count"]
+
+    r = rec.timed(
+        "GET /questions/random",
+        lambda: client.get(f"/questions/random?count={count}"
+                           f"&telegram_user_id={uid}"),
+        ok=lambda r: r.status_code == 200)
+    questions = (r.get_json(silent=True) or {}).get("questions") or []
+
+    r = rec.timed(
+        "POST /ritual/start",
+        lambda: client.post("/ritual/start",
+                            json={"mode": "rituel_full_v1",
+                                  "telegram_user_id": str(uid)}),
+        ok=lambda r: r.status_code == 200)
+    attempt_id = (r.get_json(silent=True) or {}).get("attempt_id")
+
+    answers = build_answers(questions, rng)
+    score = sum(1 for a in answers if a["is_correct"])
+    time_total = sum(a["time_ms"] for a in answers) // 1000
+    # même attempt_id côté HTTP et sendData : une seule page Notion
+    client_payload = {
+        "mode": "rituel_full_v1",
+        "attempt_id": attempt_id,
+        "score": score,
+        "total": len(answers),
+        "time_total_seconds": time_total,
+        "answers": answers,
+    }
+    rec.timed(
+        "POST /ritual/complete",
+        lambda: client.post("/ritual/complete", json={
+            "attempt_id": attempt_id,
+            "telegram_user_id": str(uid),
+            "mode": "rituel_full_v1",
+            "score_raw": score,
+            "score_max": len(answers),
+            "time_total_seconds": time_total,
+            "completed_at": datetime.now(timezone.utc).isoformat(),
+            "answers": answers,
+            "feedback": {"text": "Bench feedback", "rating": rng.randint(1, 5)},
+            "client_payload": client_payload,
+        }),
+        ok=lambda r: r.status_code in (200, 202))
+
+    if ctx["bot"] is not None:
+        bot, loop = ctx["bot"], ctx["bot_loop"]
+        for name, data in (
+            ("bot handle_webapp_data (rituel)", client_payload),
+            ("bot handle_webapp_data (feedback)", {
+                "mode": "rituel_feedback_v1",
+                "feedback_text": "Bench feedback"
+            }),
+        ):
+            update, msg = _update(uid, json.dumps(data))
+            context = SimpleNamespace(user_data={"exam_mode": "Test"},
+                                      args=[])
+            rec.timed(name,
+                      lambda: loop.run(bot.handle_webapp_data(update, context)),
+                      ok=lambda _: bool(msg.replies)
+                      and not msg.replies[-1].startswith("❌"))
+
+
+def wait_write_behind(server, timeout):
+    if not getattr(server, "WRITE_BEHIND_ENABLED", False):
+        return 0.0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        depth = server.WRITE_BEHIND.depth()
+        if not depth.get("pending") and not depth.get("running"):
+            break
+        time.sleep(0.05)
+    return time.perf_counter() - t0
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Benchmark du rituel complet (server.app + bot, "
+        "upstreams simulés)")
+    ap.add_argument("--players", type=int, default=100)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--count", type=int, default=15,
+                    help="questions par rituel")
+    ap.add_argument("--questions", type=int, default=500,
+                    help="taille de la banque simulée")
+    ap.add_argument("--airtable-latency", default="lognormal:150,0.4")
+    ap.add_argument("--notion-latency", default="lognormal:350,0.5")
+    ap.add_argument("--airtable-error-rate", type=float, default=0.0)
+    ap.add_argument("--notion-error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-limit", action="store_true")
+    ap.add_argument("--sync", action="store_true",
+                    help="WRITE_BEHIND_ENABLED=0 (écritures dans la requête)")
+    ap.add_argument("--no-bot", action="store_true",
+                    help="sans handle_webapp_data (pas de python-telegram-bot)")
+    ap.add_argument("--drain-timeout", type=float, default=120.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default=None,
+                    help="fichier JSON (défaut : bench_results/ritual-<utc>.json)")
+    args = ap.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="velvet-bench-")
+    for k, v in BENCH_ENV.items():
+        os.environ.setdefault(k, v)
+    os.environ.setdefault("WRITE_BEHIND_DB",
+                          os.path.join(workdir, "write_behind.db"))
+    os.environ.setdefault("UPSTREAM_RATE_DIR", os.path.join(workdir, "ratelimit"))
+    os.environ.setdefault("IDEMPOTENCY_DB",
+                          os.path.join(workdir, "idempotency.db"))
+    os.environ["WRITE_BEHIND_ENABLED"] = "0" if args.sync else "1"
+
+    import standin_server
+    import upstream
+
+    standin = standin_server.StandIn(
+        airtable_latency=args.airtable_latency,
+        notion_latency=args.notion_latency,
+        airtable_error_rate=args.airtable_error_rate,
+        notion_error_rate=args.notion_error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed)
+    standin.seed_questions(os.environ["AIRTABLE_BASE_ID"],
+                           os.environ["AIRTABLE_TABLE_ID"], args.questions)
+    upstream.install_adapter(standin_server.StandInAdapter(standin))
+
+    import server
+
+    bot = bot_loop = None
+    if not args.no_bot:
+        import bot
+        bot_loop = BotLoop()
+
+    # banque chargée hors mesure : on mesure le régime établi
+    server.QUESTION_BANK.ensure_started()
+    server.app.test_client().get("/health")
+    standin.reset_stats()
+
+    ctx = {
+        "server": server,
+        "bot": bot,
+        "bot_loop": bot_loop,
+        "recorder": Recorder(),
+        "count": args.count,
+    }
+    failures = []
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(play, i, ctx) for i in range(args.players)]
+        for fut in futures:
+            try:
+                fut.result()
+            except Exception as e:
+                failures.append(repr(e))
+    wall_s = time.perf_counter() - t0
+    drain_s = wait_write_behind(server, args.drain_timeout)
+    if bot_loop is not None:
+        bot_loop.stop()
+
+    calls = standin.stats()
+    total_calls = sum(calls.values())
+    per_service = {}
+    for key, n in calls.items():
+        service = key.split(" ", 1)[0]
+        per_service[service] = per_service.get(service, 0) + n
+
+    result = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "write_behind": not args.sync,
+        "wall_seconds": round(wall_s, 3),
+        "write_behind_drain_seconds": round(drain_s, 3),
+        "rituals_per_second": round(args.players / wall_s, 2) if wall_s else None,
+        "player_failures": failures[:20],
+        "endpoints": summarize(ctx["recorder"].samples, wall_s),
+        "upstream": {
+            "calls_total": total_calls,
+            "calls_per_ritual": round(total_calls / args.players, 2)
+            if args.players else None,
+            "calls_per_ritual_by_service": {
+                k: round(v / args.players, 2) for k, v in per_service.items()
+            } if args.players else {},
+            "calls": calls,
+        },
+    }
+
+    out = args.out or os.path.join(
+        "bench_results",
+        f"ritual-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as fh:
+        json.dump(result, fh, ensure_ascii=False, indent=2)
+
+    print(f"🕯️ {args.players} rituels en {wall_s:.2f}s "
+          f"({result['rituals_per_second']} rituels/s, "
+          f"concurrence {args.concurrency})")
+    for name, st in result["endpoints"].items():
+        print(f"  {name:<38} n={st['count']:<5} err={st['errors']:<4} "
+              f"p50={st['p50_ms']}ms p95={st['p95_ms']}ms p99={st['p99_ms']}ms")
+    print(f"  upstream : {result['upstream']['calls_per_ritual']} appels/rituel "
+          f"{result['upstream']['calls_per_ritual_by_service']}")
+    if failures:
+        print(f"  ⚠️ {len(failures)} joueurs en échec (voir player_failures)")
+    print(f"  → {out}")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,14 +16,18 @@ import json
 import logging
 import threading
 import asyncio
+import functools
 import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from typing import Any, Dict, Optional, List
 
-import requests
-
 # ✅ backend UNIQUE importé
 import server  # server.py — Velvet MCP Core (questions/random, feedback endpoint éventuel, health, CORS, etc.)
+import upstream  # client HTTP partagé (pools keep-alive Airtable/Notion)
+import velvet_log  # logging non bloquant (QueueHandler) + ring buffer debug
+from ttl_cache import LRUTTLCache
 
 from telegram import (
     Update,
@@ -81,10 +85,9 @@ NOTION_FIELDS = {
 #  LOGGING
 # ============================================================================
 
-logging.basicConfig(
-    format="%(asctime)s — %(name)s — %(levelname)s — %(message)s",
-    level=logging.INFO)
-logger = logging.getLogger(__name__)
+# QueueHandler + listener (velvet_log.py) : les handlers n'attendent pas stderr
+velvet_log.setup()
+logger = velvet_log.get_logger("bot")
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
 logging.getLogger("telegram").setLevel(logging.WARNING)
@@ -149,26 +152,16 @@ def compute_player_profile(score: int, total_questions: int,
 
 
 def format_answers_pretty(answers: List[Dict[str, Any]]) -> str:
-    lines: List[str] = []
-    for a in answers:
-        qid = a.get("question_id") or "?"
-        letter = a.get("choice_letter") or "-"
-        status = (a.get("status") or "").lower()
-        if status == "correct":
-            mark = "✅"
-        elif status == "timeout":
-            mark = "⏳"
-        else:
-            mark = "❌"
-        lines.append(f"{qid} : {letter} {mark}")
-    return "\n".join(lines) if lines else "-"
+    # même rendu que la page écrite par le serveur (/ritual/complete) :
+    # choice_letter / status (WebApp) ou selected_index / is_correct
+    return server.format_answers_pretty(answers)
 
 
 # ============================================================================
 #  NOTION API
 # ============================================================================
 
-NOTION_BASE_URL = "https://api.notion.com/v1"
+NOTION_BASE_URL = upstream.NOTION_API_URL
 NOTION_HEADERS = {
     "Authorization": f"Bearer {NOTION_API_KEY}",
     "Notion-Version": "2022-06-28",
@@ -178,7 +171,7 @@ NOTION_HEADERS = {
 
 def notion_query(database_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     url = f"{NOTION_BASE_URL}/databases/{database_id}/query"
-    resp = requests.post(url, headers=NOTION_HEADERS, json=payload, timeout=20)
+    resp = upstream.post(url, headers=NOTION_HEADERS, json=payload, timeout=20)
     if not resp.ok:
         logger.error("Erreur Notion (query) %s : %s", resp.status_code,
                      resp.text)
@@ -194,7 +187,7 @@ def notion_create_page(database_id: str, properties: Dict[str, Any]) -> str:
         },
         "properties": properties
     }
-    resp = requests.post(url, headers=NOTION_HEADERS, json=payload, timeout=20)
+    resp = upstream.post(url, headers=NOTION_HEADERS, json=payload, timeout=20)
     if not resp.ok:
         logger.error("Erreur Notion (create) %s : %s", resp.status_code,
                      resp.text)
@@ -205,7 +198,7 @@ def notion_create_page(database_id: str, properties: Dict[str, Any]) -> str:
 def notion_update_page(page_id: str, properties: Dict[str, Any]) -> None:
     url = f"{NOTION_BASE_URL}/pages/{page_id}"
     payload = {"properties": properties}
-    resp = requests.patch(url,
+    resp = upstream.patch(url,
                           headers=NOTION_HEADERS,
                           json=payload,
                           timeout=20)
@@ -243,6 +236,111 @@ def has_already_taken_exam(joueur_id: str, mode: str = "Prod") -> bool:
         return False
 
 
+# ============================================================================
+#  INDEX LOCAL — joueurs ayant déjà passé l'examen Prod
+# ============================================================================
+
+EXAM_INDEX_RECONCILE_SECONDS = int(
+    os.getenv("EXAM_INDEX_RECONCILE_SECONDS", "900"))
+
+
+def _page_joueur_id(page: Dict[str, Any]) -> Optional[str]:
+    prop = (page.get("properties") or {}).get(NOTION_FIELDS["joueur_id"]) or {}
+    text = "".join(t.get("plain_text") or (t.get("text") or {}).get("content", "")
+                   for t in prop.get("title") or [])
+    return text.strip() or None
+
+
+class ExamTakersIndex:
+    """Joueur ID ayant une page Mode=Prod dans la DB examens.
+
+    Chargé au boot (requêtes Notion paginées), complété dès qu'un examen
+    Prod est créé, et réconcilié périodiquement avec Notion.
+    """
+
+    def __init__(self) -> None:
+        self._ids: set = set()
+        self._added_during_load: Optional[set] = None
+        self._lock = threading.Lock()
+        self.ready = False
+        self.loaded_at: Optional[float] = None
+
+    def __contains__(self, joueur_id: str) -> bool:
+        return str(joueur_id) in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, joueur_id: str) -> None:
+        with self._lock:
+            self._ids.add(str(joueur_id))
+            if self._added_during_load is not None:
+                self._added_during_load.add(str(joueur_id))
+
+    def reload(self, mode: str = "Prod") -> int:
+        with self._lock:
+            self._added_during_load = set()
+        try:
+            ids = set()
+            payload: Dict[str, Any] = {
+                "filter": {
+                    "property": NOTION_FIELDS["mode"],
+                    "select": {
+                        "equals": mode
+                    }
+                },
+                "page_size": 100,
+            }
+            while True:
+                data = notion_query(NOTION_EXAMS_DB_ID, payload)
+                for page in data.get("results", []):
+                    jid = _page_joueur_id(page)
+                    if jid:
+                        ids.add(jid)
+                if not data.get("has_more") or not data.get("next_cursor"):
+                    break
+                payload["start_cursor"] = data["next_cursor"]
+
+            with self._lock:
+                # examens créés pendant le chargement : on ne les perd pas
+                self._ids = ids | self._added_during_load
+                self.ready = True
+                self.loaded_at = time.time()
+            logger.info("📇 Exam index loaded: %s joueurs (%s)", len(ids), mode)
+            return len(ids)
+        finally:
+            with self._lock:
+                self._added_during_load = None
+
+
+EXAM_TAKERS = ExamTakersIndex()
+
+# joueur_id -> page_id du dernier examen créé par ce process
+LAST_EXAM_PAGES = LRUTTLCache(
+    maxsize=int(os.getenv("LAST_EXAM_CACHE_MAXSIZE", "10000")),
+    ttl=float(os.getenv("LAST_EXAM_CACHE_TTL_SECONDS", "86400")))
+
+
+@server.on_exam_page_created
+def _remember_server_exam_page(joueur_id: str, mode: str,
+                               page_id: Optional[str]) -> None:
+    """Page créée par le serveur (/ritual/complete, write-behind) : même
+    mise à jour de l'index que create_exam_in_notion. Les pages créées par
+    un autre process arrivent au prochain reload."""
+    if page_id:
+        LAST_EXAM_PAGES.set(joueur_id, page_id)
+    if mode == "Prod":
+        EXAM_TAKERS.add(joueur_id)
+
+
+def has_taken_prod_exam(joueur_id: str) -> bool:
+    """Lecture locale ; Notion n'est interrogé que si l'index n'a jamais pu
+    être chargé."""
+    if EXAM_TAKERS.ready:
+        return joueur_id in EXAM_TAKERS
+    return has_already_taken_exam(joueur_id, mode="Prod")
+
+
 def compute_statut(score: int, total_questions: int, mode: str) -> str:
     # Si on ne connaît pas le total (ex: feedback seul), on évite un statut arbitraire.
     if total_questions <= 0:
@@ -254,6 +352,37 @@ def compute_statut(score: int, total_questions: int, mode: str) -> str:
     return "Admis" if score >= seuil else "Refusé"
 
 
+def _telegram_properties(nom_utilisateur: str, username_telegram: str,
+                         version_bot: str) -> Dict[str, Any]:
+    """Propriétés que seul le bot connaît (profil Telegram, version)."""
+    return {
+        NOTION_FIELDS["version_bot"]: {
+            "rich_text": [{
+                "type": "text",
+                "text": {
+                    "content": (version_bot or BOT_VERSION)[:1900]
+                }
+            }]
+        },
+        NOTION_FIELDS["nom_utilisateur"]: {
+            "rich_text": [{
+                "type": "text",
+                "text": {
+                    "content": (nom_utilisateur or "-")[:1900]
+                }
+            }]
+        },
+        NOTION_FIELDS["username_telegram"]: {
+            "rich_text": [{
+                "type": "text",
+                "text": {
+                    "content": (username_telegram or "-")[:1900]
+                }
+            }]
+        },
+    }
+
+
 def create_exam_in_notion(
     joueur_id: str,
     mode: str,
@@ -324,39 +453,21 @@ def create_exam_in_notion(
                 }
             }]
         },
-        NOTION_FIELDS["version_bot"]: {
-            "rich_text": [{
-                "type": "text",
-                "text": {
-                    "content": (version_bot or BOT_VERSION)[:1900]
-                }
-            }]
-        },
-        NOTION_FIELDS["nom_utilisateur"]: {
-            "rich_text": [{
-                "type": "text",
-                "text": {
-                    "content": (nom_utilisateur or "-")[:1900]
-                }
-            }]
-        },
-        NOTION_FIELDS["username_telegram"]: {
-            "rich_text": [{
-                "type": "text",
-                "text": {
-                    "content": (username_telegram or "-")[:1900]
-                }
-            }]
-        },
         NOTION_FIELDS["profil_joueur"]: {
             "select": {
                 "name": profil_joueur
             }
         },
+        **_telegram_properties(nom_utilisateur, username_telegram,
+                               version_bot),
     }
 
     try:
         page_id = notion_create_page(NOTION_EXAMS_DB_ID, properties)
+        if page_id:
+            LAST_EXAM_PAGES.set(joueur_id, page_id)
+        if mode == "Prod":
+            EXAM_TAKERS.add(joueur_id)
         logger.info("✅ Notion page créée=%s | time=%s (%s)", page_id,
                     total_time_s, time_mmss)
         return page_id
@@ -365,6 +476,36 @@ def create_exam_in_notion(
         return None
 
 
+def create_exam_once(attempt_id: Optional[str], **fields: Any) -> Optional[str]:
+    """create_exam_in_notion, une seule page par attempt_id : si le serveur
+    l'a déjà créée depuis /ritual/complete, on reprend la sienne et on y
+    ajoute ce que lui ne connaît pas (nom Telegram, username, version) —
+    la page est la même quel que soit le chemin arrivé en premier."""
+
+    def create() -> Dict[str, Any]:
+        page_id = create_exam_in_notion(**fields)
+        return {"ok": bool(page_id), "page_id": page_id, "source": "bot"}
+
+    res = server.notion_exam_once(attempt_id, create, wait=NOTION_DEDUPE_WAIT)
+    page_id = res.get("page_id")
+    if page_id and res.get("deduped"):
+        LAST_EXAM_PAGES.set(fields["joueur_id"], page_id)
+        if fields.get("mode") == "Prod":
+            EXAM_TAKERS.add(fields["joueur_id"])
+        logger.info("♻️ Notion page déjà créée pour attempt %s : %s",
+                    attempt_id, page_id)
+        if res.get("source") == "http":
+            try:
+                notion_update_page(
+                    page_id,
+                    _telegram_properties(fields.get("nom_utilisateur"),
+                                         fields.get("username_telegram"),
+                                         fields.get("version_bot")))
+            except Exception as e:
+                logger.error("❌ Erreur complément page %s : %s", page_id, e)
+    return page_id
+
+
 def get_last_exam_page_for_player(joueur_id: str) -> Optional[str]:
     try:
         payload = {
@@ -408,11 +549,56 @@ def update_exam_feedback(page_id: str, feedback: str) -> bool:
         return False
 
 
+# ============================================================================
+#  ASYNC — Notion hors de l'event loop + ordre par joueur
+# ============================================================================
+
+# Les appels Notion (requests, bloquants) partent sur un pool dédié : l'event
+# loop continue de servir les autres joueurs pendant que Notion répond.
+NOTION_IO_WORKERS = int(os.getenv("NOTION_IO_WORKERS", "8"))
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "64"))
+# attente max si le serveur crée la même page d'examen au même moment
+NOTION_DEDUPE_WAIT = float(os.getenv("NOTION_DEDUPE_WAIT", "10"))
+
+_notion_executor = ThreadPoolExecutor(max_workers=NOTION_IO_WORKERS,
+                                      thread_name_prefix="notion-io")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _notion_executor, functools.partial(fn, *args, **kwargs))
+
+
+# Updates traitées en parallèle (concurrent_updates), mais celles d'un même
+# joueur restent dans l'ordre : un verrou par user id, libéré par le GC
+# dès qu'aucun handler ne l'attend.
+_user_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = (
+    weakref.WeakValueDictionary())
+
+
+def per_user_ordered(handler):
+
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        if not user:
+            return await handler(update, context)
+        lock = _user_locks.get(user.id)
+        if lock is None:
+            lock = _user_locks[user.id] = asyncio.Lock()
+        async with lock:
+            return await handler(update, context)
+
+    return wrapper
+
+
 # ============================================================================
 #  TELEGRAM — COMMANDES
 # ============================================================================
 
 
+@per_user_ordered
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     msg = update.effective_message
@@ -434,14 +620,19 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # ✅ retire l'ancien clavier
     await msg.reply_text("⟡", reply_markup=ReplyKeyboardRemove())
 
-    if has_already_taken_exam(joueur_id, mode="Prod") and not admin:
+    if EXAM_TAKERS.ready:
+        already_taken = joueur_id in EXAM_TAKERS
+    else:
+        already_taken = await run_blocking(has_taken_prod_exam, joueur_id)
+
+    if already_taken and not admin:
         await msg.reply_text(
             "🕯️ Tu as déjà franchi l'épreuve officielle, une seule fois suffit."
         )
         return
 
-    # ✅ cache-buster réel
-    v = int(time.time())
+    # ✅ cache-buster = version de contenu : ne change que si les assets changent
+    v = server.webapp_version()
     webapp_url = (
         "https://oracle--Velvet-elite.replit.app/webapp/"
         f"?api=https://oracle--Velvet-elite.replit.app&v={v}")
@@ -465,6 +656,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                          reply_markup=keyboard)
 
 
+@per_user_ordered
 async def whoami(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     msg = update.effective_message
@@ -492,6 +684,7 @@ async def handle_any_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
         logger.exception("WEBAPP_DATA_FALLBACK_FAILED")
     return
 
+@per_user_ordered
 async def handle_webapp_data(update: Update,
                              context: ContextTypes.DEFAULT_TYPE) -> None:
     msg = update.effective_message
@@ -507,8 +700,8 @@ async def handle_webapp_data(update: Update,
     username = f"@{user.username}" if user.username else "-"
 
     raw = msg.web_app_data.data
-    logger.info("🟣 WEBAPP_DATA_RX len=%s raw(first200)=%r", len(raw or ""),
-                (raw or "")[:200])
+    velvet_log.debug_sampled(logger, "🟣 WEBAPP_DATA_RX len=%s raw(first200)=%r",
+                             len(raw or ""), (raw or "")[:200])
 
     try:
         payload = json.loads(raw)
@@ -562,9 +755,12 @@ async def handle_webapp_data(update: Update,
 
         commentaires = _first_str(
             payload,
-            ["feedback_text", "commentaires", "commentaire", "message"]) or "-"
+            ["comment_text", "feedback_text", "commentaires", "commentaire",
+             "message"]) or "-"
 
-        page_id = create_exam_in_notion(
+        page_id = await run_blocking(
+            create_exam_once,
+            _first_str(payload, ["attempt_id"]),
             joueur_id=joueur_id,
             mode=exam_mode_value,
             score=score,
@@ -588,10 +784,13 @@ async def handle_webapp_data(update: Update,
             payload, ["feedback_text", "commentaires", "feedback", "text"])
                          or "-").strip() or "-"
 
-        page_id = get_last_exam_page_for_player(joueur_id)
+        # Notion n'est interrogé que sur cache miss (ex. après un restart)
+        page_id = LAST_EXAM_PAGES.get(joueur_id) or await run_blocking(
+            get_last_exam_page_for_player, joueur_id)
         if not page_id:
             # Aucun rituel trouvé : on crée une trace minimale (statut=En cours via compute_statut total_questions<=0)
-            created = create_exam_in_notion(
+            created = await run_blocking(
+                create_exam_in_notion,
                 joueur_id=joueur_id,
                 mode=exam_mode_value,
                 score=0,
@@ -608,7 +807,7 @@ async def handle_webapp_data(update: Update,
                                  "❌ Feedback reçu, mais Notion a refusé.")
             return
 
-        ok = update_exam_feedback(page_id, feedback_text)
+        ok = await run_blocking(update_exam_feedback, page_id, feedback_text)
         await msg.reply_text("🕯️ Feedback noté." if ok else
                              "❌ Feedback reçu, mais Notion a refusé.")
         return
@@ -637,32 +836,67 @@ def run_flask():
 
 
 async def debug_any_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # trace échantillonnée : update.to_dict() seulement si elle est gardée
+    if not velvet_log.sampled(logger):
+        return
     try:
         d = update.to_dict()
-        logger.info("🧪 UPDATE_RX keys=%s", list(d.keys()))
+        logger.debug("🧪 UPDATE_RX keys=%s", list(d.keys()))
         m = getattr(update, "message", None)
         if m:
             wad = getattr(m, "web_app_data", None)
-            logger.info("🧪 MSG_RX text=%r has_web_app_data=%s", m.text,
-                        bool(wad))
+            logger.debug("🧪 MSG_RX text=%r has_web_app_data=%s", m.text,
+                         bool(wad))
             if wad:
-                logger.info("🧪 WEBAPP_DATA_RX len=%s",
-                            len(getattr(wad, "data", "") or ""))
+                logger.debug("🧪 WEBAPP_DATA_RX len=%s",
+                             len(getattr(wad, "data", "") or ""))
     except Exception as e:
         logger.exception("🧪 debug_any_update error: %s", e)
 
 
+async def debuglog(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/debuglog [n] [niveau] — derniers événements du ring buffer (admins)."""
+    user = update.effective_user
+    msg = update.effective_message
+    if not user or not msg or not is_admin(str(user.id)):
+        return
+    args = list(context.args or [])
+    limit = int(args.pop(0)) if args and args[0].isdigit() else 30
+    level = args[0] if args else "DEBUG"
+    text = velvet_log.format_events(
+        velvet_log.recent_events(min(limit, 200), level)) or "—"
+    # limite Telegram : 4096 caractères, on garde la fin (plus récent)
+    await msg.reply_text(text[-4000:])
+
+
 # ============================================================================
 #  MAIN
 # ============================================================================
 
 
+async def reconcile_exam_index() -> None:
+    while True:
+        await asyncio.sleep(EXAM_INDEX_RECONCILE_SECONDS)
+        try:
+            await run_blocking(EXAM_TAKERS.reload)
+        except Exception as e:
+            logger.warning("⚠️ Exam index reconcile failed: %s", e)
+
+
 async def main():
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    try:
+        await run_blocking(EXAM_TAKERS.reload)
+    except Exception as e:
+        logger.error("❌ Exam index load failed (fallback Notion): %s", e)
+    reconcile_task = asyncio.create_task(reconcile_exam_index())
+
+    application = (Application.builder().token(TELEGRAM_BOT_TOKEN)
+                   .concurrent_updates(BOT_CONCURRENT_UPDATES).build())
 
     # Commandes
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("whoami", whoami))
+    application.add_handler(CommandHandler("debuglog", debuglog))
     
     # WebApp data handler - ONLY for web_app_data messages
     application.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, handle_webapp_data))
@@ -681,6 +915,7 @@ async def main():
             while True:
                 await asyncio.sleep(3600)
         finally:
+            reconcile_task.cancel()
             await application.updater.stop()
             await application.stop()
 
@@ -0,0 +1,135 @@
+# circuit_breaker.py — disjoncteur par upstream (Airtable / Notion)
+# -----------------------------------------------------
+# - closed : appels normaux ; taux d'erreur (timeouts, erreurs réseau, 5xx)
+#   mesuré sur une fenêtre glissante. Au-delà du seuil, avec assez
+#   d'appels dans la fenêtre -> open
+# - open : échec immédiat (CircuitOpen) pendant `open_seconds` ; plus de
+#   worker bloqué sur le timeout d'une dépendance morte
+# - half-open : un seul appel d'essai à la fois ; succès -> closed,
+#   échec -> open pour un nouveau cycle
+# - État par process : chaque worker gunicorn apprend seul, en quelques
+#   appels ; les 429 relèvent du rate limiting, pas du disjoncteur
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# valeurs exportées en gauge (metrics.py)
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Upstream coupé : l'appel n'a pas été tenté."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name}: circuit open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, error_rate=0.5, min_calls=5, window=30.0,
+                 open_seconds=15.0, clock=time.time):
+        self.name = name
+        self._clock = clock
+        self.error_rate = float(error_rate)
+        self.min_calls = max(1, int(min_calls))
+        self.window = float(window)
+        self.open_seconds = float(open_seconds)
+        self.state = CLOSED
+        self.opened_at = None
+        self.opens = 0
+        self._events = deque()  # (ts, failed) des appels de la fenêtre
+        self._failures = 0
+        self._trial = False  # appel d'essai half-open en cours
+        self._lock = threading.Lock()
+
+    def _retry_in(self, now):
+        return max(0.0, self.opened_at + self.open_seconds - now)
+
+    def check(self):
+        """Échec immédiat si le circuit est ouvert (sans réserver l'essai
+        half-open) : à appeler avant d'attendre un créneau de débit."""
+        if self.state == OPEN:
+            now = self._clock()
+            retry_in = self._retry_in(now)
+            if retry_in > 0:
+                raise CircuitOpen(self.name, retry_in)
+
+    def before_call(self):
+        """Autorise l'appel ou lève CircuitOpen. Tout appel autorisé doit
+        être suivi de record()."""
+        with self._lock:
+            now = self._clock()
+            if self.state == OPEN:
+                retry_in = self._retry_in(now)
+                if retry_in > 0:
+                    raise CircuitOpen(self.name, retry_in)
+                self.state = HALF_OPEN
+                self._trial = False
+            if self.state == HALF_OPEN:
+                if self._trial:
+                    raise CircuitOpen(self.name, self.open_seconds)
+                self._trial = True
+
+    def record(self, failed):
+        with self._lock:
+            now = self._clock()
+            if self.state == HALF_OPEN:
+                self._trial = False
+                if failed:
+                    self._open(now)
+                else:
+                    self._close()
+                return
+            if self.state == OPEN:
+                return  # appel parti avant l'ouverture
+
+            self._events.append((now, failed))
+            self._failures += failed
+            while self._events and now - self._events[0][0] > self.window:
+                _, old = self._events.popleft()
+                self._failures -= old
+            calls = len(self._events)
+            if (calls >= self.min_calls
+                    and self._failures / calls >= self.error_rate):
+                self._open(now)
+
+    def _open(self, now):
+        if self.state != OPEN:
+            logger.warning("🔌 circuit %s open for %.0fs (%s/%s failed)",
+                           self.name, self.open_seconds, self._failures,
+                           len(self._events))
+        self.state = OPEN
+        self.opened_at = now
+        self.opens += 1
+        self._events.clear()
+        self._failures = 0
+
+    def _close(self):
+        logger.info("🔌 circuit %s closed", self.name)
+        self.state = CLOSED
+        self.opened_at = None
+        self._events.clear()
+        self._failures = 0
+
+    def status(self):
+        with self._lock:
+            now = self._clock()
+            calls = len(self._events)
+            return {
+                "state": self.state,
+                "calls": calls,
+                "error_rate": round(self._failures / calls, 3) if calls else 0.0,
+                "opens": self.opens,
+                "retry_in": (round(self._retry_in(now), 1)
+                             if self.state == OPEN else None),
+            }
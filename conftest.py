@@ -0,0 +1,56 @@
+"""
+Environnement commun des tests serveur / bot
+============================================
+Lu à l'import par upstream / server / bot : posé ici, avant la collecte des
+modules de test. Airtable et Notion sont servis en mémoire par
+standin_server.StandIn (aucun appel réseau).
+"""
+
+import os
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="velvet-tests-")
+
+os.environ.update({
+    "UPSTREAM_CALL_BUDGETS": "enforce",
+    "AIRTABLE_API_URL": "http://standin.local/v0",
+    "NOTION_API_URL": "http://standin.local/v1",
+    "AIRTABLE_API_KEY": "test",
+    "AIRTABLE_BASE_ID": "appTEST",
+    "AIRTABLE_TABLE_ID": "questions",
+    "NOTION_API_KEY": "test",
+    "NOTION_EXAMS_DB_ID": "test-exams",
+    "TELEGRAM_BOT_TOKEN": "0:test",
+    "QUESTIONS_SNAPSHOT_PATH": "",
+    "QUESTIONS_SEED_PATH": "",
+    "HEALTH_PROBE_SECONDS": "3600",
+    "METRICS_DIR": "",
+    "WRITE_BEHIND_ENABLED": "1",
+    "WRITE_BEHIND_DB": os.path.join(_TMP, "write_behind.db"),
+    "UPSTREAM_RATE_DIR": os.path.join(_TMP, "ratelimit"),
+    "IDEMPOTENCY_DB": os.path.join(_TMP, "idempotency.db"),
+})
+
+
+import standin_server  # noqa: E402
+import upstream  # noqa: E402
+
+STANDIN = standin_server.StandIn(seed=7)
+STANDIN.seed_questions("appTEST", "questions", 120)
+upstream.install_adapter(standin_server.StandInAdapter(STANDIN))
+
+
+@pytest.fixture(scope="session")
+def standin():
+    return STANDIN
+
+
+@pytest.fixture(scope="module")
+def client():
+    import server
+
+    # banque chaude : les tests s'entendent hors cold start
+    server.QUESTION_BANK.ensure_started()
+    return server.app.test_client()
@@ -0,0 +1,72 @@
+# fanout.py — exécution concurrente d'étapes indépendantes
+# -----------------------------------------------------
+# - Un ThreadPoolExecutor borné partagé par le process (FANOUT_WORKERS),
+#   recréé après un fork gunicorn
+# - Plafond par requête (max_in_flight) pour rester sous les rate limits
+#   upstream même quand le pool est large
+# - La requête attend l'étape la plus lente, pas la somme des étapes
+# - Chaque étape tourne dans une copie du contexte de la requête
+#   (contextvars) : spans tracing.py et autres contextvars suivent
+
+import contextvars
+import logging
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "16"))
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    with _lock:
+        if _executor is None or _executor_pid != pid:
+            _executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS,
+                                           thread_name_prefix="fanout")
+            _executor_pid = pid
+    return _executor
+
+
+def _traced(name, fn):
+    with tracing.span(name):
+        return fn()
+
+
+def run_stages(stages, max_in_flight=3):
+    """Exécute `stages` ({nom: callable sans argument}) en parallèle.
+
+    Au plus `max_in_flight` étapes de cette requête tournent en même temps.
+    Renvoie {nom: résultat} ; une étape qui lève une exception vaut None
+    (l'exception est loguée), les autres étapes continuent. Chaque étape
+    est un span `nom` de la trace de la requête.
+    """
+    pending = list(stages.items())
+    results = {}
+    in_flight = {}
+    pool = executor()
+    max_in_flight = max(1, int(max_in_flight))
+
+    while pending or in_flight:
+        while pending and len(in_flight) < max_in_flight:
+            name, fn = pending.pop(0)
+            ctx = contextvars.copy_context()
+            in_flight[pool.submit(ctx.run, _traced, name, fn)] = name
+
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for fut in done:
+            name = in_flight.pop(fut)
+            try:
+                results[name] = fut.result()
+            except Exception as e:
+                logger.exception("❌ fan-out stage %s failed: %s", name, e)
+                results[name] = None
+    return results
@@ -0,0 +1,137 @@
+# health_probe.py — sondes upstream en tâche de fond
+# -----------------------------------------------------
+# - Un thread par process (relancé après un fork gunicorn) sonde Airtable /
+#   Notion toutes les HEALTH_PROBE_SECONDS
+# - État mis en cache par sonde : ok, latence, dernier succès, dernière
+#   erreur, échecs consécutifs -> /health répond sans appel réseau
+# - Warm-up optionnel au démarrage du thread (banque de questions, assets)
+#   -> /ready reflète des caches chauds
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _utc_iso(ts):
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class ProbeState:
+    __slots__ = ("ok", "latency_ms", "checked_at", "last_success",
+                 "last_error", "last_error_at", "consecutive_failures")
+
+    def __init__(self):
+        self.ok = False
+        self.latency_ms = None
+        self.checked_at = None
+        self.last_success = None
+        self.last_error = None
+        self.last_error_at = None
+        self.consecutive_failures = 0
+
+    def as_dict(self, stale_after):
+        stale = (self.checked_at is None
+                 or time.time() - self.checked_at > stale_after)
+        if self.checked_at is None:
+            error = "pending"
+        elif stale:
+            error = "stale"
+        else:
+            error = None if self.ok else self.last_error
+        return {
+            "ok": error is None,
+            "error": error,
+            "latency_ms": self.latency_ms,
+            "checked_at": _utc_iso(self.checked_at),
+            "last_success": _utc_iso(self.last_success),
+            "last_error": self.last_error,
+            "last_error_at": _utc_iso(self.last_error_at),
+            "consecutive_failures": self.consecutive_failures,
+            "stale": stale,
+        }
+
+
+class UpstreamProber:
+    """`checks` = {nom: callable()} ; le callable renvoie None si l'upstream
+    répond correctement, sinon un message d'erreur (ou lève)."""
+
+    def __init__(self, checks, interval=30.0, warmups=()):
+        self.checks = dict(checks)
+        self.interval = max(1.0, float(interval))
+        self.warmups = list(warmups)
+        self._states = {name: ProbeState() for name in self.checks}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self.rounds = 0
+        self.warmed = False
+
+    def probe(self, name):
+        state = self._states[name]
+        t0 = time.perf_counter()
+        try:
+            error = self.checks[name]()
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+        latency_ms = round((time.perf_counter() - t0) * 1000.0, 1)
+        now = time.time()
+        with self._lock:
+            state.checked_at = now
+            state.latency_ms = latency_ms
+            if error is None:
+                state.ok = True
+                state.last_success = now
+                state.consecutive_failures = 0
+            else:
+                state.ok = False
+                state.last_error = error
+                state.last_error_at = now
+                state.consecutive_failures += 1
+        if error is not None:
+            logger.warning("⚠️ probe %s failed: %s", name, error)
+
+    def run_once(self):
+        for name in self.checks:
+            self.probe(name)
+        self.rounds += 1
+
+    def _warm_up(self):
+        for fn in self.warmups:
+            try:
+                fn()
+            except Exception as e:
+                logger.warning("⚠️ warm-up %s failed: %s",
+                               getattr(fn, "__name__", fn), e)
+        self.warmed = True
+
+    def _loop(self):
+        self._warm_up()
+        while True:
+            self.run_once()
+            time.sleep(self.interval)
+
+    def ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            threading.Thread(target=self._loop, name="upstream-prober",
+                             daemon=True).start()
+
+    def status(self):
+        # une sonde sans résultat depuis 3 intervalles est considérée KO
+        stale_after = 3 * self.interval
+        with self._lock:
+            return {
+                name: state.as_dict(stale_after)
+                for name, state in self._states.items()
+            }
@@ -0,0 +1,169 @@
+# idempotency.py — dédoublonnage des complétions (attempt_id + hash payload)
+# -----------------------------------------------------
+# - Table SQLite en mode WAL (IDEMPOTENCY_DB), partagée par les workers
+#   gunicorn et le bot d'un même host
+# - Une clé = (portée, attempt_id) ; le premier appelant la réserve
+#   (INSERT atomique), les suivants reçoivent le résultat enregistré sans
+#   toucher Airtable / Notion
+# - Empreinte du payload : même attempt_id avec un autre contenu -> conflit
+# - Réservation avec bail : un process mort en cours de route ne bloque
+#   pas la clé ; un échec libère la clé pour un nouvel essai
+# - Bornée : rétention (IDEMPOTENCY_TTL_SECONDS) + nombre max d'entrées
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    result TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (scope, key)
+);
+CREATE INDEX IF NOT EXISTS idempotency_age ON idempotency(updated_at);
+"""
+
+# états renvoyés par begin()
+NEW = "new"  # clé réservée : faire le travail puis complete() / release()
+DONE = "done"  # déjà traité : résultat d'origine
+IN_PROGRESS = "in_progress"  # un autre appelant est dessus
+CONFLICT = "conflict"  # même clé, autre payload
+
+# champs qui changent d'un renvoi à l'autre sans changer la complétion
+VOLATILE_FIELDS = ("completed_at", )
+
+
+def fingerprint(payload, volatile=VOLATILE_FIELDS):
+    """Hash stable d'un payload JSON (clés triées, champs volatils exclus)."""
+    if isinstance(payload, dict):
+        payload = {k: v for k, v in payload.items() if k not in volatile}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False,
+                     separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+
+    def __init__(self,
+                 path,
+                 max_entries=50000,
+                 ttl_seconds=7 * 86400,
+                 lease_seconds=60.0):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self.lease_seconds = float(lease_seconds)
+        self._local = threading.local()
+        self._last_prune = 0.0
+
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path,
+                                   timeout=10,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # -------------------------------------------------
+    # API
+    # -------------------------------------------------
+    def begin(self, scope, key, fp=None):
+        """Réserve `key` ou renvoie ce qui existe déjà : `(état, résultat)`.
+
+        `fp` (empreinte du payload) : None = pas de contrôle de contenu.
+        """
+        self._prune()
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT fingerprint, status, result, lease_until FROM"
+                " idempotency WHERE scope = ? AND key = ?",
+                (scope, key)).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO idempotency (scope, key, fingerprint,"
+                    " lease_until, created_at, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (scope, key, fp, now + self.lease_seconds, now, now))
+                conn.execute("COMMIT")
+                return NEW, None
+
+            if fp is not None and row["fingerprint"] not in (None, fp):
+                conn.execute("COMMIT")
+                return CONFLICT, None
+            if row["status"] == "done":
+                conn.execute("COMMIT")
+                return DONE, json.loads(row["result"])
+            if row["lease_until"] and row["lease_until"] > now:
+                conn.execute("COMMIT")
+                return IN_PROGRESS, None
+
+            # bail expiré (process mort en cours de route) : on reprend
+            conn.execute(
+                "UPDATE idempotency SET fingerprint = COALESCE(?, fingerprint),"
+                " lease_until = ?, updated_at = ? WHERE scope = ? AND key = ?",
+                (fp, now + self.lease_seconds, now, scope, key))
+            conn.execute("COMMIT")
+            return NEW, None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def complete(self, scope, key, result):
+        """Enregistre le résultat (JSON) rendu aux appels suivants."""
+        self._conn().execute(
+            "UPDATE idempotency SET status = 'done', result = ?,"
+            " lease_until = NULL, updated_at = ? WHERE scope = ? AND key = ?",
+            (json.dumps(result, ensure_ascii=False, default=str), time.time(),
+             scope, key))
+
+    def release(self, scope, key):
+        """Échec : la clé est libérée, un renvoi refera le travail."""
+        self._conn().execute(
+            "DELETE FROM idempotency WHERE scope = ? AND key = ?"
+            " AND status = 'pending'", (scope, key))
+
+    def stats(self):
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) AS n FROM idempotency GROUP BY status"
+        ).fetchall()
+        out = {"pending": 0, "done": 0}
+        out.update({r["status"]: r["n"] for r in rows})
+        return out
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 600:
+            return
+        self._last_prune = now
+        conn = self._conn()
+        conn.execute("DELETE FROM idempotency WHERE updated_at < ?",
+                     (now - self.ttl_seconds, ))
+        # au-delà de max_entries : les plus anciennes d'abord
+        conn.execute(
+            "DELETE FROM idempotency WHERE rowid IN (SELECT rowid FROM"
+            " idempotency ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries, ))
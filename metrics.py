@@ -0,0 +1,282 @@
+# metrics.py — registre de métriques in-process, format texte Prometheus
+# -----------------------------------------------------
+# - Counters et histogrammes à labels : un dict + un lock, coût O(1) par
+#   observation (bisect sur les buckets)
+# - Collectors : valeurs lues au moment du scrape (profondeur de file,
+#   compteurs de cache...)
+# - Multi-workers gunicorn : si METRICS_DIR est défini, chaque process
+#   écrit son snapshot (metrics_<pid>.json, toutes les METRICS_FLUSH_SECONDS
+#   et au scrape) ; /metrics fusionne tous les fichiers :
+#     counters / histogrammes : somme (process morts inclus, les compteurs
+#       restent monotones)
+#     gauges : process vivants seulement, somme ou max selon la métrique
+#   Vider METRICS_DIR au (re)démarrage du déploiement.
+# - Sans METRICS_DIR, /metrics ne voit que le worker qui répond au scrape
+#   (avertissement loggé au premier appel de chaque process)
+
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "10"))
+
+# secondes ; couvre du cache mémoire (<5 ms) aux appels Notion lents
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+_lock = threading.Lock()
+_meta = {}  # nom -> {"type", "help", "buckets", "agg"}
+_values = {}  # (nom, labels) -> float | [bucket counts..., sum, count]
+_collectors = []
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _declare(name, kind, help_text, buckets=None, agg="sum"):
+    with _lock:
+        meta = _meta.get(name)
+        if meta is None:
+            _meta[name] = {
+                "type": kind,
+                "help": help_text,
+                "buckets": list(buckets) if buckets else None,
+                "agg": agg,
+            }
+        elif meta["type"] != kind:
+            raise ValueError(f"metric {name} already declared as {meta['type']}")
+
+
+class Counter:
+
+    def __init__(self, name, help_text):
+        self.name = name
+        _declare(name, "counter", help_text)
+
+    def inc(self, amount=1.0, **labels):
+        key = (self.name, _labels_key(labels))
+        with _lock:
+            _values[key] = _values.get(key, 0.0) + amount
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        _declare(name, "histogram", help_text, self.buckets)
+
+    def observe(self, value, **labels):
+        key = (self.name, _labels_key(labels))
+        i = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            row = _values.get(key)
+            if row is None:
+                # un compteur par bucket (non cumulés) + sum + count
+                row = _values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+
+def register_collector(fn):
+    """`fn()` -> itérable de (nom, type, help, labels, valeur[, agg]).
+
+    `type` vaut "gauge" ou "counter" ; `agg` ("sum" | "max") dit comment
+    fusionner une gauge entre workers (ex. "max" pour une file partagée)."""
+    _collectors.append(fn)
+    return fn
+
+
+# -------------------------------------------------
+# Snapshot du process
+# -------------------------------------------------
+def _snapshot():
+    metrics = {}
+
+    def slot(name, kind, help_text, buckets=None, agg="sum"):
+        m = metrics.get(name)
+        if m is None:
+            m = metrics[name] = {
+                "type": kind,
+                "help": help_text,
+                "buckets": buckets,
+                "agg": agg,
+                "samples": [],
+            }
+        return m
+
+    with _lock:
+        for (name, labels), value in _values.items():
+            meta = _meta[name]
+            slot(name, meta["type"], meta["help"], meta["buckets"],
+                 meta["agg"])["samples"].append(
+                     [list(labels), list(value) if isinstance(value, list) else value])
+
+    for fn in list(_collectors):
+        try:
+            rows = list(fn())
+        except Exception as e:
+            logger.warning("⚠️ metrics collector %s failed: %s",
+                           getattr(fn, "__name__", fn), e)
+            continue
+        for row in rows:
+            name, kind, help_text, labels, value = row[:5]
+            agg = row[5] if len(row) > 5 else "sum"
+            slot(name, kind, help_text, None, agg)["samples"].append(
+                [list(_labels_key(labels)), float(value)])
+
+    return {"pid": os.getpid(), "written_at": time.time(), "metrics": metrics}
+
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f"metrics_{pid}.json")
+
+
+def flush():
+    """Écrit le snapshot du process dans METRICS_DIR (écriture atomique)."""
+    if not METRICS_DIR:
+        return
+    snap = _snapshot()
+    path = _snapshot_path(snap["pid"])
+    tmp = f"{path}.tmp"
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(snap, fh, separators=(",", ":"))
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("⚠️ metrics flush failed: %s", e)
+
+
+_flusher_pid = None
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        flush()
+
+
+def ensure_flusher():
+    """Thread de flush périodique du process (relancé après un fork)."""
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid == pid:
+        return
+    with _lock:
+        if _flusher_pid == pid:
+            return
+        _flusher_pid = pid
+    if not METRICS_DIR:
+        # une fois par process : sous gunicorn, chaque scrape tombe sur un
+        # worker au hasard et ne voit que ses propres compteurs
+        logger.warning("⚠️ METRICS_DIR unset: /metrics only reports worker "
+                       "pid=%s (set METRICS_DIR with several workers)", pid)
+        return
+    threading.Thread(target=_flush_loop, name="metrics-flush",
+                     daemon=True).start()
+    atexit.register(flush)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _load_snapshots():
+    if not METRICS_DIR:
+        return [_snapshot()]
+    flush()
+    snaps = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics_*.json")):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                snaps.append(json.load(fh))
+        except (OSError, ValueError):
+            continue  # fichier en cours de remplacement / tronqué
+    return snaps
+
+
+# -------------------------------------------------
+# Fusion + rendu texte
+# -------------------------------------------------
+def _merge(snaps):
+    merged = {}
+    for snap in snaps:
+        alive = snap["pid"] == os.getpid() or _pid_alive(snap["pid"])
+        for name, m in snap["metrics"].items():
+            if m["type"] == "gauge" and not alive:
+                continue
+            out = merged.get(name)
+            if out is None:
+                out = merged[name] = dict(m, samples={})
+            samples = out["samples"]
+            for labels, value in m["samples"]:
+                key = tuple(tuple(kv) for kv in labels)
+                prev = samples.get(key)
+                if prev is None:
+                    samples[key] = value
+                elif m["type"] == "histogram":
+                    samples[key] = [a + b for a, b in zip(prev, value)]
+                elif m["type"] == "gauge" and m["agg"] == "max":
+                    samples[key] = max(prev, value)
+                else:
+                    samples[key] = prev + value
+    return merged
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _fmt_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_value(v):
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render():
+    """Texte d'exposition Prometheus (version 0.0.4), tous workers fusionnés."""
+    lines = []
+    for name, m in sorted(_merge(_load_snapshots()).items()):
+        lines.append(f"# HELP {name} {_escape(m['help'])}")
+        lines.append(f"# TYPE {name} {m['type']}")
+        for labels, value in sorted(m["samples"].items()):
+            if m["type"] != "histogram":
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+                continue
+            cumulative = 0
+            for bound, n in zip(m["buckets"] + ["+Inf"], value[:-2]):
+                cumulative += n
+                le = bound if bound == "+Inf" else _fmt_value(float(bound))
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', le)])}"
+                             f" {cumulative}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(value[-2])}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,375 @@
+# question_bank.py — Velvet Oracle question bank (in-memory)
+# -----------------------------------------------------
+# - Charge toute la table questions une seule fois (pagination Airtable)
+# - Mapping ID_question/Question/Options (JSON)/... fait au chargement
+# - Refresh en tâche de fond (QUESTIONS_REFRESH_SECONDS)
+# - Tirage aléatoire servi entièrement depuis la mémoire
+# - Snapshot disque mmap-able (QUESTIONS_SNAPSHOT_PATH) pour les cold starts,
+#   + snapshot embarqué en lecture seule (seed_path) quand le disque local
+#   est vide à chaque démarrage (serverless : /tmp éphémère)
+# - JSON de chaque question encodé une fois : une réponse = join d'octets
+# - Airtable KO : la dernière version chargée (mémoire ou snapshot) reste
+#   servie, marquée périmée (`stale_age`) ; refresh retenté plus souvent
+
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+from collections.abc import Sequence
+
+from quiz_draw import DrawIndex, stratified_draw
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionBankError(Exception):
+    """Upstream failure while loading the question table."""
+
+    def __init__(self, error, status_code=None, detail=None):
+        super().__init__(error)
+        self.error = error
+        self.status_code = status_code
+        self.detail = detail
+
+
+def map_question_record(rec):
+    """Airtable record -> question prête pour le front."""
+    f = rec.get("fields", {})
+
+    raw_opts = f.get("Options (JSON)", "[]")
+    try:
+        opts = json.loads(raw_opts) if isinstance(
+            raw_opts, str) else (raw_opts or [])
+    except Exception:
+        opts = []
+
+    return {
+        "id": f.get("ID_question"),
+        "question": f.get("Question"),
+        "options": opts,
+        "correct_index": f.get("Correct_index"),
+        "explanation": f.get("Explication"),
+        "domaine": f.get("Domaine"),
+        "niveau": f.get("Niveau"),
+    }
+
+
+def encode_question(question):
+    return json.dumps(question, ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class MappedQuestions(list):
+    """Questions mappées + leur JSON encodé une seule fois au chargement."""
+
+    def __init__(self, questions=()):
+        super().__init__(questions)
+        self.fragments = [encode_question(q) for q in self]
+
+    def fragment(self, i):
+        return self.fragments[i]
+
+
+# -----------------------------------------------------
+# Snapshot disque
+# -----------------------------------------------------
+# Format (little-endian) :
+#   header  : magic "VQBS" | version u16 | reserved u16 | count u32 | saved_at f64
+#   offsets : (count + 1) x u32, relatifs au début de la zone data
+#   data    : JSON compact UTF-8 de chaque question, concaténés
+SNAPSHOT_MAGIC = b"VQBS"
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<4sHHId")
+
+
+def write_snapshot(path, questions):
+    """Écrit la banque mappée sur disque (tmp + rename atomique)."""
+    blobs = getattr(questions, "fragments", None) or [
+        encode_question(q) for q in questions
+    ]
+    offsets = [0]
+    for b in blobs:
+        offsets.append(offsets[-1] + len(b))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(
+            _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0,
+                                  len(blobs), time.time()))
+        fh.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        fh.writelines(blobs)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+class QuestionSnapshot(Sequence):
+    """Vue read-only (mmap) d'un snapshot : les questions sont décodées à la
+    demande, seul l'index des offsets est lu à l'ouverture."""
+
+    def __init__(self, path):
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._open(path)
+        except (ValueError, struct.error):
+            self._mm.close()
+            raise
+
+    def _open(self, path):
+        size = len(self._mm)
+        if size < _SNAPSHOT_HEADER.size:
+            raise ValueError(f"truncated question snapshot: {path}")
+        magic, version, _, count, saved_at = _SNAPSHOT_HEADER.unpack_from(
+            self._mm, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"invalid question snapshot: {path}")
+
+        data_start = _SNAPSHOT_HEADER.size + 4 * (count + 1)
+        if data_start > size:
+            raise ValueError(f"truncated question snapshot: {path}")
+        offsets = struct.unpack_from(f"<{count + 1}I", self._mm,
+                                     _SNAPSHOT_HEADER.size)
+        # fichier tronqué ou réécrit en place : les offsets doivent couvrir
+        # exactement la zone data, dans l'ordre
+        if (offsets[0] != 0 or data_start + offsets[-1] != size
+                or any(a > b for a, b in zip(offsets, offsets[1:]))):
+            raise ValueError(f"corrupted question snapshot: {path}")
+
+        self.path = path
+        self.saved_at = saved_at
+        self._count = count
+        self._offsets = offsets
+        self._data_start = data_start
+
+    def __len__(self):
+        return self._count
+
+    def raw(self, i):
+        start = self._data_start + self._offsets[i]
+        end = self._data_start + self._offsets[i + 1]
+        return self._mm[start:end]
+
+    fragment = raw
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return json.loads(self.raw(i))
+
+
+# -----------------------------------------------------
+# Banque
+# -----------------------------------------------------
+class QuestionBank:
+    """Toute la table questions, mappée, en mémoire.
+
+    `fetch_page(offset)` renvoie `(records, next_offset)` pour une page
+    Airtable et lève `QuestionBankError` en cas d'échec.
+
+    Si `snapshot_path` est défini, chaque chargement réussi y est écrit et
+    un process neuf sert d'abord le snapshot (mmap) avant de se
+    réconcilier avec Airtable en tâche de fond.
+
+    `seed_path` : snapshot en lecture seule livré avec le déploiement
+    (voir `bake`), servi si `snapshot_path` n'existe pas encore — cas d'un
+    cold start serverless, où /tmp repart vide.
+    """
+
+    def __init__(self,
+                 fetch_page,
+                 refresh_seconds=300,
+                 snapshot_path=None,
+                 seen=None,
+                 retry_seconds=30,
+                 seed_path=None):
+        self._fetch_page = fetch_page
+        self.seed_path = seed_path or None
+        self.seen = seen
+        self.refresh_seconds = max(5, int(refresh_seconds))
+        self.retry_seconds = max(1, min(self.refresh_seconds, int(retry_seconds)))
+        self.snapshot_path = snapshot_path or None
+        self._questions = MappedQuestions()
+        self._index = None
+        self._source = None
+        self._loaded_at = None
+        self._last_error = None
+        self._load_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    # -------------------------------------------------
+    # Chargement
+    # -------------------------------------------------
+    def load(self):
+        """Recharge toute la table (pagination) puis swap atomique."""
+        with self._load_lock:
+            mapped = []
+            offset = None
+            while True:
+                records, offset = self._fetch_page(offset)
+                mapped.extend(map_question_record(r) for r in records)
+                if not offset:
+                    break
+            mapped = MappedQuestions(mapped)
+
+            self._questions = mapped
+            self._source = "airtable"
+            self._loaded_at = time.time()
+            self._last_error = None
+            logger.info("📚 Question bank loaded: %s questions", len(mapped))
+
+            if self.snapshot_path:
+                try:
+                    write_snapshot(self.snapshot_path, mapped)
+                except OSError as e:
+                    logger.warning("⚠️ Question snapshot write failed: %s", e)
+            return len(mapped)
+
+    def bake(self, path):
+        """Charge Airtable et écrit le snapshot à livrer avec le déploiement
+        (`seed_path`). Renvoie le nombre de questions."""
+        count = self.load()
+        write_snapshot(path, self._questions)
+        return count
+
+    def load_snapshot(self):
+        """Sert le snapshot disque (ou, à défaut, le snapshot embarqué).
+        Renvoie True si chargé."""
+        for path in (self.snapshot_path, self.seed_path):
+            if path and os.path.exists(path) and self._serve_snapshot(path):
+                return True
+        return False
+
+    def _serve_snapshot(self, path):
+        try:
+            snap = QuestionSnapshot(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning("⚠️ Question snapshot unreadable: %s", e)
+            return False
+        if not len(snap):
+            return False
+
+        self._questions = snap
+        self._source = "snapshot"
+        self._loaded_at = snap.saved_at
+        logger.info("📚 Question bank served from snapshot: %s questions",
+                    len(snap))
+        return True
+
+    def _refresh_loop(self):
+        # Servi depuis le snapshot : on se réconcilie tout de suite.
+        delay = 0 if self._source == "snapshot" else self.refresh_seconds
+        while True:
+            time.sleep(delay)
+            delay = self.refresh_seconds
+            try:
+                self.load()
+            except Exception as e:
+                # données périmées : on retente plus tôt que le cycle normal
+                self._last_error = str(e)
+                delay = self.retry_seconds
+                logger.warning("⚠️ Question bank refresh failed: %s", e)
+
+    def ensure_started(self):
+        """Premier chargement + thread de refresh.
+
+        Le premier chargement vient du snapshot disque s'il existe, sinon
+        d'Airtable (bloquant).
+
+        Le thread est (re)lancé par process : après un fork gunicorn, le
+        worker démarre son propre refresher.
+        """
+        pid = os.getpid()
+        if self._questions and self._pid == pid:
+            return
+
+        with self._start_lock:
+            if not self._questions and not self.load_snapshot():
+                self.load()
+
+            if self._pid != pid:
+                self._pid = pid
+                self._thread = threading.Thread(target=self._refresh_loop,
+                                                name="question-bank-refresh",
+                                                daemon=True)
+                self._thread.start()
+
+    # -------------------------------------------------
+    # Tirage
+    # -------------------------------------------------
+    def _index_for(self, questions):
+        # index construit à la demande, une fois par version de la banque
+        index = self._index
+        if index is None or index.source is not questions:
+            index = self._index = DrawIndex(questions)
+        return index
+
+    def draw_positions(self, count, player_id=None, quotas=(),
+                       min_per_domain=0, min_per_level=0):
+        """(questions, positions) d'un tirage.
+
+        - sans option : tirage aléatoire simple, O(k)
+        - quotas / minimums : tirage stratifié (quiz_draw.py)
+        - player_id : questions non vues servies en priorité (seen_sets.py)
+        """
+        questions = self._questions
+        if player_id is None and not (quotas or min_per_domain
+                                      or min_per_level):
+            return questions, random.sample(range(len(questions)),
+                                            min(count, len(questions)))
+
+        index = self._index_for(questions)
+        exclude = None
+        if player_id is not None:
+            seen, slots = self.seen.for_player(str(player_id), index, count)
+            exclude = lambda i: seen.has(slots[i])
+        positions = stratified_draw(index, count, quotas, min_per_domain,
+                                    min_per_level, exclude=exclude)
+        if player_id is not None:
+            self.seen.mark(seen, (slots[i] for i in positions))
+        return questions, positions
+
+    def draw(self, count, **options):
+        questions, positions = self.draw_positions(count, **options)
+        return [questions[i] for i in positions]
+
+    def draw_json(self, count, **options):
+        """Corps JSON complet d'un tirage, assemblé à partir des fragments
+        encodés au chargement (aucun dict reconstruit, aucun json.dumps)."""
+        questions, positions = self.draw_positions(count, **options)
+        return b'{"count":%d,"questions":[%s]}' % (count, b",".join(
+            questions.fragment(i) for i in positions))
+
+    def __len__(self):
+        return len(self._questions)
+
+    def stale_age(self):
+        """Âge (s) des questions servies si elles ne sont pas à jour
+        (snapshot pas encore réconcilié, dernier refresh en échec), sinon
+        None."""
+        if self._loaded_at is None:
+            return None
+        if self._source == "snapshot" or self._last_error is not None:
+            return max(0.0, time.time() - self._loaded_at)
+        return None
+
+    def status(self):
+        return {
+            "size": len(self._questions),
+            "source": self._source,
+            "loaded_at": self._loaded_at,
+            "refresh_seconds": self.refresh_seconds,
+            "last_error": self._last_error,
+            "stale_age": self.stale_age(),
+        }
@@ -0,0 +1,176 @@
+# quiz_draw.py — moteur de tirage stratifié (Domaine / Niveau)
+# -----------------------------------------------------
+# - Index en mémoire : positions des questions par domaine, par niveau et
+#   par couple (domaine, niveau)
+# - Quotas : "au moins N par domaine", "3 × N5", "1 × Art/N3"...
+# - Tirage O(k) : échantillonnage par rejet dans les buckets. Un parcours
+#   n'a lieu que si le rejet échoue (bucket presque épuisé, joueur qui a vu
+#   presque toute la banque) ; il est borné par la taille du pool tiré —
+#   le bucket du quota, ou la banque entière pour le complément
+# - `exclude` optionnel (questions déjà vues) : servi en priorité parmi les
+#   questions non exclues, complété par les exclues seulement quand il n'en
+#   reste plus (le rejet aléatoire est alors terminé par un parcours)
+#
+# Syntaxe des quotas (query string /questions/random) :
+#   quota=niveau=N5:3
+#   quota=domaine=Histoire:2,domaine=Art;niveau=N3:1
+#   min_per_domain=1   min_per_level=1
+
+import random
+
+
+class QuotaError(ValueError):
+    """Spécification de quota invalide."""
+
+
+def domain_key(value):
+    return str(value or "").strip().casefold()
+
+
+def level_key(value):
+    # "N5", "n5" et 5 désignent le même niveau
+    s = str(value if value is not None else "").strip().upper()
+    if s.startswith("N") and s[1:].isdigit():
+        s = s[1:]
+    return s
+
+
+class Quota:
+
+    def __init__(self, count, domaine=None, niveau=None):
+        self.count = int(count)
+        self.domaine = domain_key(domaine) if domaine is not None else None
+        self.niveau = level_key(niveau) if niveau is not None else None
+
+    def matches(self, key):
+        """`key` = (domain_key, level_key) d'une question."""
+        return ((self.domaine is None or key[0] == self.domaine)
+                and (self.niveau is None or key[1] == self.niveau))
+
+    def __repr__(self):
+        return (f"Quota({self.count}, domaine={self.domaine!r},"
+                f" niveau={self.niveau!r})")
+
+
+def parse_quota_specs(specs):
+    """["niveau=N5:3", "domaine=Art;niveau=N3:1,domaine=X:2"] -> [Quota]"""
+    quotas = []
+    for raw in specs:
+        for spec in (raw or "").split(","):
+            spec = spec.strip()
+            if not spec:
+                continue
+            selector, sep, count = spec.rpartition(":")
+            if not sep or not count.strip().isdigit():
+                raise QuotaError(f"invalid quota {spec!r} (expected sel:count)")
+            conds = {}
+            for cond in selector.split(";"):
+                field, eq, value = cond.partition("=")
+                field = field.strip().lower()
+                if not eq or field not in ("domaine", "niveau") or not value.strip():
+                    raise QuotaError(f"invalid quota selector {cond!r}")
+                conds[field] = value.strip()
+            quotas.append(Quota(int(count), **conds))
+    return quotas
+
+
+class DrawIndex:
+    """Buckets de positions (int) sur une séquence de questions figée."""
+
+    def __init__(self, questions):
+        self.source = questions
+        self.size = len(questions)
+        self.by_domain = {}
+        self.by_level = {}
+        self.by_pair = {}
+        self.keys = []
+        self.ids = []
+        for i in range(self.size):
+            q = questions[i]
+            d = domain_key(q.get("domaine"))
+            lv = level_key(q.get("niveau"))
+            self.keys.append((d, lv))
+            self.ids.append(q.get("id"))
+            self.by_domain.setdefault(d, []).append(i)
+            self.by_level.setdefault(lv, []).append(i)
+            self.by_pair.setdefault((d, lv), []).append(i)
+
+    def pool(self, quota):
+        if quota.domaine is not None and quota.niveau is not None:
+            return self.by_pair.get((quota.domaine, quota.niveau), [])
+        if quota.domaine is not None:
+            return self.by_domain.get(quota.domaine, [])
+        if quota.niveau is not None:
+            return self.by_level.get(quota.niveau, [])
+        return None  # toute la banque
+
+
+def sample_into(pool, need, chosen, out, size=None, exclude=None):
+    """Ajoute jusqu'à `need` positions de `pool` (liste, ou toute la banque
+    si None) absentes de `chosen` et non exclues par `exclude(i)`.
+    Rejet aléatoire : O(need) tant que le pool n'est pas presque épuisé.
+    Quand les essais sont épuisés (bucket presque vide, ou joueur qui a vu
+    presque toute la banque), on termine par un parcours du pool, O(len
+    pool) — O(size) pour `pool=None` : les positions restantes sont toutes
+    trouvées avant de rendre moins que `need`."""
+    n = size if pool is None else len(pool)
+    if need <= 0 or not n:
+        return 0
+    added = 0
+    tries = 0
+    max_tries = 4 * need + 16
+    while added < need and tries < max_tries:
+        tries += 1
+        j = random.randrange(n)
+        i = j if pool is None else pool[j]
+        if i in chosen or (exclude is not None and exclude(i)):
+            continue
+        chosen.add(i)
+        out.append(i)
+        added += 1
+    if added < need:
+        # pool presque épuisé : on termine sur les restants
+        rest = [i for i in (range(n) if pool is None else pool)
+                if i not in chosen and (exclude is None or not exclude(i))]
+        for i in random.sample(rest, min(need - added, len(rest))):
+            chosen.add(i)
+            out.append(i)
+            added += 1
+    return added
+
+
+def stratified_draw(index, count, quotas=(), min_per_domain=0,
+                    min_per_level=0, exclude=None):
+    """Positions tirées : quotas explicites d'abord (les plus spécifiques en
+    premier), puis minimums par domaine / niveau, puis complément aléatoire.
+    Le total est plafonné à `count`.
+
+    Avec `exclude`, une première passe ne prend que des positions non
+    exclues ; une seconde passe complète sans filtre."""
+    count = min(count, index.size)
+    plan = sorted(quotas,
+                  key=lambda q: (q.domaine is None) + (q.niveau is None))
+
+    extra = []
+    if min_per_domain > 0:
+        extra += [Quota(min_per_domain, domaine=d) for d in index.by_domain]
+    if min_per_level > 0:
+        extra += [Quota(min_per_level, niveau=lv) for lv in index.by_level]
+    random.shuffle(extra)
+    plan += extra
+
+    chosen = set()
+    out = []
+    for excl in ((exclude, None) if exclude is not None else (None, )):
+        for quota in plan:
+            room = count - len(out)
+            if room <= 0:
+                break
+            have = sum(1 for i in out if quota.matches(index.keys[i]))
+            sample_into(index.pool(quota), min(quota.count - have, room),
+                        chosen, out, size=index.size, exclude=excl)
+
+        sample_into(None, count - len(out), chosen, out, size=index.size,
+                    exclude=excl)
+    random.shuffle(out)
+    return out
@@ -0,0 +1,162 @@
+# rate_limit.py — token buckets partagés entre process (Airtable / Notion)
+# -----------------------------------------------------
+# - Un bucket = un petit fichier d'état (UPSTREAM_RATE_DIR) verrouillé par
+#   flock : les workers gunicorn et le thread du bot d'un même host
+#   partagent le même débit
+# - Réservation à la GCRA : le jeton est pris tout de suite (le solde peut
+#   devenir négatif) et l'appelant dort hors verrou jusqu'à son créneau ;
+#   les appels sont servis dans l'ordre des réservations
+# - Backoff adaptatif sur 429 : Retry-After si l'upstream en donne un,
+#   sinon délai exponentiel par 429 consécutif ; tout le host attend
+# - Sans fcntl (Windows) : buckets par process uniquement
+
+import os
+import random
+import re
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - pas de flock
+    fcntl = None
+
+# jetons, instant de référence (time.time(), peut être dans le futur
+# pendant un backoff), 429 consécutifs
+_STATE = struct.Struct("<ddI")
+
+
+class RateLimited(Exception):
+    """Pas de créneau dans l'attente autorisée (politique "shed")."""
+
+    def __init__(self, bucket, retry_after):
+        super().__init__(f"{bucket}: rate limited, next slot in "
+                         f"{retry_after:.2f}s")
+        self.bucket = bucket
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+
+    def __init__(self, name, rate, burst=None, state_dir=None,
+                 base_backoff=1.0, max_backoff=30.0):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.path = (os.path.join(state_dir, f"{name}.bucket")
+                     if state_dir and fcntl is not None else None)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()  # flock ne sépare pas les threads
+        self._fd = None
+        self._fd_pid = None
+        self._mem = None
+        self.strikes_hint = 0  # vu au dernier acquire (évite un reward inutile)
+
+    # -------------------------------------------------
+    # État partagé
+    # -------------------------------------------------
+    def _file(self):
+        # un fd par process : après fork, le fd hérité partagerait le verrou
+        pid = os.getpid()
+        if self._fd_pid != pid:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._fd_pid = pid
+        return self._fd
+
+    def _update(self, fn):
+        """`fn(state, now) -> (new_state, result)` sous verrou."""
+        with self._lock:
+            now = time.time()
+            if self.path is None:
+                state = self._mem or (self.burst, now, 0)
+                self._mem, result = fn(state, now)
+                return result
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                raw = os.pread(fd, _STATE.size, 0)
+                state = (_STATE.unpack(raw) if len(raw) == _STATE.size else
+                         (self.burst, now, 0))
+                new_state, result = fn(state, now)
+                if new_state != state:
+                    os.pwrite(fd, _STATE.pack(*new_state), 0)
+                return result
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _refill(self, state, now):
+        tokens, ref, strikes = state
+        if now > ref:
+            tokens = min(self.burst, tokens + (now - ref) * self.rate)
+            ref = now
+        return tokens, ref, strikes
+
+    # -------------------------------------------------
+    # API
+    # -------------------------------------------------
+    def reserve(self, max_wait):
+        """Réserve un jeton si le créneau tombe dans `max_wait` secondes.
+        Renvoie l'attente à faire, ou lève RateLimited sans rien réserver."""
+
+        def take(state, now):
+            tokens, ref, strikes = self._refill(state, now)
+            wait = (ref - now) + max(0.0, (1.0 - tokens) / self.rate)
+            if wait > max_wait:
+                return (tokens, ref, strikes), (None, wait, strikes)
+            return (tokens - 1.0, ref, strikes), (wait, wait, strikes)
+
+        wait, next_slot, self.strikes_hint = self._update(take)
+        if wait is None:
+            raise RateLimited(self.name, next_slot)
+        return wait
+
+    def acquire(self, max_wait):
+        """reserve() puis attente du créneau ; renvoie le temps attendu."""
+        wait = self.reserve(max_wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def penalize(self, retry_after=None):
+        """429 reçu : personne ne repart avant `retry_after` secondes (ou le
+        backoff exponentiel). Les réservations en cours sont décalées."""
+
+        def block(state, now):
+            tokens, ref, strikes = self._refill(state, now)
+            strikes += 1
+            if retry_after is not None:
+                delay = retry_after
+            else:
+                delay = min(self.max_backoff,
+                            self.base_backoff * 2**(strikes - 1))
+                delay *= random.uniform(1.0, 1.2)
+            return (min(tokens, 0.0), max(ref, now + delay), strikes), delay
+
+        return self._update(block)
+
+    def reward(self):
+        """Appel réussi : remet le backoff à zéro."""
+
+        def reset(state, now):
+            tokens, ref, _ = state
+            return (tokens, ref, 0), None
+
+        self.strikes_hint = 0
+        self._update(reset)
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def bucket(name, rate, state_dir=None, burst=None):
+    """Bucket partagé `name` (un seul objet par process et par nom)."""
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+    with _registry_lock:
+        b = _registry.get(name)
+        if b is None:
+            b = _registry[name] = TokenBucket(name, rate, burst, state_dir)
+        return b
@@ -0,0 +1,98 @@
+# seen_sets.py — questions déjà servies, par joueur
+# -----------------------------------------------------
+# - Slots denses et stables : ID_question -> slot (monotone, survit aux
+#   refresh de la banque)
+# - Par joueur : bitset (bytearray) sur les slots, 1 bit par question
+# - Borné : LRU + TTL sur les joueurs (SEEN_MAX_PLAYERS / SEEN_TTL_SECONDS)
+# - Quand un joueur a presque tout vu, son bitset repart à zéro (nouveau
+#   cycle) plutôt que de lui resservir toujours les mêmes restes
+# - Questions sans ID : pas de slot, jamais marquées vues
+# - Bitsets modifiés sous le verrou du store (threads de requêtes)
+# - Mémoire du process : chaque worker gunicorn / instance serverless a ses
+#   propres bitsets, perdus au redémarrage. La garantie « pas de doublon
+#   tant qu'il reste des questions non vues » ne vaut que pour les tirages
+#   servis par un même process
+
+import threading
+
+from ttl_cache import LRUTTLCache
+
+
+class PlayerSeen:
+    __slots__ = ("bits", "count")
+
+    def __init__(self):
+        self.bits = bytearray()
+        self.count = 0
+
+    def has(self, slot):
+        if slot is None:
+            return False
+        b = slot >> 3
+        return b < len(self.bits) and bool(self.bits[b] & (1 << (slot & 7)))
+
+    def add(self, slot):
+        b = slot >> 3
+        if b >= len(self.bits):
+            self.bits.extend(bytes(b + 1 - len(self.bits)))
+        mask = 1 << (slot & 7)
+        if not self.bits[b] & mask:
+            self.bits[b] |= mask
+            self.count += 1
+
+    def reset(self):
+        self.bits = bytearray()
+        self.count = 0
+
+
+class SeenQuestions:
+
+    def __init__(self, max_players=100000, ttl=90 * 86400.0):
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._players = LRUTTLCache(maxsize=max_players, ttl=ttl)
+        self._index_slots = (None, None)
+
+    def slots_for(self, index):
+        """Slot de chaque position de `index` (calculé une fois par version
+        de la banque)."""
+        cached_index, slots = self._index_slots
+        if cached_index is index:
+            return slots
+        with self._lock:
+            slots = []
+            for qid in index.ids:
+                if qid in (None, ""):
+                    slots.append(None)
+                    continue
+                slot = self._slots.get(qid)
+                if slot is None:
+                    slot = self._slots[qid] = len(self._slots)
+                slots.append(slot)
+            self._index_slots = (index, slots)
+        return slots
+
+    def for_player(self, player_id, index, count):
+        """(PlayerSeen, slots) pour un tirage de `count` questions."""
+        slots = self.slots_for(index)
+        with self._lock:
+            seen = self._players.get(player_id)
+            if seen is None:
+                seen = PlayerSeen()
+                self._players.set(player_id, seen)
+            elif seen.count + count > index.size:
+                seen.reset()
+        return seen, slots
+
+    def mark(self, seen, slots):
+        """Marque `slots` vus (None ignorés) ; deux tirages simultanés du
+        même joueur ne perdent pas de bits."""
+        with self._lock:
+            for slot in slots:
+                if slot is not None:
+                    seen.add(slot)
+
+    def stats(self):
+        st = self._players.stats()
+        st["slots"] = len(self._slots)
+        return st
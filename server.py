@@ -1,21 +1,43 @@
 # server.py — Velvet MCP Core (local, propre, souverain)
 # -----------------------------------------------------
-# - /health avec ping Airtable réel
+# - /health : état Airtable / Notion sondé en fond, /ready : caches chauds
 # - CORS actif
 # - /questions/random renvoie des questions prêtes pour le front
-# - Tirage réellement aléatoire via champ "Rand" (Airtable)
+# - Banque de questions en mémoire (question_bank.py), refresh en fond
 
 import os
+import functools
+import gzip
+import hmac
 import json
-import random
+import sys
+import tempfile
+import time
+import zlib
 from datetime import datetime, timezone
 
-import requests
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, g, jsonify, request
+
+import idempotency
+import metrics
+import tracing
+import upstream
+import velvet_log
+import webapp_assets
+from ttl_cache import LRUTTLCache
+from fanout import run_stages
+from health_probe import UpstreamProber
+from question_bank import QuestionBank, QuestionBankError
+from quiz_draw import QuotaError, parse_quota_specs
+from seen_sets import SeenQuestions
+from write_behind import PermanentFailure, RetryLater, WriteBehindQueue
+
+velvet_log.setup()
+logger = velvet_log.get_logger("server")
 
 app = Flask(__name__, static_folder='webapp', static_url_path='/webapp')
 
-print("🟢 SERVER.PY LOADED - Flask app initialized")
+logger.info("🟢 SERVER.PY LOADED - Flask app initialized")
 
 from flask_cors import CORS
 
@@ -45,7 +67,7 @@ NOTION_FIELDS = {
     "username_telegram": "Username Telegram",
 }
 
-NOTION_BASE_URL = "https://api.notion.com/v1"
+NOTION_BASE_URL = upstream.NOTION_API_URL
 
 def get_notion_headers():
     if not NOTION_API_KEY:
@@ -118,25 +140,140 @@ def format_answers_pretty(answers):
         lines.append(f"{qid} : {choice_letter} {mark}")
     return "\n".join(lines) if lines else "-"
 
+# ============================================================================
+#  IDEMPOTENCE — une complétion (attempt_id) n'écrit qu'une fois, même si la
+#  WebApp renvoie /ritual/complete et que le bot reçoit aussi le sendData
+# ============================================================================
+COMPLETIONS = idempotency.IdempotencyStore(
+    os.getenv(
+        "IDEMPOTENCY_DB",
+        os.path.join(tempfile.gettempdir(), "velvet_idempotency.sqlite3")),
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "50000")),
+    ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(7 * 86400))))
+
+
+def notion_exam_once(attempt_id, create, wait=0.0):
+    """Une seule page d'examen Notion par attempt_id, qu'elle vienne du
+    serveur (write_to_notion) ou du bot (create_exam_in_notion).
+
+    `create()` -> {"ok": bool, "page_id": ...}. Si la page existe déjà, son
+    résultat est rendu sans appel Notion. `wait` : secondes d'attente si un
+    autre process est en train de la créer.
+    """
+    if not attempt_id:
+        return create()
+    key = str(attempt_id)
+    deadline = time.monotonic() + wait
+    while True:
+        state, prior = COMPLETIONS.begin("notion_exam", key)
+        if state == idempotency.DONE:
+            return {**prior, "deduped": True}
+        if state == idempotency.NEW:
+            break
+        if time.monotonic() >= deadline:
+            return {"ok": False, "error": "notion_exam_in_progress"}
+        time.sleep(0.5)
+
+    try:
+        res = create()
+    except Exception:
+        COMPLETIONS.release("notion_exam", key)
+        raise
+    if res.get("ok"):
+        COMPLETIONS.complete("notion_exam", key, res)
+    else:
+        COMPLETIONS.release("notion_exam", key)
+    return res
+
+
+# rappels (joueur_id, mode, page_id) après création d'une page d'examen par
+# le serveur : le bot y tient à jour son index local des examens Prod
+EXAM_PAGE_LISTENERS = []
+
+
+def on_exam_page_created(listener):
+    EXAM_PAGE_LISTENERS.append(listener)
+    return listener
+
+
 def write_to_notion(payload):
+    """Page Notion de la complétion (une seule par attempt_id)."""
+    res = notion_exam_once(payload.get("attempt_id"),
+                           lambda: _write_to_notion(payload))
+    if res.get("ok") and not res.get("deduped"):
+        f = _exam_fields(payload)
+        for listener in EXAM_PAGE_LISTENERS:
+            try:
+                listener(f["joueur_id"], f["mode"], res.get("page_id"))
+            except Exception:
+                logger.exception("❌ exam page listener failed")
+    return res
+
+
+def _first_value(sources, keys):
+    for src in sources:
+        for k in keys:
+            if src.get(k) not in (None, ""):
+                return src[k]
+    return None
+
+
+def _exam_fields(payload):
+    """Champs de la page d'examen, quelle que soit la forme du payload :
+    corps /ritual/complete (score_raw / score_max, payload WebApp complet
+    dans client_payload) ou payload sendData brut (score / total)."""
+    client = payload.get("client_payload")
+    sources = [payload, client] if isinstance(client, dict) else [payload]
+    feedback = payload.get("feedback")
+
+    def number(keys, default):
+        try:
+            return int(_first_value(sources, keys))
+        except (TypeError, ValueError):
+            return default
+
+    answers = _first_value(sources, ["answers"])
+    comment = _first_value(
+        sources, ["comment_text", "feedback_text", "commentaires"])
+    if comment is None and isinstance(feedback, dict):
+        comment = feedback.get("text")
+    return {
+        "joueur_id": str(
+            _first_value(sources, ["telegram_user_id", "user_id"])
+            or "unknown"),
+        "mode": _first_value(sources, ["exam_mode"]) or "Prod",
+        "score": number(["score_raw", "score"], 0),
+        "total": number(["score_max", "total"], 15),
+        "time_seconds": number(["time_total_seconds", "time_spent_seconds"],
+                               0),
+        "time_formatted": _first_value(sources, ["time_formatted"]),
+        "answers": answers if isinstance(answers, list) else [],
+        "comment": str(comment or "-"),
+        "version": f"{payload.get('mode') or 'rituel_full_v1'}_http",
+    }
+
+
+def _write_to_notion(payload):
     """Write ritual completion data to Notion"""
     if not NOTION_API_KEY or not NOTION_EXAMS_DB_ID:
-        print("⚠️ Notion API key or DB ID not configured")
+        logger.warning("⚠️ Notion API key or DB ID not configured")
         return {"ok": False, "error": "notion_not_configured"}
     
     try:
         # Extract data from payload
-        score = payload.get("score") or 0
-        total = payload.get("total") or 15
-        time_seconds = payload.get("time_total_seconds") or payload.get("time_spent_seconds") or 0
-        time_formatted = payload.get("time_formatted") or format_time_mmss(time_seconds)
-        answers = payload.get("answers") or []
-        comment = payload.get("comment_text") or payload.get("feedback_text") or "-"
-        telegram_user_id = str(payload.get("telegram_user_id") or payload.get("user_id") or "unknown")
+        f = _exam_fields(payload)
+        score = f["score"]
+        total = f["total"]
+        time_seconds = f["time_seconds"]
+        time_formatted = f["time_formatted"] or format_time_mmss(time_seconds)
+        answers = f["answers"]
+        comment = f["comment"]
+        telegram_user_id = f["joueur_id"]
+        exam_mode = f["mode"]
         
         # Compute profile and status
         profil = compute_player_profile(score, total, time_seconds)
-        statut = compute_statut(score, total, "Prod")
+        statut = compute_statut(score, total, exam_mode)
         answers_text = format_answers_pretty(answers)
         
         now = datetime.now(timezone.utc).isoformat()
@@ -149,7 +286,7 @@ def write_to_notion(payload):
                 }]
             },
             NOTION_FIELDS["mode"]: {
-                "select": {"name": "Prod"}
+                "select": {"name": exam_mode}
             },
             NOTION_FIELDS["score"]: {
                 "number": int(score)
@@ -184,7 +321,7 @@ def write_to_notion(payload):
             NOTION_FIELDS["version_bot"]: {
                 "rich_text": [{
                     "type": "text",
-                    "text": {"content": "rituel_full_v1_http"}
+                    "text": {"content": f["version"]}
                 }]
             },
             NOTION_FIELDS["profil_joueur"]: {
@@ -211,29 +348,92 @@ def write_to_notion(payload):
         }
         
         headers = get_notion_headers()
-        resp = requests.post(url, headers=headers, json=notion_payload, timeout=20)
+        resp = upstream.post(url, headers=headers, json=notion_payload, timeout=20)
         
         if resp.status_code < 300:
-            print(f"✅ Notion page created: {resp.json().get('id')}")
-            return {"ok": True, "page_id": resp.json().get("id")}
+            page_id = resp.json().get("id")
+            logger.info("✅ Notion page created: %s", page_id)
+            # le bot complète les propriétés Telegram s'il arrive après
+            return {"ok": True, "page_id": page_id, "source": "http"}
         else:
-            print(f"❌ Notion error {resp.status_code}: {resp.text[:500]}")
+            logger.warning("❌ Notion error %s: %s", resp.status_code,
+                           resp.text[:500])
             return {"ok": False, "error": resp.text[:500]}
             
     except Exception as e:
-        print(f"❌ Exception writing to Notion: {e}")
+        logger.exception("❌ Exception writing to Notion: %s", e)
         return {"ok": False, "error": str(e)}
 
 
 # -----------------------------------------------------
 # CORS minimal (front local)
 # -----------------------------------------------------
+HTTP_REQUESTS = metrics.Counter(
+    "velvet_http_requests_total",
+    "Flask requests by route, method and status")
+HTTP_LATENCY = metrics.Histogram(
+    "velvet_http_request_duration_seconds",
+    "Flask request latency by route and method")
+
+
+@app.before_request
+def _metrics_start():
+    metrics.ensure_flusher()
+    g.metrics_t0 = time.perf_counter()
+
+
+@app.after_request
+def _metrics_observe(response):
+    t0 = g.pop("metrics_t0", None)
+    if t0 is not None:
+        # la règle (/ritual/receipt/<receipt>), pas le chemin : cardinalité bornée
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        HTTP_LATENCY.observe(time.perf_counter() - t0, route=route,
+                             method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method,
+                          status=response.status_code)
+    return response
+
+
+@app.before_request
+def _log_setup():
+    # listener du QueueHandler relancé dans chaque worker après fork
+    velvet_log.setup()
+
+
+@app.before_request
+def _trace_start():
+    g.trace_token = tracing.start()
+
+
+@app.after_request
+def _trace_headers(response):
+    trace = tracing.current()
+    if trace is not None and trace.spans:
+        response.headers["Server-Timing"] = tracing.server_timing(trace)
+        response.headers["Timing-Allow-Origin"] = "*"
+        tracing.log_line(trace,
+                         route=request.url_rule.rule if request.url_rule else None,
+                         method=request.method,
+                         status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def _trace_finish(_exc):
+    token = g.pop("trace_token", None)
+    if token is not None:
+        tracing.finish(token)
+
+
 @app.after_request
 def add_cors_headers(response):
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
     response.headers[
         "Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Telegram-InitData"
+    response.headers["Access-Control-Expose-Headers"] = (
+        "Server-Timing, X-Questions-Stale, X-Questions-Age")
     return response
 
 
@@ -249,10 +449,42 @@ def root():
     }), 200
 
 
+# -----------------------------------------------------
+# WebApp — assets à empreinte (webapp_assets.py)
+# -----------------------------------------------------
+def _serve_asset(asset, cache_control):
+    encoding, data = asset.variant(request.accept_encodings)
+    resp = app.response_class(data, mimetype=asset.mimetype)
+    resp.set_etag(f"{asset.etag}-{encoding}" if encoding else asset.etag)
+    resp.headers["Cache-Control"] = cache_control
+    resp.headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+        return resp.make_conditional(request)
+    # Range (iOS <audio>) uniquement sur la variante brute
+    return resp.make_conditional(request,
+                                 accept_ranges=True,
+                                 complete_length=len(data))
+
+
+def webapp_version():
+    """Version de contenu de la WebApp (change seulement si un asset change)."""
+    return webapp_assets.manifest().version
+
+
 @app.get("/webapp/")
 def webapp_index():
     """Serve the Telegram WebApp"""
-    return send_from_directory('webapp', 'index.html')
+    # toujours revalidé (304 si inchangé), il pointe vers les assets immuables
+    return _serve_asset(webapp_assets.manifest().index, "no-cache")
+
+
+@app.get("/webapp/assets/<name>")
+def webapp_asset(name):
+    asset = webapp_assets.manifest().get(name)
+    if asset is None:
+        return jsonify({"error": "not_found"}), 404
+    return _serve_asset(asset, "public, max-age=31536000, immutable")
 
 
 @app.get("/version")
@@ -260,47 +492,185 @@ def version():
     return jsonify({"version": APP_VERSION}), 200
 
 
-@app.get("/health")
-def health():
-    air_ok = False
-    air_error = None
+# -----------------------------------------------------
+# /health : état upstream sondé en fond (health_probe.py), aucun appel réseau
+# /ready  : caches chauds (banque de questions, assets WebApp) + sondes
+# -----------------------------------------------------
+HEALTH_PROBE_SECONDS = float(os.getenv("HEALTH_PROBE_SECONDS", "30"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))
 
+
+# les sondes ne prennent pas de créneau aux requêtes : bucket vide -> échec
+@upstream.rate_policy(upstream.SHED)
+def _probe_airtable():
     api_key = os.getenv("AIRTABLE_API_KEY", "")
     base_id = os.getenv("AIRTABLE_BASE_ID", "")
     table_id = os.getenv("AIRTABLE_TABLE_ID", "")
+    if not (api_key and base_id and table_id):
+        return "missing_env"
+    r = upstream.get(
+        f"{upstream.AIRTABLE_API_URL}/{base_id}/{table_id}",
+        headers={"Authorization": f"Bearer {api_key}"},
+        params={"maxRecords": 1, "pageSize": 1},
+        timeout=HEALTH_PROBE_TIMEOUT,
+    )
+    if r.status_code != 200:
+        return f"{r.status_code}: {r.text[:200]}"
+    return None
 
-    if api_key and base_id and table_id:
-        try:
-            url = f"https://api.airtable.com/v0/{base_id}/{table_id}?maxRecords=1"
-            r = requests.get(
-                url,
-                headers={"Authorization": f"Bearer {api_key}"},
-                timeout=10,
-            )
-            air_ok = (r.status_code == 200)
-            if not air_ok:
-                air_error = f"{r.status_code}: {r.text[:200]}"
-        except Exception as e:
-            air_error = str(e)
-    else:
-        air_error = "missing_env"
 
+@upstream.rate_policy(upstream.SHED)
+def _probe_notion():
+    headers = get_notion_headers()
+    if not headers or not NOTION_EXAMS_DB_ID:
+        return "missing_env"
+    r = upstream.get(
+        f"{NOTION_BASE_URL}/databases/{NOTION_EXAMS_DB_ID}",
+        headers=headers,
+        timeout=HEALTH_PROBE_TIMEOUT,
+    )
+    if r.status_code != 200:
+        return f"{r.status_code}: {r.text[:200]}"
+    return None
+
+
+def _warm_question_bank():
+    QUESTION_BANK.ensure_started()
+
+
+HEALTH_PROBER = UpstreamProber(
+    {"airtable": _probe_airtable, "notion": _probe_notion},
+    interval=HEALTH_PROBE_SECONDS,
+    warmups=(_warm_question_bank, webapp_assets.manifest),
+)
+
+
+@app.before_request
+def _start_health_prober():
+    HEALTH_PROBER.ensure_started()
+
+
+@app.get("/health")
+@upstream.call_budget(0)  # état sondé en fond
+def health():
+    probes = HEALTH_PROBER.status()
     return jsonify({
         "status": "ok",
         "version": APP_VERSION,
         "utc": datetime.now(timezone.utc).isoformat(),
         "method": request.method,
-        "airtable": {
-            "ok": air_ok,
-            "error": air_error,
-        },
+        "airtable": probes["airtable"],
+        "notion": probes["notion"],
+        "circuits": upstream.circuit_status(),
     }), 200
 
 
+@app.get("/ready")
+@upstream.call_budget(0)
+def ready():
+    probes = HEALTH_PROBER.status()
+    checks = {
+        "question_bank": len(QUESTION_BANK) > 0,
+        "webapp_assets": webapp_assets.is_built(),
+        "upstream_probed": HEALTH_PROBER.rounds > 0,
+        # la banque sert depuis le cache : Airtable KO ne bloque pas le trafic
+        "airtable": probes["airtable"]["ok"] or len(QUESTION_BANK) > 0,
+    }
+    is_ready = all(checks.values())
+    return jsonify({
+        "ready": is_ready,
+        "version": APP_VERSION,
+        "pid": os.getpid(),
+        "checks": checks,
+        "question_bank": QUESTION_BANK.status(),
+    }), 200 if is_ready else 503
+
+
+# -----------------------------------------------------
+# Réponses JSON pré-encodées + compression négociée (Accept-Encoding)
+# -----------------------------------------------------
+RESPONSE_COMPRESS_LEVEL = int(os.getenv("RESPONSE_COMPRESS_LEVEL", "5"))
+RESPONSE_COMPRESS_MIN_BYTES = 512
+
+
+def _json_bytes_response(body, status=200):
+    """Response à partir d'un corps JSON déjà encodé, gzip/deflate si le
+    client l'accepte."""
+    resp = app.response_class(body, status=status, mimetype="application/json")
+    resp.headers["Vary"] = "Accept-Encoding"
+    if len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return resp
+
+    encoding = request.accept_encodings.best_match(["gzip", "deflate"])
+    with tracing.span("compress"):
+        if encoding == "gzip":
+            resp.set_data(
+                gzip.compress(body, compresslevel=RESPONSE_COMPRESS_LEVEL))
+        elif encoding == "deflate":
+            resp.set_data(zlib.compress(body, RESPONSE_COMPRESS_LEVEL))
+        else:
+            return resp
+    resp.headers["Content-Encoding"] = encoding
+    return resp
+
+
 # -----------------------------------------------------
-# Questions — tirage aléatoire + mapping propre
+# Questions — banque en mémoire + tirage aléatoire
 # -----------------------------------------------------
+@upstream.rate_policy(upstream.QUEUE, max_wait=10)
+def _fetch_questions_page(offset=None):
+    """Une page (100 records) de la table questions pour la QuestionBank."""
+    api_key = os.getenv("AIRTABLE_API_KEY")
+    base_id = os.getenv("AIRTABLE_BASE_ID")
+    table_id = os.getenv("AIRTABLE_TABLE_ID")
+
+    if not (api_key and base_id and table_id):
+        raise QuestionBankError("missing_env")
+
+    params = {"pageSize": 100}
+    if offset:
+        params["offset"] = offset
+
+    try:
+        rr = upstream.get(f"{upstream.AIRTABLE_API_URL}/{base_id}/{table_id}",
+                          headers={"Authorization": f"Bearer {api_key}"},
+                          params=params,
+                          timeout=10)
+    except upstream.CircuitOpen as e:
+        raise QuestionBankError("airtable_unavailable",
+                                status_code=503,
+                                detail=str(e))
+    if rr.status_code != 200:
+        raise QuestionBankError("airtable_http_error",
+                                status_code=rr.status_code,
+                                detail=rr.text[:500])
+    data = rr.json()
+    return data.get("records", []), data.get("offset")
+
+
+# snapshot livré avec le code (`python3 server.py bake-questions` au build) :
+# sur Vercel /tmp est vide à chaque cold start, QUESTIONS_SNAPSHOT_PATH n'y
+# aide qu'entre deux requêtes d'une même instance
+QUESTIONS_SEED_PATH = os.getenv(
+    "QUESTIONS_SEED_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                 "questions.snap"))
+
+QUESTION_BANK = QuestionBank(
+    _fetch_questions_page,
+    refresh_seconds=int(os.getenv("QUESTIONS_REFRESH_SECONDS", "300")),
+    retry_seconds=int(os.getenv("QUESTIONS_RETRY_SECONDS", "30")),
+    snapshot_path=os.getenv(
+        "QUESTIONS_SNAPSHOT_PATH",
+        os.path.join(tempfile.gettempdir(), "velvet_questions.snap")),
+    seed_path=QUESTIONS_SEED_PATH,
+    seen=SeenQuestions(
+        max_players=int(os.getenv("SEEN_MAX_PLAYERS", "100000")),
+        ttl=float(os.getenv("SEEN_TTL_SECONDS", str(90 * 86400)))))
+
+
 @app.route("/questions/random", methods=["GET", "OPTIONS"])
+@upstream.call_budget(0)  # banque chaude ; seul le cold start lit Airtable
 def questions_random():
     # Preflight CORS (au cas où)
     if request.method == "OPTIONS":
@@ -313,70 +683,56 @@ def questions_random():
 
     count = max(1, min(50, count))
 
-    api_key = os.getenv("AIRTABLE_API_KEY")
-    base_id = os.getenv("AIRTABLE_BASE_ID")
-    table_id = os.getenv("AIRTABLE_TABLE_ID")
-
-    if not (api_key and base_id and table_id):
-        return jsonify({"error": "missing_env"}), 500
-
-    headers = {"Authorization": f"Bearer {api_key}"}
-    base_url = f"https://api.airtable.com/v0/{base_id}/{table_id}"
+    # Quotas optionnels (quiz_draw.py) : quota=niveau=N5:3, min_per_domain=1
+    try:
+        quotas = parse_quota_specs(request.args.getlist("quota"))
+        min_per_domain = max(0, int(request.args.get("min_per_domain", "0")))
+        min_per_level = max(0, int(request.args.get("min_per_level", "0")))
+    except ValueError as e:
+        return jsonify({"error": "invalid_quota", "detail": str(e)}), 400
 
-    threshold = random.randint(0, 999_999)
+    try:
+        with tracing.span("bank_ready"):
+            QUESTION_BANK.ensure_started()
+    except QuestionBankError as e:
+        if e.error == "missing_env":
+            return jsonify({"error": "missing_env"}), 500
+        return _bank_error_response(e, {
+            "error": e.error,
+            "status_code": e.status_code,
+            "detail": e.detail,
+        })
 
-    def fetch_chunk(formula: str):
-        params = {
-            "maxRecords": count,
-            "filterByFormula": formula,
-            "sort[0][field]": "Rand",
-            "sort[0][direction]": "asc",
+    # Sans répétition par joueur : questions non vues servies en priorité
+    player_id = request.args.get("telegram_user_id") or request.args.get(
+        "user_id") or None
+    with tracing.span("draw"):
+        body = QUESTION_BANK.draw_json(count,
+                                       player_id=player_id,
+                                       quotas=quotas,
+                                       min_per_domain=min_per_domain,
+                                       min_per_level=min_per_level)
+    return _mark_stale(_json_bytes_response(body, 200))
+
+
+def _bank_error_response(e, body):
+    """Banque vide et Airtable en échec : 503 + Retry-After si le circuit
+    est ouvert (inutile de réessayer avant), 502 sinon."""
+    if e.error == "airtable_unavailable":
+        return jsonify(body), 503, {
+            "Retry-After": str(int(upstream.breaker("airtable").open_seconds))
         }
-        rr = requests.get(base_url, headers=headers, params=params, timeout=10)
-        if rr.status_code != 200:
-            return rr, []
-        return rr, rr.json().get("records", [])
-
-    r1, recs = fetch_chunk(f"{{Rand}}>={threshold}")
+    return jsonify(body), 502
 
-    if r1.status_code == 200 and len(recs) < count:
-        r2, recs2 = fetch_chunk(f"{{Rand}}<{threshold}")
-        recs = recs + recs2
 
-    if r1.status_code != 200:
-        return jsonify({
-            "error": "airtable_http_error",
-            "status_code": r1.status_code,
-            "detail": r1.text[:500],
-        }), 502
-
-    records = recs[:count]
-
-    mapped = []
-    for rec in records:
-        f = rec.get("fields", {})
-
-        raw_opts = f.get("Options (JSON)", "[]")
-        try:
-            opts = json.loads(raw_opts) if isinstance(
-                raw_opts, str) else (raw_opts or [])
-        except Exception:
-            opts = []
-
-        mapped.append({
-            "id": f.get("ID_question"),
-            "question": f.get("Question"),
-            "options": opts,
-            "correct_index": f.get("Correct_index"),
-            "explanation": f.get("Explication"),
-            "domaine": f.get("Domaine"),
-            "niveau": f.get("Niveau"),
-        })
-
-    return jsonify({
-        "count": count,
-        "questions": mapped,
-    }), 200
+def _mark_stale(resp):
+    """Tirage servi depuis une banque pas à jour (Airtable KO / snapshot pas
+    encore réconcilié) : signalé au front, le rituel continue."""
+    age = QUESTION_BANK.stale_age()
+    if age is not None:
+        resp.headers["X-Questions-Stale"] = "1"
+        resp.headers["X-Questions-Age"] = str(int(age))
+    return resp
 
 
 # -----------------------------------------------------
@@ -392,6 +748,26 @@ def server_error(_):
     return jsonify({"error": "internal_server_error"}), 500
 
 
+@app.errorhandler(upstream.RateLimited)
+def upstream_rate_limited(e):
+    # pas de créneau Airtable / Notion dans l'attente autorisée
+    return jsonify({
+        "ok": False,
+        "error": "upstream_rate_limited",
+        "bucket": e.bucket
+    }), 503, {"Retry-After": str(int(e.retry_after) + 1)}
+
+
+@app.errorhandler(upstream.CircuitOpen)
+def upstream_circuit_open(e):
+    # upstream coupé par le disjoncteur : échec immédiat, sans timeout
+    return jsonify({
+        "ok": False,
+        "error": "upstream_unavailable",
+        "service": e.name
+    }), 503, {"Retry-After": str(int(e.retry_after) + 1)}
+
+
 # -----------------------------------------------------
 # Entrypoint local
 # -----------------------------------------------------
@@ -454,7 +830,7 @@ def _airtable_base_id(table_name=""):
 
 def _airtable_url(table):
     base = _airtable_base_id(table)
-    return f"https://api.airtable.com/v0/{base}/{table}"
+    return f"{upstream.AIRTABLE_API_URL}/{base}/{table}"
 
 
 def airtable_create(table, fields):
@@ -462,7 +838,7 @@ def airtable_create(table, fields):
     base = _airtable_base_id(table)
     if not headers or not base:
         return {"ok": False, "error": "missing_airtable_env"}
-    r = requests.post(_airtable_url(table),
+    r = upstream.post(_airtable_url(table),
                       headers=headers,
                       json={"fields": fields},
                       timeout=20)
@@ -473,12 +849,70 @@ def airtable_create(table, fields):
     return {"ok": r.status_code < 300, "status": r.status_code, "data": data}
 
 
+AIRTABLE_BATCH_SIZE = 10  # max records par requête de création Airtable
+
+
+def airtable_create_batch(table, rows):
+    """Crée plusieurs records (liste de `fields`) par requêtes de 10.
+
+    Renvoie un résultat par record, dans l'ordre de `rows`, pour que le
+    compte des insertions reste exact même si un chunk échoue.
+    """
+    headers = _airtable_headers()
+    base = _airtable_base_id(table)
+    if not headers or not base:
+        return {
+            "ok": False,
+            "error": "missing_airtable_env",
+            "created": 0,
+            "results": []
+        }
+
+    results = []
+    calls = 0
+    for i in range(0, len(rows), AIRTABLE_BATCH_SIZE):
+        chunk = rows[i:i + AIRTABLE_BATCH_SIZE]
+        calls += 1
+        try:
+            r = upstream.post(_airtable_url(table),
+                              headers=headers,
+                              json={"records": [{"fields": f} for f in chunk]},
+                              timeout=20)
+        except Exception as e:
+            results.extend({"ok": False, "error": str(e)} for _ in chunk)
+            continue
+        try:
+            data = r.json()
+        except Exception:
+            data = {"raw": r.text}
+
+        if r.status_code < 300:
+            recs = data.get("records", []) if isinstance(data, dict) else []
+            for j in range(len(chunk)):
+                rec_id = (recs[j] or {}).get("id") if j < len(recs) else None
+                results.append({"ok": bool(rec_id), "id": rec_id})
+        else:
+            results.extend({
+                "ok": False,
+                "status": r.status_code,
+                "error": data
+            } for _ in chunk)
+
+    created = sum(1 for res in results if res["ok"])
+    return {
+        "ok": created == len(rows),
+        "created": created,
+        "calls": calls,
+        "results": results
+    }
+
+
 def airtable_find_one(table, formula):
     headers = _airtable_headers()
     base = _airtable_base_id(table)
     if not headers or not base:
         return {"ok": False, "error": "missing_airtable_env"}
-    r = requests.get(_airtable_url(table),
+    r = upstream.get(_airtable_url(table),
                      headers=headers,
                      params={
                          "filterByFormula": formula,
@@ -500,7 +934,7 @@ def airtable_update(table, record_id, fields):
     base = _airtable_base_id(table)
     if not headers or not base:
         return {"ok": False, "error": "missing_airtable_env"}
-    r = requests.patch(_airtable_url(table) + f"/{record_id}",
+    r = upstream.patch(_airtable_url(table) + f"/{record_id}",
                        headers=headers,
                        json={"fields": fields},
                        timeout=20)
@@ -508,11 +942,23 @@ def airtable_update(table, record_id, fields):
     return {"ok": r.status_code < 300, "status": r.status_code, "data": data}
 
 
+# telegram_user_id -> record id players (rempli sur "found" et "created")
+PLAYER_ID_CACHE = LRUTTLCache(
+    maxsize=int(os.getenv("PLAYER_CACHE_MAXSIZE", "50000")),
+    ttl=float(os.getenv("PLAYER_CACHE_TTL_SECONDS", "21600")))
+
+
 def upsert_player_by_telegram_user_id(players_table, telegram_user_id):
     # players.telegram_user_id is the upsert key (locked mapping)
+    cache_key = (players_table, str(telegram_user_id))
+    record_id = PLAYER_ID_CACHE.get(cache_key)
+    if record_id:
+        return {"ok": True, "action": "cached", "record_id": record_id}
+
     formula = f"{{telegram_user_id}}='{telegram_user_id}'"
     found = airtable_find_one(players_table, formula)
     if found.get("ok") and found.get("record"):
+        PLAYER_ID_CACHE.set(cache_key, found["record"]["id"])
         return {
             "ok": True,
             "action": "found",
@@ -522,6 +968,7 @@ def upsert_player_by_telegram_user_id(players_table, telegram_user_id):
     created = airtable_create(players_table,
                               {"telegram_user_id": str(telegram_user_id)})
     if created.get("ok"):
+        PLAYER_ID_CACHE.set(cache_key, created["data"]["id"])
         return {
             "ok": True,
             "action": "created",
@@ -530,6 +977,100 @@ def upsert_player_by_telegram_user_id(players_table, telegram_user_id):
     return {"ok": False, "error": created}
 
 
+DEBUG_EVENTS_TOKEN = os.getenv("DEBUG_EVENTS_TOKEN", "")
+
+
+def _debug_gate():
+    """Routes de diagnostic (/__debug/events, /__upstream, /__caches) :
+    404 sans DEBUG_EVENTS_TOKEN, 403 si l'en-tête X-Debug-Token ne
+    correspond pas, None si l'accès est autorisé."""
+    if not DEBUG_EVENTS_TOKEN:
+        return jsonify({"error": "not_found"}), 404
+    token = request.headers.get("X-Debug-Token") or request.args.get(
+        "token", "")
+    if not hmac.compare_digest(token.encode(), DEBUG_EVENTS_TOKEN.encode()):
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    return None
+
+
+@app.get("/__upstream")
+def __upstream():
+    denied = _debug_gate()
+    if denied:
+        return denied
+    return jsonify({
+        "ok": True,
+        "version": APP_VERSION,
+        "pid": os.getpid(),
+        "upstream": upstream.stats(),
+    })
+
+
+@metrics.register_collector
+def _collect_server_metrics():
+    # ratio de hit : rate(hits) / (rate(hits) + rate(misses)) côté Prometheus
+    for name, st in (("players", PLAYER_ID_CACHE.stats()),
+                     ("seen_questions", QUESTION_BANK.seen.stats())):
+        yield ("velvet_cache_hits_total", "counter", "Cache hits",
+               {"cache": name}, st["hits"])
+        yield ("velvet_cache_misses_total", "counter", "Cache misses",
+               {"cache": name}, st["misses"])
+        yield ("velvet_cache_entries", "gauge", "Cache entries (all workers)",
+               {"cache": name}, st["size"])
+    # banque et journal write-behind partagés : max entre workers, pas somme
+    yield ("velvet_question_bank_size", "gauge",
+           "Questions loaded in the in-memory bank", {}, len(QUESTION_BANK),
+           "max")
+    for status, n in WRITE_BEHIND.depth().items():
+        yield ("velvet_write_behind_jobs", "gauge",
+               "Write-behind journal jobs by status", {"status": status}, n,
+               "max")
+    for status, n in COMPLETIONS.stats().items():
+        yield ("velvet_idempotency_keys", "gauge",
+               "Completion dedupe keys by status", {"status": status}, n,
+               "max")
+
+
+@app.get("/metrics")
+@upstream.call_budget(0)
+def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
+@app.get("/__debug/events")
+def __debug_events():
+    # ring buffer des traces de debug du worker (velvet_log.py), admins only
+    denied = _debug_gate()
+    if denied:
+        return denied
+    try:
+        limit = max(1, min(500, int(request.args.get("limit", "100"))))
+    except ValueError:
+        limit = 100
+    return jsonify({
+        "ok": True,
+        "pid": os.getpid(),
+        "events": velvet_log.recent_events(limit,
+                                           request.args.get("level", "DEBUG")),
+    })
+
+
+@app.get("/__caches")
+def __caches():
+    denied = _debug_gate()
+    if denied:
+        return denied
+    return jsonify({
+        "ok": True,
+        "version": APP_VERSION,
+        "pid": os.getpid(),
+        "caches": {
+            "players": PLAYER_ID_CACHE.stats(),
+            "seen_questions": QUESTION_BANK.seen.stats(),
+        },
+    })
+
+
 @app.get("/__routes")
 def __routes():
     return jsonify({
@@ -539,93 +1080,95 @@ def __routes():
     })
 
 
+def start_attempt(payload, telegram_user_id):
+    """Upsert du joueur + création de l'attempt. Renvoie `(body, status)`."""
+    players_table = os.getenv("AIRTABLE_PLAYERS_TABLE") or "players"
+    attempts_table = os.getenv("AIRTABLE_ATTEMPTS_TABLE") or "rituel_attempts"
+    velvet_log.debug_sampled(logger, "🔵 ritual start tables=%s/%s payload=%s",
+                             players_table, attempts_table, payload)
+
+    with tracing.span("player_upsert"):
+        p = upsert_player_by_telegram_user_id(players_table,
+                                              str(telegram_user_id))
+    if not p.get("ok"):
+        return {
+            "ok": False,
+            "error": "player_upsert_failed",
+            "details": p
+        }, 500
+
+    # Translate mode for Airtable (app.js sends "rituel_full_v1" but Airtable expects "PROD" or "TEST")
+    raw_mode = payload.get("mode") or payload.get("env") or "PROD"
+    if raw_mode in ("rituel_full_v1", "ritual_full_v1", "rituel_v1", "ritual_v1"):
+        airtable_mode = "PROD"
+    elif raw_mode == "TEST":
+        airtable_mode = "TEST"
+    else:
+        airtable_mode = "PROD"  # fallback
+
+    # Create attempt (write only whitelisted raw fields; never computed/system fields)
+    fields = {
+        "player": [p["record_id"]],
+        "started_at":
+        payload.get("started_at") or datetime.now(timezone.utc).isoformat(),
+        "mode": airtable_mode,
+        "status":
+        payload.get("status") or "STARTED",
+        "status_technique": "INIT",  # Champ obligatoire pour Airtable
+    }
+    # optional text mirror if you have one; safe to ignore if field absent
+    if payload.get("Players"):
+        fields["Players"] = payload.get("Players")
+
+    with tracing.span("attempt_create"):
+        created = airtable_create(attempts_table, fields)
+
+    velvet_log.debug_sampled(
+        logger, "🔵 attempt create player=%s mode=%s→%s fields=%s response=%s",
+        p["record_id"], raw_mode, airtable_mode, fields, created)
+
+    if not created.get("ok"):
+        logger.error("🔴 Airtable attempt create failed: status=%s data=%s fields=%s",
+                     created.get("status"), created.get("data"), fields)
+        return {
+            "ok": False,
+            "error": "attempt_create_failed",
+            "details": created,
+            "fields_sent": fields,
+            "airtable_response": created.get("data")
+        }, 500
+
+    return {
+        "ok": True,
+        "version": APP_VERSION,
+        "attempt_id": created["data"]["id"],
+        "player_record_id": p["record_id"],
+    }, 200
+
+
 @app.route("/ritual/start", methods=["POST", "OPTIONS"])
+@upstream.call_budget(3)  # joueur find + create (0 si en cache) + attempt
 def ritual_start():
     if request.method == "OPTIONS":
         return ("", 204)
     
     try:
-        print("🔵 DEBUG /ritual/start appelé")
-
         payload = _json()
+        if not isinstance(payload, dict):
+            return jsonify({"ok": False, "error": "invalid_payload"}), 400
         telegram_user_id = payload.get("telegram_user_id") or payload.get(
             "user_id") or payload.get("tg_user_id")
-        print(f"🔵 telegram_user_id = {telegram_user_id}")
 
         if not telegram_user_id:
             return jsonify({"ok": False, "error": "missing_telegram_user_id"}), 400
 
-        players_table = os.getenv("AIRTABLE_PLAYERS_TABLE") or "players"
-        attempts_table = os.getenv("AIRTABLE_ATTEMPTS_TABLE") or "rituel_attempts"
-        print(
-            f"🔵 players_table = {players_table}, attempts_table = {attempts_table}", flush=True
-        )
-        print(f"🔵 payload complet = {payload}", flush=True)
-
-        p = upsert_player_by_telegram_user_id(players_table, str(telegram_user_id))
-        if not p.get("ok"):
-            return jsonify({
-                "ok": False,
-                "error": "player_upsert_failed",
-                "details": p
-            }), 500
+        body, status = start_attempt(payload, telegram_user_id)
+        return jsonify(body), status
 
-        # Translate mode for Airtable (app.js sends "rituel_full_v1" but Airtable expects "PROD" or "TEST")
-        raw_mode = payload.get("mode") or payload.get("env") or "PROD"
-        if raw_mode in ("rituel_full_v1", "ritual_full_v1", "rituel_v1", "ritual_v1"):
-            airtable_mode = "PROD"
-        elif raw_mode == "TEST":
-            airtable_mode = "TEST"
-        else:
-            airtable_mode = "PROD"  # fallback
-        
-        print(f"🔵 Mode translation: {raw_mode} → {airtable_mode}", flush=True)
-
-        # Create attempt (write only whitelisted raw fields; never computed/system fields)
-        fields = {
-            "player": [p["record_id"]],
-            "started_at":
-            payload.get("started_at") or datetime.now(timezone.utc).isoformat(),
-            "mode": airtable_mode,
-            "status":
-            payload.get("status") or "STARTED",
-            "status_technique": "INIT",  # Champ obligatoire pour Airtable
-        }
-        # optional text mirror if you have one; safe to ignore if field absent
-        if payload.get("Players"):
-            fields["Players"] = payload.get("Players")
-
-        print(f"🔵 DEBUG - Player record_id créé: {p['record_id']}")
-        print(f"🔵 DEBUG - Tentative création attempt avec fields: {json.dumps(fields, indent=2)}")
-        
-        created = airtable_create(attempts_table, fields)
-        
-        print(f"🔵 DEBUG - Réponse airtable_create: {json.dumps(created, indent=2)}")
-        
-        if not created.get("ok"):
-            print(f"🔴 ERREUR AIRTABLE COMPLÈTE:")
-            print(f"🔴 Status Code: {created.get('status')}")
-            print(f"🔴 Data: {json.dumps(created.get('data'), indent=2)}")
-            print(f"🔴 Fields envoyés: {json.dumps(fields, indent=2)}")
-            return jsonify({
-                "ok": False,
-                "error": "attempt_create_failed",
-                "details": created,
-                "fields_sent": fields,
-                "airtable_response": created.get("data")
-            }), 500
-
-        return jsonify({
-            "ok": True,
-            "version": APP_VERSION,
-            "attempt_id": created["data"]["id"],
-            "player_record_id": p["record_id"],
-        })
-    
+    except (upstream.RateLimited, upstream.CircuitOpen):
+        raise  # 503 + Retry-After (errorhandlers), pas une 500
     except Exception as e:
-        print(f"🔴 EXCEPTION DANS /ritual/start: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("🔴 EXCEPTION DANS /ritual/start: %s", e)
         return jsonify({
             "ok": False,
             "error": "internal_server_error",
@@ -633,129 +1176,282 @@ def ritual_start():
         }), 500
 
 
-@app.route("/ritual/complete", methods=["POST", "OPTIONS"])
-def ritual_complete():
+@app.route("/ritual/bootstrap", methods=["POST", "OPTIONS"])
+@upstream.call_budget(3)  # comme /ritual/start, questions depuis la banque
+def ritual_bootstrap():
+    """Un seul aller-retour pour la WebApp : joueur + attempt + questions.
+
+    L'attempt (Airtable) et le tirage tournent en parallèle. Si l'attempt
+    échoue, les questions sont quand même servies (`attempt_id` null) : la
+    WebApp retentera /ritual/start à la clôture.
+    """
     if request.method == "OPTIONS":
         return ("", 204)
 
     payload = _json()
+    if not isinstance(payload, dict):
+        return jsonify({"ok": False, "error": "invalid_payload"}), 400
+    telegram_user_id = payload.get("telegram_user_id") or payload.get(
+        "user_id") or payload.get("tg_user_id")
+
+    try:
+        count = max(1, min(50, int(payload.get("count") or 15)))
+    except (TypeError, ValueError):
+        count = 15
+    try:
+        quota = payload.get("quota") or []
+        if isinstance(quota, str):
+            quota = [quota]
+        if not isinstance(quota, list) or not all(
+                isinstance(q, str) for q in quota):
+            raise QuotaError("quota must be a string or a list of strings")
+        quotas = parse_quota_specs(quota)
+        min_per_domain = max(0, int(payload.get("min_per_domain") or 0))
+        min_per_level = max(0, int(payload.get("min_per_level") or 0))
+    except (TypeError, ValueError) as e:
+        return jsonify({"ok": False, "error": "invalid_quota", "detail": str(e)}), 400
+
+    def questions_stage():
+        try:
+            QUESTION_BANK.ensure_started()
+        except (QuestionBankError, upstream.RateLimited,
+                upstream.CircuitOpen) as e:
+            return {"ok": False, "error": e}
+        return {
+            "ok": True,
+            "body": QUESTION_BANK.draw_json(
+                count,
+                player_id=str(telegram_user_id) if telegram_user_id else None,
+                quotas=quotas,
+                min_per_domain=min_per_domain,
+                min_per_level=min_per_level)
+        }
+
+    def attempt_stage():
+        try:
+            return start_attempt(payload, telegram_user_id)
+        except upstream.RateLimited:
+            # questions servies quand même ; l'attempt sera retenté
+            return {"ok": False, "error": "upstream_rate_limited"}, 503
+        except upstream.CircuitOpen:
+            return {"ok": False, "error": "upstream_unavailable"}, 503
+
+    stages = {"questions": questions_stage}
+    if telegram_user_id:
+        stages["attempt"] = attempt_stage
+    results = run_stages(stages, max_in_flight=2)
+
+    quiz = results.get("questions") or {"ok": False, "error": None}
+    if not quiz["ok"]:
+        e = quiz["error"]
+        if e is None:
+            return jsonify({"ok": False, "error": "internal_server_error"}), 500
+        if isinstance(e, (upstream.RateLimited, upstream.CircuitOpen)):
+            raise e  # levée dans le pool du fan-out : 503 + Retry-After ici
+        if e.error == "missing_env":
+            return jsonify({"ok": False, "error": "missing_env"}), 500
+        return _bank_error_response(e, {
+            "ok": False,
+            "error": e.error,
+            "status_code": e.status_code,
+            "detail": e.detail,
+        })
+
+    attempt_body, _ = results.get("attempt") or ({
+        "ok": False,
+        "error": ("missing_telegram_user_id"
+                  if not telegram_user_id else "internal_server_error")
+    }, None)
+    meta = {
+        "ok": True,
+        "version": APP_VERSION,
+        "attempt_id": attempt_body.get("attempt_id"),
+        "player_record_id": attempt_body.get("player_record_id"),
+    }
+    if not attempt_body.get("ok"):
+        meta["attempt_error"] = attempt_body.get("error")
+
+    # {meta..., "count": N, "questions": [fragments pré-encodés]}
+    body = json.dumps(meta, ensure_ascii=False).encode("utf-8")[:-1] + b"," + \
+        quiz["body"][1:]
+    return _mark_stale(_json_bytes_response(body, 200))
+
+
+# ================================================================
+# Ritual completion — étapes (sync ou write-behind)
+# ================================================================
+def _ritual_ids(payload):
     telegram_user_id = payload.get("telegram_user_id") or payload.get(
         "user_id") or payload.get("tg_user_id")
     attempt_record_id = payload.get("attempt_record_id") or payload.get(
         "exam_record_id") or payload.get("attempt_id")
+    return telegram_user_id, attempt_record_id
 
-    if not telegram_user_id:
-        return jsonify({"ok": False, "error": "missing_telegram_user_id"}), 400
 
-    players_table = os.getenv("AIRTABLE_PLAYERS_TABLE", "players")
-    attempts_table = os.getenv("AIRTABLE_ATTEMPTS_TABLE", "rituel_attempts")
-    payloads_table = os.getenv("AIRTABLE_PAYLOADS_TABLE",
-                               "rituel_webapp_payloads")
-    answers_table = os.getenv("AIRTABLE_ANSWERS_TABLE", "rituel_answers")
-    feedback_table = os.getenv("AIRTABLE_FEEDBACK_TABLE", "rituel_feedback")
+def _ritual_tables():
+    return {
+        "players": os.getenv("AIRTABLE_PLAYERS_TABLE", "players"),
+        "attempts": os.getenv("AIRTABLE_ATTEMPTS_TABLE", "rituel_attempts"),
+        "payloads": os.getenv("AIRTABLE_PAYLOADS_TABLE",
+                              "rituel_webapp_payloads"),
+        "answers": os.getenv("AIRTABLE_ANSWERS_TABLE", "rituel_answers"),
+        "feedback": os.getenv("AIRTABLE_FEEDBACK_TABLE", "rituel_feedback"),
+    }
 
-    p = upsert_player_by_telegram_user_id(players_table, str(telegram_user_id))
-    if not p.get("ok"):
-        return jsonify({
-            "ok": False,
-            "error": "player_upsert_failed",
-            "details": p
-        }), 500
 
-    # 1) Log raw payload (always)
-    raw_fields = {
+def _payload_log_fields(payload, telegram_user_id):
+    return {
         "telegram_user_id": str(telegram_user_id),
         "payload": json.dumps(payload, ensure_ascii=False)[:98000],
         "utc": datetime.now(timezone.utc).isoformat(),
     }
-    raw_res = airtable_create(payloads_table, raw_fields)
 
-    # 2) Update attempt if we have its record id
-    attempt_update = None
-    if attempt_record_id:
-        upd = {
-            "completed_at":
-            payload.get("completed_at")
-            or datetime.now(timezone.utc).isoformat(),
-            "status":
-            payload.get("status") or "COMPLETED",
-        }
-        # scoring fields (only if provided)
-        for k_src, k_dst in [
-            ("score_raw", "score_raw"),
-            ("score_max", "score_max"),
-            ("time_total_seconds", "time_total_seconds"),
-            ("result", "result"),
-        ]:
-            if payload.get(k_src) is not None:
-                upd[k_dst] = payload.get(k_src)
-        
-        # Translate mode for Airtable
-        if payload.get("mode") is not None:
-            raw_mode = payload.get("mode")
-            if raw_mode in ("rituel_full_v1", "ritual_full_v1", "rituel_v1", "ritual_v1"):
-                upd["mode"] = "PROD"
-            elif raw_mode == "TEST":
-                upd["mode"] = "TEST"
-            else:
-                upd["mode"] = "PROD"
-        
-        attempt_update = airtable_update(attempts_table,
-                                         str(attempt_record_id), upd)
 
-    # 3) Insert answers (if provided) — tolerant schema
-    answers = payload.get("answers") or payload.get("rituel_answers") or []
-    answers_inserted = 0
-    if isinstance(answers, list) and attempt_record_id:
-        for a in answers[:200]:
-            if not isinstance(a, dict):
-                continue
-            fields = {
-                "player": [p["record_id"]],
-                "exam": [str(attempt_record_id)],
-                "utc": datetime.now(timezone.utc).isoformat(),
-            }
-            # common answer fields
-            for k in [
-                    "question_id", "ID_question", "selected_index",
-                    "correct_index", "is_correct", "time_ms", "time_seconds"
-            ]:
-                if a.get(k) is not None:
-                    fields[k] = a.get(k)
-            res = airtable_create(answers_table, fields)
-            if res.get("ok"):
-                answers_inserted += 1
+def _attempt_update_fields(payload):
+    upd = {
+        "completed_at":
+        payload.get("completed_at") or datetime.now(timezone.utc).isoformat(),
+        "status":
+        payload.get("status") or "COMPLETED",
+    }
+    # scoring fields (only if provided)
+    for k_src, k_dst in [
+        ("score_raw", "score_raw"),
+        ("score_max", "score_max"),
+        ("time_total_seconds", "time_total_seconds"),
+        ("result", "result"),
+    ]:
+        if payload.get(k_src) is not None:
+            upd[k_dst] = payload.get(k_src)
+
+    # Translate mode for Airtable
+    if payload.get("mode") is not None:
+        raw_mode = payload.get("mode")
+        if raw_mode in ("rituel_full_v1", "ritual_full_v1", "rituel_v1", "ritual_v1"):
+            upd["mode"] = "PROD"
+        elif raw_mode == "TEST":
+            upd["mode"] = "TEST"
+        else:
+            upd["mode"] = "PROD"
+    return upd
 
-    # 4) Insert feedback (if provided)
-    fb = payload.get("feedback") or payload.get("rituel_feedback")
-    feedback_res = None
-    if attempt_record_id and fb:
+
+def _answer_rows(payload, player_record_id, attempt_record_id):
+    """Answers (if provided) — tolerant schema."""
+    answers = payload.get("answers") or payload.get("rituel_answers") or []
+    rows = []
+    if not isinstance(answers, list) or not attempt_record_id:
+        return rows
+    for a in answers[:200]:
+        if not isinstance(a, dict):
+            continue
         fields = {
-            "player": [p["record_id"]],
+            "player": [player_record_id],
             "exam": [str(attempt_record_id)],
             "utc": datetime.now(timezone.utc).isoformat(),
         }
-        if isinstance(fb, dict):
-            if fb.get("text"):
-                fields["text"] = fb["text"]
-            if fb.get("rating") is not None:
-                fields["rating"] = fb["rating"]
-        else:
-            fields["text"] = str(fb)
-        feedback_res = airtable_create(feedback_table, fields)
+        # common answer fields
+        for k in [
+                "question_id", "ID_question", "selected_index",
+                "correct_index", "is_correct", "time_ms", "time_seconds"
+        ]:
+            if a.get(k) is not None:
+                fields[k] = a.get(k)
+        rows.append(fields)
+    return rows
+
+
+def _feedback_fields(payload, player_record_id, attempt_record_id):
+    fb = payload.get("feedback") or payload.get("rituel_feedback")
+    if not attempt_record_id or not fb:
+        return None
+    fields = {
+        "player": [player_record_id],
+        "exam": [str(attempt_record_id)],
+        "utc": datetime.now(timezone.utc).isoformat(),
+    }
+    if isinstance(fb, dict):
+        if fb.get("text"):
+            fields["text"] = fb["text"]
+        if fb.get("rating") is not None:
+            fields["rating"] = fb["rating"]
+    else:
+        fields["text"] = str(fb)
+    return fields
+
+
+# étapes simultanées max par complétion (rate limits Airtable / Notion)
+RITUAL_FANOUT_CONCURRENCY = int(os.getenv("RITUAL_FANOUT_CONCURRENCY", "3"))
+
+
+def complete_ritual(payload):
+    """Toutes les écritures d'une complétion, en direct.
+
+    Chemin synchrone seulement (WRITE_BEHIND_ENABLED=0) : en write-behind,
+    _wb_ritual_complete planifie les mêmes étapes en jobs enfants, exécutés
+    en parallèle par les workers du journal (WRITE_BEHIND_WORKERS) et non
+    par run_stages.
+
+    Renvoie `(body, http_status)`.
+    """
+    telegram_user_id, attempt_record_id = _ritual_ids(payload)
+    tables = _ritual_tables()
+
+    with tracing.span("player_upsert"):
+        p = upsert_player_by_telegram_user_id(tables["players"],
+                                              str(telegram_user_id))
+    if not p.get("ok"):
+        return {
+            "ok": False,
+            "error": "player_upsert_failed",
+            "details": p
+        }, 500
+
+    # Une fois le joueur connu, les étapes sont indépendantes : fan-out
+    # borné, la réponse attend l'étape la plus lente.
+    stages = {}
+
+    # 1) Log raw payload (always)
+    stages["payload"] = lambda: airtable_create(
+        tables["payloads"], _payload_log_fields(payload, telegram_user_id))
+
+    # 2) Update attempt if we have its record id
+    if attempt_record_id:
+        stages["attempt"] = lambda: airtable_update(
+            tables["attempts"], str(attempt_record_id),
+            _attempt_update_fields(payload))
+
+    # 3) Insert answers, par batch de 10
+    rows = _answer_rows(payload, p["record_id"], attempt_record_id)
+    if rows:
+        stages["answers"] = lambda: airtable_create_batch(
+            tables["answers"], rows)
+
+    # 4) Insert feedback (if provided)
+    fb_fields = _feedback_fields(payload, p["record_id"], attempt_record_id)
+    if fb_fields:
+        stages["feedback"] = lambda: airtable_create(tables["feedback"],
+                                                     fb_fields)
 
     # 5) ✅ WRITE TO NOTION (new!)
-    notion_res = None
-    try:
-        notion_res = write_to_notion(payload)
-        if notion_res.get("ok"):
-            print(f"✅ NOTION WRITE SUCCESS: page_id={notion_res.get('page_id')}")
+    def notion_stage():
+        res = write_to_notion(payload)
+        if res.get("ok"):
+            logger.info("✅ NOTION WRITE SUCCESS: page_id=%s", res.get("page_id"))
         else:
-            print(f"⚠️ NOTION WRITE FAILED: {notion_res.get('error')}")
-    except Exception as e:
-        print(f"❌ NOTION WRITE EXCEPTION: {e}")
+            logger.warning("⚠️ NOTION WRITE FAILED: %s", res.get("error"))
+        return res
 
-    return jsonify({
+    stages["notion"] = notion_stage
+
+    results = run_stages(stages, max_in_flight=RITUAL_FANOUT_CONCURRENCY)
+    raw_res = results.get("payload") or {}
+    attempt_update = results.get("attempt")
+    answers_inserted = (results.get("answers") or {}).get("created", 0)
+    feedback_res = results.get("feedback")
+    notion_res = results.get("notion")
+
+    return {
         "ok":
         True,
         "version":
@@ -764,14 +1460,253 @@ def ritual_complete():
         raw_res.get("ok", False),
         "payload_record": (raw_res.get("data", {}) or {}).get("id"),
         "attempt_updated":
-        (attempt_update or {}).get("ok") if attempt_update else None,
+        (attempt_update or {}).get("ok", False) if attempt_record_id else None,
         "answers_inserted":
         answers_inserted,
         "feedback_logged":
-        feedback_res.get("ok") if feedback_res else None,
+        (feedback_res or {}).get("ok", False) if fb_fields else None,
         "notion_written":
         notion_res.get("ok") if notion_res else False,
+    }, 200
+
+
+# ================================================================
+# Write-behind — /ritual/complete répond 202 + reçu, le journal est
+# vidé en tâche de fond vers Airtable / Notion (write_behind.py)
+# ================================================================
+# Le journal doit survivre à l'instance : sur Vercel (/tmp éphémère, process
+# gelé après la réponse) les jobs en attente seraient perdus. Sans
+# WRITE_BEHIND_DB explicite, on y reste donc en écritures synchrones.
+WRITE_BEHIND_DB = os.getenv("WRITE_BEHIND_DB", "")
+_WRITE_BEHIND_DEFAULT = "0" if os.getenv("VERCEL") and not WRITE_BEHIND_DB \
+    else "1"
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED",
+                                 _WRITE_BEHIND_DEFAULT).strip() not in (
+    "0", "false", "FALSE", "no", "NO")
+if WRITE_BEHIND_ENABLED and not WRITE_BEHIND_DB:
+    logger.warning("⚠️ WRITE_BEHIND_DB not set: write-behind journal in %s,"
+                   " pending writes are lost if this disk is ephemeral",
+                   tempfile.gettempdir())
+
+WRITE_BEHIND = WriteBehindQueue(
+    WRITE_BEHIND_DB or os.path.join(tempfile.gettempdir(),
+                                    "velvet_write_behind.sqlite3"),
+    workers=int(os.getenv("WRITE_BEHIND_WORKERS", "2")),
+    max_attempts=int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "8")),
+)
+# les workers de fond peuvent attendre leur créneau plus longtemps qu'une
+# requête utilisateur (UPSTREAM_RATE_MAX_WAIT)
+WRITE_BEHIND_RATE_WAIT = float(os.getenv("WRITE_BEHIND_RATE_WAIT", "30"))
+
+
+def _check_airtable(res):
+    """Résultat airtable_* -> exception write-behind si échec."""
+    if res.get("ok"):
+        return res
+    status = res.get("status")
+    if res.get("error") == "missing_airtable_env":
+        raise PermanentFailure("missing_airtable_env")
+    if status is None or status == 429 or status >= 500:
+        raise RetryLater(f"airtable {status}: {str(res.get('data'))[:300]}")
+    raise PermanentFailure(f"airtable {status}: {str(res.get('data'))[:300]}")
+
+
+@upstream.rate_policy(upstream.QUEUE, WRITE_BEHIND_RATE_WAIT)
+def _wb_ritual_complete(payload, job):
+    """Job parent : résout le joueur puis planifie une étape par écriture."""
+    telegram_user_id, attempt_record_id = _ritual_ids(payload)
+    tables = _ritual_tables()
+
+    p = upsert_player_by_telegram_user_id(tables["players"],
+                                          str(telegram_user_id))
+    if not p.get("ok"):
+        raise RetryLater(f"player_upsert_failed: {str(p)[:300]}")
+
+    job.spawn("airtable_create", {
+        "table": tables["payloads"],
+        "fields": _payload_log_fields(payload, telegram_user_id),
     })
+    if attempt_record_id:
+        job.spawn("airtable_update", {
+            "table": tables["attempts"],
+            "record_id": str(attempt_record_id),
+            "fields": _attempt_update_fields(payload),
+        })
+    rows = _answer_rows(payload, p["record_id"], attempt_record_id)
+    if rows:
+        job.spawn("airtable_create_batch", {
+            "table": tables["answers"],
+            "rows": rows
+        })
+    fb_fields = _feedback_fields(payload, p["record_id"], attempt_record_id)
+    if fb_fields:
+        job.spawn("airtable_create", {
+            "table": tables["feedback"],
+            "fields": fb_fields
+        })
+    job.spawn("notion_exam", {"payload": payload})
+    return {"player_record_id": p["record_id"]}
+
+
+def _once_per_job(handler):
+    """Handler write-behind non rejouable : si une tentative précédente du
+    même job a abouti mais n'a pas pu être close (process mort avant
+    _finish), son résultat est rendu sans nouvel appel Airtable. Reste une
+    fenêtre entre l'écriture upstream et complete() : Airtable n'a pas de
+    clé d'idempotence."""
+
+    @functools.wraps(handler)
+    def wrapper(payload, job):
+        key = f"{job.receipt}:{job.id}"
+        state, prior = COMPLETIONS.begin("write_behind", key)
+        if state == idempotency.DONE:
+            return prior
+        if state != idempotency.NEW:
+            raise RetryLater("job already running elsewhere")
+        try:
+            result = handler(payload, job)
+        except Exception:
+            COMPLETIONS.release("write_behind", key)
+            raise
+        COMPLETIONS.complete("write_behind", key, result)
+        return result
+
+    return wrapper
+
+
+@upstream.rate_policy(upstream.QUEUE, WRITE_BEHIND_RATE_WAIT)
+@_once_per_job
+def _wb_airtable_create(payload, job):
+    res = _check_airtable(airtable_create(payload["table"], payload["fields"]))
+    return {"id": (res.get("data") or {}).get("id")}
+
+
+@upstream.rate_policy(upstream.QUEUE, WRITE_BEHIND_RATE_WAIT)
+def _wb_airtable_update(payload, job):
+    _check_airtable(
+        airtable_update(payload["table"], payload["record_id"],
+                        payload["fields"]))
+    return {"id": payload["record_id"]}
+
+
+@upstream.rate_policy(upstream.QUEUE, WRITE_BEHIND_RATE_WAIT)
+@_once_per_job
+def _wb_airtable_create_batch(payload, job):
+    rows = payload["rows"]
+    res = airtable_create_batch(payload["table"], rows)
+    if res.get("error") == "missing_airtable_env":
+        raise PermanentFailure("missing_airtable_env")
+    failed = [
+        row for row, r in zip(rows, res["results"]) if not r.get("ok")
+    ]
+    if failed:
+        # on ne renvoie que les records refusés aux tentatives suivantes
+        raise RetryLater(f"{len(failed)}/{len(rows)} answers not created",
+                         payload={
+                             "table": payload["table"],
+                             "rows": failed
+                         })
+    return {"created": res["created"]}
+
+
+@upstream.rate_policy(upstream.QUEUE, WRITE_BEHIND_RATE_WAIT)
+def _wb_notion_exam(payload, job):
+    res = write_to_notion(payload["payload"])
+    if res.get("ok"):
+        return {"page_id": res.get("page_id")}
+    if res.get("error") == "notion_not_configured":
+        raise PermanentFailure("notion_not_configured")
+    raise RetryLater(f"notion: {str(res.get('error'))[:300]}")
+
+
+WRITE_BEHIND.register("ritual_complete", _wb_ritual_complete)
+WRITE_BEHIND.register("airtable_create", _wb_airtable_create)
+WRITE_BEHIND.register("airtable_update", _wb_airtable_update)
+WRITE_BEHIND.register("airtable_create_batch", _wb_airtable_create_batch)
+WRITE_BEHIND.register("notion_exam", _wb_notion_exam)
+
+
+@app.before_request
+def _start_write_behind():
+    # workers par process (après fork gunicorn) : reprend aussi les jobs
+    # restés dans le journal au dernier arrêt
+    if WRITE_BEHIND_ENABLED:
+        WRITE_BEHIND.start()
+
+
+# write-behind : rien pendant la requête. Synchrone : joueur find + create,
+# payload, attempt, answers (2 batches de 10 pour 15 réponses), feedback,
+# Notion.
+@app.route("/ritual/complete", methods=["POST", "OPTIONS"])
+@upstream.call_budget(lambda: 0 if WRITE_BEHIND_ENABLED else 8)
+def ritual_complete():
+    if request.method == "OPTIONS":
+        return ("", 204)
+
+    payload = _json()
+    if not isinstance(payload, dict):
+        return jsonify({"ok": False, "error": "invalid_payload"}), 400
+    telegram_user_id, _ = _ritual_ids(payload)
+
+    if not telegram_user_id:
+        return jsonify({"ok": False, "error": "missing_telegram_user_id"}), 400
+
+    def run():
+        if not WRITE_BEHIND_ENABLED:
+            return complete_ritual(payload)
+        with tracing.span("enqueue"):
+            receipt = WRITE_BEHIND.enqueue("ritual_complete", payload)
+        return {
+            "ok": True,
+            "version": APP_VERSION,
+            "queued": True,
+            "receipt": receipt,
+            "status_url": f"/ritual/receipt/{receipt}",
+        }, 202
+
+    body, status = _complete_once(payload, run)
+    return jsonify(body), status
+
+
+def _complete_once(payload, run):
+    """`run()` -> (body, status), une seule fois par attempt_id : un renvoi
+    (retry keepalive, double clic) reçoit le résultat d'origine."""
+    attempt_id = payload.get("attempt_id")
+    if not attempt_id:
+        return run()
+    key = str(attempt_id)
+    with tracing.span("dedupe"):
+        state, prior = COMPLETIONS.begin("ritual_complete", key,
+                                         idempotency.fingerprint(payload))
+    if state == idempotency.DONE:
+        return {**prior["body"], "replayed": True}, prior["status"]
+    if state == idempotency.IN_PROGRESS:
+        return {"ok": False, "error": "completion_in_progress"}, 409
+    if state == idempotency.CONFLICT:
+        return {"ok": False, "error": "attempt_payload_mismatch"}, 409
+
+    try:
+        body, status = run()
+    except Exception:
+        COMPLETIONS.release("ritual_complete", key)
+        raise
+    if status < 300:
+        COMPLETIONS.complete("ritual_complete", key, {
+            "body": body,
+            "status": status
+        })
+    else:
+        COMPLETIONS.release("ritual_complete", key)
+    return body, status
+
+
+@app.get("/ritual/receipt/<receipt>")
+@upstream.call_budget(0)
+def ritual_receipt(receipt):
+    st = WRITE_BEHIND.status(receipt)
+    if st is None:
+        return jsonify({"ok": False, "error": "unknown_receipt"}), 404
+    return jsonify({"ok": True, **st}), 200
 
 
 if __name__ == "__main__":
@@ -785,6 +1720,16 @@ if __name__ == "__main__":
     # Pour lancer en local :
     #   RUN_LOCAL_SERVER=1 PORT=5000 python3 server.py
     #
+    # Snapshot embarqué (étape de build, avec les variables Airtable) :
+    #   python3 server.py bake-questions [chemin]
+    #
+    if len(sys.argv) > 1 and sys.argv[1] == "bake-questions":
+        path = sys.argv[2] if len(sys.argv) > 2 else QUESTIONS_SEED_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        count = QUESTION_BANK.bake(path)
+        print(f"📚 {count} questions → {path}")
+        raise SystemExit(0)
+
     if os.getenv("RUN_LOCAL_SERVER",
                  "").strip() not in ("1", "true", "TRUE", "yes", "YES"):
         print(
@@ -0,0 +1,865 @@
+# standin_server.py — faux Airtable + Notion en local (tests de charge hors ligne)
+# -----------------------------------------------------
+# Sous-ensemble des API utilisé par server.py / bot.py / test_integration.py :
+#   Airtable (/v0) : list (filterByFormula, sort, maxRecords, pageSize,
+#                    offset, fields[]), get, create (simple + batch de 10),
+#                    patch (simple + batch), delete
+#   Notion (/v1)   : GET database, database query (filter, sorts,
+#                    page_size, start_cursor), page create / get / patch
+#
+# - Stockage en mémoire, thread-safe
+# - Latence simulée par service : fixed:MS | uniform:MIN,MAX |
+#   normal:MOYENNE,ECART | lognormal:MEDIANE,SIGMA (en ms)
+# - Injection d'erreurs 5xx (taux par service)
+# - Rate limit émulé : token bucket par base Airtable (5 req/s) et par
+#   intégration Notion (3 req/s) -> 429 + Retry-After
+#
+# Lancer :
+#   python standin_server.py --port 8765 --questions 500 \
+#       --airtable-latency lognormal:150,0.4 --notion-latency lognormal:350,0.5
+# puis pointer l'app dessus :
+#   AIRTABLE_API_URL=http://127.0.0.1:8765/v0
+#   NOTION_API_URL=http://127.0.0.1:8765/v1
+#
+# `StandIn.handle()` est aussi utilisable sans socket : `StandInAdapter`
+# (transport requests) + `upstream.install_adapter()` (bench_ritual.py).
+
+import argparse
+import json
+import random
+import re
+import string
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+AIRTABLE_MAX_BATCH = 10
+AIRTABLE_MAX_PAGE_SIZE = 100
+NOTION_MAX_PAGE_SIZE = 100
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace(
+        "+00:00", "Z")
+
+
+# -------------------------------------------------
+# Latence / rate limit
+# -------------------------------------------------
+class Latency:
+    """Distribution de latence (spec texte, valeurs en ms)."""
+
+    def __init__(self, spec="fixed:0"):
+        kind, _, params = (spec or "fixed:0").partition(":")
+        self.kind = kind.strip().lower()
+        self.params = [float(x) for x in params.split(",") if x.strip()]
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"unknown latency distribution {spec!r}")
+        self.spec = spec
+
+    def sample_ms(self, rng=random):
+        p = self.params
+        if self.kind == "fixed":
+            return p[0] if p else 0.0
+        if self.kind == "uniform":
+            return rng.uniform(p[0], p[1])
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(p[0], p[1]))
+        # lognormal : médiane p[0] ms, sigma p[1] (queue longue réaliste)
+        return rng.lognormvariate(0.0, p[1]) * p[0]
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+# -------------------------------------------------
+# Formules Airtable (sous-ensemble)
+# -------------------------------------------------
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+      (?P<field>\{[^}]*\})
+    | (?P<str>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    | (?P<num>\d+(?:\.\d+)?)
+    | (?P<op><=|>=|!=|=|<|>|&|\(|\)|,)
+    | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+
+class FormulaError(ValueError):
+    pass
+
+
+def _tokenize(formula):
+    tokens, pos = [], 0
+    formula = formula.strip()
+    while pos < len(formula):
+        m = _TOKEN_RE.match(formula, pos)
+        if not m or m.end() == pos:
+            raise FormulaError(f"invalid formula near {formula[pos:pos + 20]!r}")
+        pos = m.end()
+        kind = m.lastgroup
+        text = m.group(kind)
+        if kind == "str":
+            text = re.sub(r"\\(.)", r"\1", text[1:-1])
+        elif kind == "field":
+            text = text[1:-1]
+        elif kind == "num":
+            text = float(text)
+        elif kind == "name":
+            text = text.upper()
+        tokens.append((kind, text))
+    return tokens
+
+
+def _scalar(value):
+    # valeur de champ telle que vue par une formule
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return 1 if value else 0
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+    return value
+
+
+def _truthy(v):
+    return bool(v) and v != "0"
+
+
+def _compare(a, op, b):
+    try:
+        a2, b2 = float(a), float(b)
+        if str(a).strip() != "" and str(b).strip() != "":
+            a, b = a2, b2
+    except (TypeError, ValueError):
+        a, b = str(a), str(b)
+    return {
+        "=": a == b,
+        "!=": a != b,
+        "<": a < b,
+        ">": a > b,
+        "<=": a <= b,
+        ">=": a >= b,
+    }[op]
+
+
+class Formula:
+    """filterByFormula compilé : {Champ}, 'texte', nombres, = != < > <= >=,
+    &, AND(), OR(), NOT(), TRUE(), FALSE(), BLANK(), LOWER(), UPPER(), LEN()."""
+
+    def __init__(self, formula):
+        self.tokens = _tokenize(formula)
+        self.pos = 0
+        self.tree = self._expr() if self.tokens else ("const", 1)
+        if self.pos != len(self.tokens):
+            raise FormulaError("unexpected trailing tokens in formula")
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _eat(self, kind=None, text=None):
+        tok = self._peek()
+        if tok[0] is None or (kind and tok[0] != kind) or (text is not None
+                                                          and tok[1] != text):
+            raise FormulaError(f"unexpected token {tok[1]!r}")
+        self.pos += 1
+        return tok
+
+    def _expr(self):
+        left = self._concat()
+        tok = self._peek()
+        if tok[0] == "op" and tok[1] in ("=", "!=", "<", ">", "<=", ">="):
+            self.pos += 1
+            return ("cmp", tok[1], left, self._concat())
+        return left
+
+    def _concat(self):
+        node = self._primary()
+        while self._peek() == ("op", "&"):
+            self.pos += 1
+            node = ("concat", node, self._primary())
+        return node
+
+    def _primary(self):
+        kind, text = self._eat()
+        if kind == "field":
+            return ("field", text)
+        if kind in ("str", "num"):
+            return ("const", text)
+        if kind == "op" and text == "(":
+            node = self._expr()
+            self._eat("op", ")")
+            return node
+        if kind == "name":
+            self._eat("op", "(")
+            args = []
+            if self._peek() != ("op", ")"):
+                args.append(self._expr())
+                while self._peek() == ("op", ","):
+                    self.pos += 1
+                    args.append(self._expr())
+            self._eat("op", ")")
+            return ("call", text, args)
+        raise FormulaError(f"unexpected token {text!r}")
+
+    def __call__(self, fields):
+        return _truthy(self._eval(self.tree, fields))
+
+    def _eval(self, node, fields):
+        kind = node[0]
+        if kind == "const":
+            return node[1]
+        if kind == "field":
+            return _scalar(fields.get(node[1]))
+        if kind == "concat":
+            return f"{self._eval(node[1], fields)}{self._eval(node[2], fields)}"
+        if kind == "cmp":
+            return 1 if _compare(self._eval(node[2], fields), node[1],
+                                 self._eval(node[3], fields)) else 0
+        name, args = node[1], node[2]
+        vals = lambda: [self._eval(a, fields) for a in args]
+        if name == "AND":
+            return 1 if all(_truthy(self._eval(a, fields)) for a in args) else 0
+        if name == "OR":
+            return 1 if any(_truthy(self._eval(a, fields)) for a in args) else 0
+        if name == "NOT":
+            return 0 if _truthy(vals()[0]) else 1
+        if name == "TRUE":
+            return 1
+        if name in ("FALSE", "BLANK"):
+            return 0 if name == "FALSE" else ""
+        if name == "LOWER":
+            return str(vals()[0]).lower()
+        if name == "UPPER":
+            return str(vals()[0]).upper()
+        if name == "LEN":
+            return len(str(vals()[0]))
+        raise FormulaError(f"unsupported function {name}()")
+
+
+# -------------------------------------------------
+# Propriétés / filtres Notion (sous-ensemble)
+# -------------------------------------------------
+def _rich_text(items):
+    out = []
+    for t in items or []:
+        content = t.get("plain_text") or (t.get("text") or {}).get("content", "")
+        out.append(dict(t, plain_text=content, type=t.get("type", "text")))
+    return out
+
+
+_PROPERTY_TYPES = ("title", "rich_text", "select", "multi_select", "number",
+                   "date", "checkbox", "url", "email", "phone_number",
+                   "relation")
+
+
+def _normalize_property(prop):
+    """Ajoute `type` et `plain_text` comme le renvoie l'API Notion."""
+    for kind in _PROPERTY_TYPES:
+        if kind in prop:
+            value = prop[kind]
+            if kind in ("title", "rich_text"):
+                value = _rich_text(value)
+            return {"type": kind, kind: value}
+    return dict(prop)
+
+
+def _property_value(prop):
+    kind = (prop or {}).get("type")
+    if kind is None:
+        return None
+    value = prop.get(kind)
+    if kind in ("title", "rich_text"):
+        return "".join(t.get("plain_text", "") for t in value or [])
+    if kind == "select":
+        return (value or {}).get("name")
+    if kind == "multi_select":
+        return [v.get("name") for v in value or []]
+    if kind == "date":
+        return (value or {}).get("start")
+    if kind == "relation":
+        return [v.get("id") for v in value or []]
+    return value
+
+
+def _match_condition(value, cond):
+    for op, expected in cond.items():
+        if op == "is_empty":
+            ok = value in (None, "", [])
+        elif op == "is_not_empty":
+            ok = value not in (None, "", [])
+        elif op == "equals":
+            ok = value == expected
+        elif op == "does_not_equal":
+            ok = value != expected
+        elif op == "contains":
+            ok = expected in (value or ([] if isinstance(value, list) else ""))
+        elif op == "does_not_contain":
+            ok = expected not in (value or ([] if isinstance(value, list) else ""))
+        elif op == "starts_with":
+            ok = str(value or "").startswith(expected)
+        elif op == "ends_with":
+            ok = str(value or "").endswith(expected)
+        elif op in ("greater_than", "after"):
+            ok = value is not None and value > expected
+        elif op in ("less_than", "before"):
+            ok = value is not None and value < expected
+        elif op in ("greater_than_or_equal_to", "on_or_after"):
+            ok = value is not None and value >= expected
+        elif op in ("less_than_or_equal_to", "on_or_before"):
+            ok = value is not None and value <= expected
+        else:
+            raise ValueError(f"unsupported filter condition {op!r}")
+        if not ok:
+            return False
+    return True
+
+
+def _match_filter(page, flt):
+    if not flt:
+        return True
+    if "and" in flt:
+        return all(_match_filter(page, f) for f in flt["and"])
+    if "or" in flt:
+        return any(_match_filter(page, f) for f in flt["or"])
+    if "timestamp" in flt:
+        ts = flt["timestamp"]
+        return _match_condition(page.get(ts), flt.get(ts) or {})
+    prop = page["properties"].get(flt.get("property"))
+    value = _property_value(prop)
+    for kind in _PROPERTY_TYPES + ("status", "formula"):
+        if kind in flt:
+            return _match_condition(value, flt[kind])
+    raise ValueError(f"unsupported filter {flt!r}")
+
+
+def _sort_key(value):
+    # None en dernier, types mélangés comparés en texte
+    return (value is None, str(value) if not isinstance(value, (int, float))
+            else "", value if isinstance(value, (int, float)) else 0)
+
+
+# -------------------------------------------------
+# Stand-in
+# -------------------------------------------------
+class Response:
+    __slots__ = ("status", "body", "headers")
+
+    def __init__(self, status, body, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class StandIn:
+
+    def __init__(self, airtable_latency="fixed:0", notion_latency="fixed:0",
+                 airtable_error_rate=0.0, notion_error_rate=0.0,
+                 rate_limit=False, airtable_rps=5.0, notion_rps=3.0,
+                 retry_after=1, seed=None, sleep=True):
+        self.latency = {
+            "airtable": Latency(airtable_latency),
+            "notion": Latency(notion_latency),
+        }
+        self.error_rate = {
+            "airtable": float(airtable_error_rate),
+            "notion": float(notion_error_rate),
+        }
+        self.rate_limit = rate_limit
+        self.rps = {"airtable": airtable_rps, "notion": notion_rps}
+        self.retry_after = retry_after
+        self.sleep = sleep
+        self.rng = random.Random(seed)
+        self._buckets = {}
+        self._lock = threading.RLock()
+        self.tables = {}  # (base, table) -> {record_id: record}
+        self.pages = {}  # page_id -> page
+        self.calls = {}  # (service, method, resource, status) -> n
+
+    # -------------------------------------------------
+    # Seeds
+    # -------------------------------------------------
+    def _record_id(self):
+        return "rec" + "".join(
+            self.rng.choice(string.ascii_letters + string.digits)
+            for _ in range(14))
+
+    def seed_records(self, base, table, rows):
+        with self._lock:
+            store = self.tables.setdefault((base, table), {})
+            for fields in rows:
+                rec = self._new_record(fields)
+                store[rec["id"]] = rec
+
+    def seed_questions(self, base, table, count=500,
+                       domains=("Histoire", "Art", "Sciences", "Géographie",
+                                "Littérature"),
+                       levels=("N1", "N2", "N3", "N4", "N5")):
+        """Questions au format de la table Airtable (question_bank.py)."""
+        rows = []
+        for i in range(count):
+            rows.append({
+                "ID_question": f"Q{i + 1:05d}",
+                "Question": f"Question de test n°{i + 1} ?",
+                "Options (JSON)": json.dumps(
+                    [f"Réponse {c}" for c in "ABCD"], ensure_ascii=False),
+                "Correct_index": self.rng.randrange(4),
+                "Explication": f"Explication de la question {i + 1}.",
+                "Domaine": domains[i % len(domains)],
+                "Niveau": levels[(i // len(domains)) % len(levels)],
+            })
+        self.seed_records(base, table, rows)
+
+    # -------------------------------------------------
+    # Entrée
+    # -------------------------------------------------
+    def handle(self, method, url, headers=None, body=None):
+        """Traite une requête ; `url` = chemin + query (ou URL complète)."""
+        parts = urlsplit(url)
+        path = [p for p in parts.path.split("/") if p]
+        query = parse_qs(parts.query, keep_blank_values=True)
+        if isinstance(body, (bytes, bytearray)):
+            body = body.decode("utf-8")
+        if isinstance(body, str):
+            try:
+                body = json.loads(body) if body.strip() else None
+            except ValueError:
+                return Response(400, {"error": {"type": "INVALID_JSON"}})
+        method = method.upper()
+
+        if path[:1] == ["v0"] and len(path) >= 3:
+            service, limit_key = "airtable", path[1]
+        elif path[:1] == ["v1"] and len(path) >= 2:
+            service = "notion"
+            # un bucket par intégration (token)
+            limit_key = {k.lower(): v for k, v in (headers or {}).items()
+                         }.get("authorization", "")
+        else:
+            return Response(404, {"error": "NOT_FOUND"})
+
+        resource = path[2] if service == "airtable" else path[1]
+        resp = self._dispatch(service, limit_key, method, path, query, body)
+        with self._lock:
+            key = (service, method, resource, resp.status)
+            self.calls[key] = self.calls.get(key, 0) + 1
+        return resp
+
+    def _dispatch(self, service, limit_key, method, path, query, body):
+        delay = self.latency[service].sample_ms(self.rng) / 1000.0
+        if self.sleep and delay > 0:
+            time.sleep(delay)
+
+        if self.rate_limit:
+            bucket_key = (service, limit_key)
+            with self._lock:
+                bucket = self._buckets.get(bucket_key)
+                if bucket is None:
+                    bucket = self._buckets[bucket_key] = TokenBucket(
+                        self.rps[service])
+            if not bucket.take():
+                return self._rate_limited(service)
+
+        if self.rng.random() < self.error_rate[service]:
+            status = self.rng.choice((500, 502, 503))
+            if service == "notion":
+                return Response(status, {
+                    "object": "error",
+                    "status": status,
+                    "code": "internal_server_error",
+                    "message": "Injected error (stand-in)",
+                })
+            return Response(status, {
+                "error": {
+                    "type": "SERVER_ERROR",
+                    "message": "Injected error (stand-in)"
+                }
+            })
+
+        try:
+            if service == "airtable":
+                return self._airtable(method, path[1], path[2],
+                                      path[3] if len(path) > 3 else None,
+                                      query, body or {})
+            return self._notion(method, path[1:], body or {})
+        except (FormulaError, ValueError, KeyError, TypeError) as e:
+            if service == "notion":
+                return Response(400, {
+                    "object": "error",
+                    "status": 400,
+                    "code": "validation_error",
+                    "message": str(e),
+                })
+            return Response(422, {
+                "error": {
+                    "type": "INVALID_REQUEST_UNKNOWN",
+                    "message": str(e)
+                }
+            })
+
+    def _rate_limited(self, service):
+        headers = {"Retry-After": str(self.retry_after)}
+        if service == "notion":
+            return Response(429, {
+                "object": "error",
+                "status": 429,
+                "code": "rate_limited",
+                "message": "You have been rate limited (stand-in).",
+            }, headers)
+        return Response(429, {
+            "errors": [{
+                "error": "RATE_LIMIT_REACHED",
+                "message": "Rate limit exceeded (stand-in).",
+            }]
+        }, headers)
+
+    # -------------------------------------------------
+    # Airtable
+    # -------------------------------------------------
+    def _new_record(self, fields):
+        return {
+            "id": self._record_id(),
+            "createdTime": _now_iso(),
+            "fields": dict(fields or {}),
+        }
+
+    def _airtable(self, method, base, table, record_id, query, body):
+        with self._lock:
+            store = self.tables.setdefault((base, table), {})
+            if method == "GET" and record_id:
+                rec = store.get(record_id)
+                if rec is None:
+                    return Response(404, {"error": "NOT_FOUND"})
+                return Response(200, rec)
+            if method == "GET":
+                return self._airtable_list(store, query)
+            if method == "POST" and not record_id:
+                if "records" in body:
+                    rows = body["records"]
+                    if len(rows) > AIRTABLE_MAX_BATCH:
+                        raise ValueError(
+                            f"at most {AIRTABLE_MAX_BATCH} records per request")
+                    created = [self._new_record(r.get("fields")) for r in rows]
+                    for rec in created:
+                        store[rec["id"]] = rec
+                    return Response(200, {"records": created})
+                rec = self._new_record(body.get("fields"))
+                store[rec["id"]] = rec
+                return Response(200, rec)
+            if method in ("PATCH", "PUT"):
+                updates = ([{"id": record_id, "fields": body.get("fields")}]
+                           if record_id else body.get("records", []))
+                out = []
+                for upd in updates:
+                    rec = store.get(upd.get("id"))
+                    if rec is None:
+                        return Response(404, {"error": "NOT_FOUND"})
+                    if method == "PUT":
+                        rec["fields"] = {}
+                    rec["fields"].update(upd.get("fields") or {})
+                    out.append(rec)
+                return Response(200, out[0] if record_id else {"records": out})
+            if method == "DELETE":
+                ids = [record_id] if record_id else query.get("records[]", [])
+                deleted = []
+                for rid in ids:
+                    if store.pop(rid, None) is None:
+                        return Response(404, {"error": "NOT_FOUND"})
+                    deleted.append({"id": rid, "deleted": True})
+                return Response(200, deleted[0] if record_id else
+                                {"records": deleted})
+        return Response(404, {"error": "NOT_FOUND"})
+
+    def _airtable_list(self, store, query):
+        q = lambda k, d=None: (query.get(k) or [d])[0]
+        records = list(store.values())
+
+        formula = q("filterByFormula")
+        if formula:
+            match = Formula(formula)
+            records = [r for r in records if match(r["fields"])]
+
+        sorts = []
+        i = 0
+        while q(f"sort[{i}][field]"):
+            sorts.append((q(f"sort[{i}][field]"),
+                          q(f"sort[{i}][direction]", "asc") == "desc"))
+            i += 1
+        for field, desc in reversed(sorts):
+            records.sort(key=lambda r: _sort_key(r["fields"].get(field)),
+                         reverse=desc)
+
+        max_records = q("maxRecords")
+        if max_records:
+            records = records[:int(max_records)]
+
+        page_size = min(int(q("pageSize") or AIRTABLE_MAX_PAGE_SIZE),
+                        AIRTABLE_MAX_PAGE_SIZE)
+        start = int(q("offset") or 0)
+        page = records[start:start + page_size]
+
+        projection = query.get("fields[]")
+        if projection:
+            page = [dict(r, fields={k: v for k, v in r["fields"].items()
+                                    if k in projection}) for r in page]
+
+        out = {"records": page}
+        if start + page_size < len(records):
+            out["offset"] = str(start + page_size)
+        return Response(200, out)
+
+    # -------------------------------------------------
+    # Notion
+    # -------------------------------------------------
+    def _notion(self, method, path, body):
+        kind = path[0]
+        with self._lock:
+            if kind == "databases" and len(path) == 2 and method == "GET":
+                return Response(200, self._database(path[1]))
+            if (kind == "databases" and len(path) == 3 and path[2] == "query"
+                    and method == "POST"):
+                return self._notion_query(path[1], body)
+            if kind == "pages" and len(path) == 1 and method == "POST":
+                return self._notion_create(body)
+            if kind == "pages" and len(path) == 2:
+                page = self.pages.get(path[1])
+                if page is None:
+                    return Response(404, {
+                        "object": "error",
+                        "status": 404,
+                        "code": "object_not_found",
+                        "message": f"Could not find page with ID: {path[1]}.",
+                    })
+                if method == "PATCH":
+                    for name, prop in (body.get("properties") or {}).items():
+                        page["properties"][name] = _normalize_property(prop)
+                    if "archived" in body:
+                        page["archived"] = bool(body["archived"])
+                    page["last_edited_time"] = _now_iso()
+                    return Response(200, page)
+                if method == "GET":
+                    return Response(200, page)
+        return Response(404, {
+            "object": "error",
+            "status": 404,
+            "code": "object_not_found",
+            "message": "Unsupported route (stand-in).",
+        })
+
+    def _database(self, database_id):
+        props = {}
+        for page in self.pages.values():
+            if page["parent"].get("database_id") == database_id:
+                for name, prop in page["properties"].items():
+                    props.setdefault(name, {"id": name, "name": name,
+                                            "type": prop.get("type")})
+        return {
+            "object": "database",
+            "id": database_id,
+            "title": [{"type": "text", "plain_text": "Stand-in database",
+                       "text": {"content": "Stand-in database"}}],
+            "properties": props,
+        }
+
+    def _notion_create(self, body):
+        database_id = (body.get("parent") or {}).get("database_id")
+        if not database_id:
+            raise ValueError("body.parent.database_id should be defined")
+        page_id = str(uuid.UUID(int=self.rng.getrandbits(128)))
+        now = _now_iso()
+        page = {
+            "object": "page",
+            "id": page_id,
+            "created_time": now,
+            "last_edited_time": now,
+            "archived": False,
+            "parent": {"type": "database_id", "database_id": database_id},
+            "properties": {
+                name: _normalize_property(prop)
+                for name, prop in (body.get("properties") or {}).items()
+            },
+            "url": f"https://www.notion.so/{page_id.replace('-', '')}",
+        }
+        self.pages[page_id] = page
+        return Response(200, page)
+
+    def _notion_query(self, database_id, body):
+        pages = [
+            p for p in self.pages.values()
+            if p["parent"].get("database_id") == database_id
+            and not p["archived"] and _match_filter(p, body.get("filter"))
+        ]
+        for s in reversed(body.get("sorts") or []):
+            if "timestamp" in s:
+                key = lambda p, ts=s["timestamp"]: _sort_key(p.get(ts))
+            else:
+                key = lambda p, name=s["property"]: _sort_key(
+                    _property_value(p["properties"].get(name)))
+            pages.sort(key=key, reverse=s.get("direction") == "descending")
+
+        page_size = min(int(body.get("page_size") or NOTION_MAX_PAGE_SIZE),
+                        NOTION_MAX_PAGE_SIZE)
+        start = int(body.get("start_cursor") or 0)
+        chunk = pages[start:start + page_size]
+        has_more = start + page_size < len(pages)
+        return Response(200, {
+            "object": "list",
+            "results": chunk,
+            "has_more": has_more,
+            "next_cursor": str(start + page_size) if has_more else None,
+        })
+
+    # -------------------------------------------------
+    # Stats
+    # -------------------------------------------------
+    def stats(self):
+        with self._lock:
+            return {
+                f"{service} {method} {resource} {status}": n
+                for (service, method, resource, status), n in sorted(
+                    self.calls.items())
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+
+
+# -------------------------------------------------
+# Transport requests (sans socket)
+# -------------------------------------------------
+class StandInAdapter(BaseAdapter):
+    """Adapter requests qui répond via `StandIn.handle` ; l'host de l'URL
+    est ignoré, seul le chemin (/v0/…, /v1/…) compte."""
+
+    def __init__(self, standin):
+        super().__init__()
+        self.standin = standin
+
+    def send(self, request, **kwargs):
+        res = self.standin.handle(request.method, request.url,
+                                  dict(request.headers), request.body)
+        resp = requests.Response()
+        resp.status_code = res.status
+        resp.reason = "Stand-in"
+        resp.headers = CaseInsensitiveDict(res.headers)
+        resp.headers["Content-Type"] = "application/json; charset=utf-8"
+        resp._content = json.dumps(res.body, ensure_ascii=False).encode("utf-8")
+        resp.encoding = "utf-8"
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+
+# -------------------------------------------------
+# Serveur HTTP
+# -------------------------------------------------
+def make_handler(standin):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _serve(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else None
+            if self.path == "/__standin/stats":
+                resp = Response(200, standin.stats())
+            else:
+                resp = standin.handle(self.command, self.path,
+                                      dict(self.headers.items()), body)
+            data = json.dumps(resp.body, ensure_ascii=False).encode("utf-8")
+            self.send_response(resp.status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in resp.headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _serve
+
+        def log_message(self, fmt, *args):
+            pass  # le volume d'un test de charge noierait la console
+
+    return Handler
+
+
+def serve(standin, host="127.0.0.1", port=8765):
+    server = ThreadingHTTPServer((host, port), make_handler(standin))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Faux Airtable + Notion en local (tests de charge)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--airtable-latency", default="lognormal:150,0.4")
+    ap.add_argument("--notion-latency", default="lognormal:350,0.5")
+    ap.add_argument("--airtable-error-rate", type=float, default=0.0)
+    ap.add_argument("--notion-error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-limit", action="store_true",
+                    help="429 au-delà de 5 req/s par base / 3 req/s Notion")
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--questions", type=int, default=500,
+                    help="questions générées dans --questions-base/table")
+    ap.add_argument("--questions-base", default="appSTANDIN")
+    ap.add_argument("--questions-table", default="questions")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    standin = StandIn(airtable_latency=args.airtable_latency,
+                      notion_latency=args.notion_latency,
+                      airtable_error_rate=args.airtable_error_rate,
+                      notion_error_rate=args.notion_error_rate,
+                      rate_limit=args.rate_limit,
+                      retry_after=args.retry_after,
+                      seed=args.seed)
+    if args.questions:
+        standin.seed_questions(args.questions_base, args.questions_table,
+                               args.questions)
+
+    server = serve(standin, args.host, args.port)
+    base = f"http://{args.host}:{args.port}"
+    print(f"🧪 Stand-in Airtable/Notion sur {base}")
+    print(f"   AIRTABLE_API_URL={base}/v0  NOTION_API_URL={base}/v1")
+    print(f"   questions : AIRTABLE_BASE_ID={args.questions_base}"
+          f" AIRTABLE_TABLE_ID={args.questions_table}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Budgets d'appels upstream par route — tests de non-régression
+=============================================================
+Chaque route déclare son plafond d'appels Airtable / Notion dans server.py
+(`@upstream.call_budget(n)`). Ici, les upstreams sont servis en mémoire
+par standin_server.StandIn (conftest.py) et le mode `enforce` fait échouer
+toute requête qui dépasse son budget.
+
+    python -m pytest -q test_call_budgets.py
+"""
+
+import pytest
+
+import standin_server
+import upstream
+
+import server
+
+BUDGETED_ENDPOINTS = [
+    "health",
+    "ready",
+    "metrics_endpoint",
+    "questions_random",
+    "ritual_start",
+    "ritual_bootstrap",
+    "ritual_complete",
+    "ritual_receipt",
+]
+
+
+def measure(client, method, path, **kwargs):
+    with upstream.count_calls() as counter:
+        resp = client.open(path, method=method, **kwargs)
+    return resp, counter
+
+
+def budget(path, method="GET"):
+    endpoint, _ = server.app.url_map.bind("localhost").match(path,
+                                                            method=method)
+    return upstream.budget_for(server.app.view_functions[endpoint])
+
+
+def completion_payload(client, telegram_user_id, attempt_id):
+    questions = client.get("/questions/random?count=15").get_json()["questions"]
+    answers = [{
+        "question_id": q["id"],
+        "selected_index": 0,
+        "correct_index": q["correct_index"],
+        "is_correct": q["correct_index"] == 0,
+        "time_ms": 12000,
+    } for q in questions]
+    return {
+        "attempt_id": attempt_id,
+        "telegram_user_id": telegram_user_id,
+        "mode": "rituel_full_v1",
+        "score_raw": sum(a["is_correct"] for a in answers),
+        "score_max": len(answers),
+        "time_total_seconds": 180,
+        "answers": answers,
+        "feedback": {"text": "ok", "rating": 5},
+    }
+
+
+@pytest.mark.parametrize("endpoint", BUDGETED_ENDPOINTS)
+def test_budget_declared(endpoint):
+    assert upstream.budget_for(server.app.view_functions[endpoint]) is not None
+
+
+@pytest.mark.parametrize("path", ["/health", "/ready", "/metrics"])
+def test_ops_endpoints_make_no_upstream_call(client, path):
+    resp, counter = measure(client, "GET", path)
+    assert resp.status_code in (200, 503)
+    assert counter.total <= budget(path) == 0, counter
+
+
+def test_questions_random_served_from_bank(client):
+    path = "/questions/random?count=15&telegram_user_id=101"
+    resp, counter = measure(client, "GET", path)
+    assert resp.status_code == 200
+    assert len(resp.get_json()["questions"]) == 15
+    assert counter.total <= budget("/questions/random") == 0, counter
+
+
+def test_ritual_start_new_then_cached_player(client):
+    limit = budget("/ritual/start", "POST")
+    body = {"mode": "rituel_full_v1", "telegram_user_id": "202"}
+
+    resp, counter = measure(client, "POST", "/ritual/start", json=body)
+    assert resp.status_code == 200, resp.get_json()
+    assert counter.total <= limit, counter
+
+    # joueur en cache : seule la création de l'attempt reste
+    resp, counter = measure(client, "POST", "/ritual/start", json=body)
+    assert resp.status_code == 200
+    assert counter.total == 1, counter
+
+
+def test_ritual_bootstrap(client):
+    resp, counter = measure(client, "POST", "/ritual/bootstrap",
+                            json={"telegram_user_id": "303", "count": 15})
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["attempt_id"] and len(data["questions"]) == 15
+    assert counter.total <= budget("/ritual/bootstrap", "POST"), counter
+
+
+def test_ritual_start_shed_is_503(client, monkeypatch):
+
+    def shed(payload, telegram_user_id):
+        raise upstream.RateLimited("airtable", 2.5)
+
+    monkeypatch.setattr(server, "start_attempt", shed)
+    resp = client.post("/ritual/start", json={"telegram_user_id": "212"})
+    assert resp.status_code == 503
+    assert resp.get_json()["error"] == "upstream_rate_limited"
+    assert resp.headers["Retry-After"] == "3"
+
+    # bootstrap : les questions restent servies, sans attempt
+    resp = client.post("/ritual/bootstrap",
+                       json={"telegram_user_id": "212", "count": 15})
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["attempt_id"] is None and len(data["questions"]) == 15
+    assert data["attempt_error"] == "upstream_rate_limited"
+
+
+def test_ritual_start_circuit_open_is_503(client, monkeypatch):
+
+    def tripped(payload, telegram_user_id):
+        raise upstream.CircuitOpen("airtable", 9.2)
+
+    monkeypatch.setattr(server, "start_attempt", tripped)
+    resp = client.post("/ritual/start", json={"telegram_user_id": "213"})
+    assert resp.status_code == 503
+    assert resp.get_json()["error"] == "upstream_unavailable"
+    assert resp.headers["Retry-After"] == "10"
+
+    resp = client.post("/ritual/bootstrap",
+                       json={"telegram_user_id": "213", "count": 15})
+    assert resp.status_code == 200
+    assert resp.get_json()["attempt_error"] == "upstream_unavailable"
+
+
+@pytest.mark.parametrize("quota", [[1], {"niveau=N5": 3}, ["niveau=N5:3", None],
+                                   "niveau=N5"])
+def test_ritual_bootstrap_rejects_invalid_quota(client, quota):
+    resp = client.post("/ritual/bootstrap",
+                       json={"telegram_user_id": "314", "quota": quota})
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "invalid_quota"
+
+
+@pytest.mark.parametrize("path", ["/ritual/start", "/ritual/bootstrap",
+                                  "/ritual/complete"])
+def test_ritual_routes_reject_non_object_body(client, path):
+    resp = client.post(path, json=[{"telegram_user_id": "315"}])
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "invalid_payload"
+
+
+@pytest.mark.parametrize("exc, error", [
+    (upstream.RateLimited("airtable-appTEST", 1.2), "upstream_rate_limited"),
+    (upstream.CircuitOpen("airtable", 4.0), "upstream_unavailable"),
+])
+def test_ritual_bootstrap_questions_upstream_unavailable(
+        client, monkeypatch, exc, error):
+
+    def unavailable():
+        raise exc
+
+    monkeypatch.setattr(server.QUESTION_BANK, "ensure_started", unavailable)
+    resp = client.post("/ritual/bootstrap",
+                       json={"telegram_user_id": "316", "count": 15})
+    assert resp.status_code == 503
+    assert resp.get_json()["error"] == error
+    assert resp.headers["Retry-After"] == str(int(exc.retry_after) + 1)
+
+
+def test_ritual_complete_write_behind(client):
+    start = client.post("/ritual/start",
+                        json={"telegram_user_id": "404"}).get_json()
+    payload = completion_payload(client, "404", start["attempt_id"])
+
+    resp, counter = measure(client, "POST", "/ritual/complete", json=payload)
+    assert resp.status_code == 202
+    assert counter.total <= budget("/ritual/complete", "POST") == 0, counter
+
+
+def test_ritual_complete_sync(client, monkeypatch):
+    monkeypatch.setattr(server, "WRITE_BEHIND_ENABLED", False)
+    start = client.post("/ritual/start",
+                        json={"telegram_user_id": "505"}).get_json()
+    payload = completion_payload(client, "505", start["attempt_id"])
+    server.PLAYER_ID_CACHE.clear()  # pire cas : joueur relu
+
+    resp, counter = measure(client, "POST", "/ritual/complete", json=payload)
+    assert resp.status_code == 200, resp.get_json()
+    assert resp.get_json()["answers_inserted"] == 15
+    assert counter.total <= budget("/ritual/complete", "POST") == 8, counter
+
+
+def test_ritual_complete_replay_is_free(client):
+    start = client.post("/ritual/start",
+                        json={"telegram_user_id": "606"}).get_json()
+    payload = completion_payload(client, "606", start["attempt_id"])
+    first = client.post("/ritual/complete", json=payload).get_json()
+
+    # renvoi keepalive : même attempt, seul completed_at change
+    payload["completed_at"] = "2026-01-01T00:00:00Z"
+    resp, counter = measure(client, "POST", "/ritual/complete", json=payload)
+    assert resp.status_code == 202
+    assert resp.get_json()["receipt"] == first["receipt"]
+    assert resp.get_json()["replayed"] is True
+    assert counter.total == 0, counter
+
+    payload["score_raw"] += 1
+    assert client.post("/ritual/complete", json=payload).status_code == 409
+
+
+def _exam_pages(standin, joueur_id):
+    field = server.NOTION_FIELDS["joueur_id"]
+    return [
+        page for page in standin.pages.values()
+        if standin_server._property_value(page["properties"].get(field)) ==
+        joueur_id
+    ]
+
+
+def test_notion_exam_written_once_with_real_score(client, standin,
+                                                  monkeypatch):
+    monkeypatch.setattr(server, "WRITE_BEHIND_ENABLED", False)
+    start = client.post("/ritual/start",
+                        json={"telegram_user_id": "707"}).get_json()
+    payload = completion_payload(client, "707", start["attempt_id"])
+    # corps réel de la WebApp : le payload sendData voyage dans client_payload
+    payload["client_payload"] = {
+        "mode": "rituel_full_v1",
+        "attempt_id": start["attempt_id"],
+        "score": payload["score_raw"],
+        "total": payload["score_max"],
+        "time_formatted": "03:00",
+        "answers": payload.pop("answers"),
+        "comment_text": "belle soirée",
+    }
+    assert client.post("/ritual/complete", json=payload).status_code == 200
+
+    # le sendData du bot arrive ensuite pour le même attempt
+    def bot_create():
+        raise AssertionError("la page existe déjà")
+
+    res = server.notion_exam_once(start["attempt_id"], bot_create)
+    assert res["deduped"] is True
+
+    (page, ) = _exam_pages(standin, "707")
+    assert res["page_id"] == page["id"]
+    props = {
+        name: standin_server._property_value(prop)
+        for name, prop in page["properties"].items()
+    }
+    fields = server.NOTION_FIELDS
+    assert props[fields["score"]] == payload["score_raw"]
+    assert props[fields["mode"]] == "Prod"
+    assert props[fields["commentaires"]] == "belle soirée"
+    assert props[fields["reponses"]].count("\n") == 14
+
+
+def test_exam_page_listeners_see_server_pages(client, standin, monkeypatch):
+    monkeypatch.setattr(server, "WRITE_BEHIND_ENABLED", False)
+    created = []
+    monkeypatch.setattr(server, "EXAM_PAGE_LISTENERS",
+                        [lambda *args: created.append(args)])
+    start = client.post("/ritual/start",
+                        json={"telegram_user_id": "808"}).get_json()
+    payload = completion_payload(client, "808", start["attempt_id"])
+    assert client.post("/ritual/complete", json=payload).status_code == 200
+
+    (page, ) = _exam_pages(standin, "808")
+    assert created == [("808", "Prod", page["id"])]
+
+
+def test_enforce_mode_fails_over_budget():
+
+    @upstream.call_budget(0)
+    def greedy():
+        upstream.get(f"{upstream.AIRTABLE_API_URL}/appTEST/questions")
+
+    with pytest.raises(upstream.CallBudgetExceeded):
+        greedy()
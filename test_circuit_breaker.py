@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Disjoncteurs upstream — machine à états et repli de la banque
+=============================================================
+Horloge injectée : aucune attente réelle pour les transitions.
+
+    python -m pytest -q test_circuit_breaker.py
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import upstream
+from circuit_breaker import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker,
+                             CircuitOpen)
+from question_bank import MappedQuestions, QuestionBank, write_snapshot
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _breaker(clock, **kwargs):
+    kwargs.setdefault("min_calls", 4)
+    kwargs.setdefault("open_seconds", 10.0)
+    return CircuitBreaker("airtable", clock=clock, **kwargs)
+
+
+def _call(b, failed):
+    b.before_call()
+    b.record(failed)
+
+
+def _trip(b):
+    for _ in range(b.min_calls):
+        _call(b, failed=True)
+    assert b.state == OPEN
+
+
+def test_opens_on_error_rate_with_enough_calls():
+    b = _breaker(Clock(), error_rate=0.5)
+    _call(b, True)
+    _call(b, True)
+    _call(b, True)
+    assert b.state == CLOSED  # 3 < min_calls
+    _call(b, False)
+    assert b.state == OPEN  # 3/4 >= 50 %
+
+
+def test_failures_outside_window_are_forgotten():
+    clock = Clock()
+    b = _breaker(clock, window=30.0)
+    for _ in range(3):
+        _call(b, True)
+    clock.now += 31
+    for _ in range(3):
+        _call(b, False)
+    _call(b, True)
+    assert b.state == CLOSED  # 1/4 dans la fenêtre
+    assert b.status()["calls"] == 4
+
+
+def test_open_fails_fast_then_half_open_single_trial():
+    clock = Clock()
+    b = _breaker(clock)
+    _trip(b)
+
+    with pytest.raises(CircuitOpen) as exc:
+        b.before_call()
+    assert exc.value.retry_after == pytest.approx(10.0)
+    clock.now += 4
+    with pytest.raises(CircuitOpen):
+        b.check()
+
+    clock.now += 6
+    b.check()  # délai écoulé : n'échoue plus, ne réserve pas l'essai
+    b.before_call()  # l'essai
+    assert b.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        b.before_call()  # un seul essai à la fois
+    b.record(failed=False)
+    assert b.state == CLOSED
+    b.before_call()
+    b.record(False)
+
+
+def test_failed_trial_reopens():
+    clock = Clock()
+    b = _breaker(clock)
+    _trip(b)
+    clock.now += 10
+    b.before_call()
+    b.record(failed=True)
+    assert b.state == OPEN and b.opens == 2
+    with pytest.raises(CircuitOpen):
+        b.before_call()
+
+
+def test_late_record_while_open_is_ignored():
+    b = _breaker(Clock())
+    b.before_call()  # parti avant l'ouverture
+    _trip(b)
+    b.record(failed=False)
+    assert b.state == OPEN
+
+
+def test_429_is_not_an_error(monkeypatch):
+    b = _breaker(Clock())
+    resp = SimpleNamespace(status_code=429)
+    monkeypatch.setattr(upstream, "_send", lambda *a, **kw: resp)
+    for _ in range(10):
+        assert upstream._guarded_send(b, "GET", "http://x") is resp
+    assert b.state == CLOSED and b.status()["error_rate"] == 0.0
+
+    # les 429 comptent comme appels aboutis : 10 / 20 en 5xx pour ouvrir
+    resp.status_code = 503
+    for _ in range(9):
+        upstream._guarded_send(b, "GET", "http://x")
+    assert b.state == CLOSED
+    upstream._guarded_send(b, "GET", "http://x")
+    assert b.state == OPEN
+
+
+# -------------------------------------------------
+# /questions/random, Airtable coupé
+# -------------------------------------------------
+@pytest.fixture
+def airtable_down(monkeypatch):
+    b = CircuitBreaker("airtable", min_calls=1, open_seconds=60.0)
+    _trip(b)
+    monkeypatch.setitem(upstream.BREAKERS, "airtable", b)
+    return b
+
+
+def _bank(server, monkeypatch, snapshot_path=None):
+    bank = QuestionBank(server._fetch_questions_page,
+                        snapshot_path=snapshot_path,
+                        refresh_seconds=3600, retry_seconds=3600)
+    monkeypatch.setattr(server, "QUESTION_BANK", bank)
+    return bank
+
+
+def test_snapshot_served_stale_while_circuit_open(client, monkeypatch,
+                                                   airtable_down, tmp_path):
+    import server
+
+    path = str(tmp_path / "q.snap")
+    write_snapshot(path, MappedQuestions([{
+        "id": f"Q{i}", "question": "?", "options": ["A", "B"],
+        "correct_index": 0, "domaine": "Art", "niveau": "N1",
+    } for i in range(20)]))
+    _bank(server, monkeypatch, snapshot_path=path)
+
+    with upstream.count_calls() as counter:
+        resp = client.get("/questions/random?count=5")
+    assert resp.status_code == 200
+    assert len(resp.get_json()["questions"]) == 5
+    assert resp.headers["X-Questions-Stale"] == "1"
+    assert int(resp.headers["X-Questions-Age"]) >= 0
+    assert counter.total == 0
+
+
+def test_empty_bank_fails_fast_while_circuit_open(client, monkeypatch,
+                                                  airtable_down):
+    import server
+
+    _bank(server, monkeypatch)
+    with upstream.count_calls() as counter:
+        resp = client.get("/questions/random?count=5")
+    assert resp.status_code == 503
+    assert resp.get_json()["error"] == "airtable_unavailable"
+    assert resp.headers["Retry-After"] == "60"
+    assert counter.total == 0
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Page d'examen Notion — HTTP (/ritual/complete) et bot (sendData)
+================================================================
+La WebApp envoie la même complétion par les deux chemins ; une seule page
+par attempt_id, identique quel que soit le chemin arrivé en premier.
+
+    python -m pytest -q test_exam_pages.py
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+import server
+import standin_server
+
+
+class _Message:
+
+    def __init__(self, data):
+        self.web_app_data = SimpleNamespace(data=data)
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def _send_data(uid, data):
+    msg = _Message(json.dumps(data))
+    user = SimpleNamespace(id=uid, first_name="Ada", last_name="L",
+                           username="ada")
+    update = SimpleNamespace(effective_user=user, effective_message=msg,
+                             message=msg)
+    context = SimpleNamespace(user_data={"exam_mode": "Prod"}, args=[])
+    asyncio.run(bot.handle_webapp_data(update, context))
+    return msg.replies
+
+
+def _webapp_payload(client, uid):
+    attempt_id = client.post("/ritual/start",
+                             json={"telegram_user_id": str(uid)
+                                   }).get_json()["attempt_id"]
+    questions = client.get("/questions/random?count=15").get_json()["questions"]
+    # forme finalEnrichedAnswers de la WebApp
+    answers = [{
+        "question_id": q["id"],
+        "choice_letter": "B",
+        "status": "correct" if q["correct_index"] == 1 else "wrong",
+    } for q in questions]
+    return {
+        "mode": "rituel_full_v1",
+        "attempt_id": attempt_id,
+        "score": sum(a["status"] == "correct" for a in answers),
+        "total": 15,
+        "time_total_seconds": 171,
+        "time_formatted": "02:51",
+        "answers": answers,
+        "comment_text": "ok",
+    }
+
+
+def _complete(client, uid, payload):
+    body = {
+        "attempt_id": payload["attempt_id"],
+        "telegram_user_id": str(uid),
+        "mode": payload["mode"],
+        "score_raw": payload["score"],
+        "score_max": payload["total"],
+        "time_total_seconds": payload["time_total_seconds"],
+        "client_payload": payload,
+    }
+    return client.post("/ritual/complete", json=body)
+
+
+def _page_props(standin, uid):
+    field = server.NOTION_FIELDS["joueur_id"]
+    pages = [
+        p for p in standin.pages.values()
+        if standin_server._property_value(p["properties"].get(field)) ==
+        str(uid)
+    ]
+    assert len(pages) == 1, pages
+    return {
+        name: standin_server._property_value(prop)
+        for name, prop in pages[0]["properties"].items()
+        if name not in (field, server.NOTION_FIELDS["date"])
+    }
+
+
+@pytest.fixture
+def sync_complete(monkeypatch):
+    monkeypatch.setattr(server, "WRITE_BEHIND_ENABLED", False)
+
+
+def test_same_page_whichever_path_wins(client, standin, sync_complete):
+    # HTTP d'abord (cas courant), puis sendData
+    http_first = _webapp_payload(client, 901)
+    assert _complete(client, 901, http_first).status_code == 200
+    assert not _send_data(901, http_first)[-1].startswith("❌")
+
+    # sendData d'abord, puis HTTP
+    bot_first = dict(_webapp_payload(client, 902),
+                     answers=http_first["answers"], score=http_first["score"])
+    assert not _send_data(902, bot_first)[-1].startswith("❌")
+    assert _complete(client, 902, bot_first).status_code == 200
+
+    a, b = _page_props(standin, 901), _page_props(standin, 902)
+    assert a == b
+    fields = server.NOTION_FIELDS
+    assert a[fields["nom_utilisateur"]] == "Ada L"
+    assert a[fields["username_telegram"]] == "@ada"
+    assert a[fields["version_bot"]] == "rituel_full_v1"
+    assert a[fields["score"]] == http_first["score"]
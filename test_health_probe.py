@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Sondes upstream — /health, /ready et politique de débit des sondes
+==================================================================
+Upstreams servis par standin_server (conftest.py) ; les sondes sont
+lancées à la main (run_once), sans le thread de fond.
+
+    python -m pytest -q test_health_probe.py
+"""
+
+import pytest
+
+import circuit_breaker
+import rate_limit
+import upstream
+import webapp_assets
+from health_probe import UpstreamProber
+from question_bank import QuestionBank, QuestionBankError
+
+import server
+
+
+@pytest.fixture
+def prober(client, monkeypatch):
+    p = UpstreamProber({
+        "airtable": server._probe_airtable,
+        "notion": server._probe_notion
+    })
+    monkeypatch.setattr(p, "ensure_started", lambda: None)
+    webapp_assets.manifest()  # warm-up du vrai prober
+    monkeypatch.setattr(server, "HEALTH_PROBER", p)
+    # les 5xx injectés ne doivent pas ouvrir le vrai circuit Airtable
+    monkeypatch.setitem(upstream.BREAKERS, "airtable",
+                        circuit_breaker.CircuitBreaker("airtable"))
+    return p
+
+
+@pytest.fixture
+def no_rate_limit(monkeypatch):
+    # buckets partagés avec les autres tests : une sonde « shed » échouerait
+    # sur un créneau pris, pas sur la panne simulée
+    monkeypatch.setattr(upstream, "RATE_LIMIT_ENABLED", False)
+
+
+@pytest.fixture
+def cold_bank(monkeypatch):
+    # démarrage à froid : ni snapshot ni seed, la banque dépend d'Airtable
+    bank = QuestionBank(server._fetch_questions_page)
+    monkeypatch.setattr(server, "QUESTION_BANK", bank)
+    return bank
+
+
+def test_not_ready_before_first_round(client, prober):
+    resp = client.get("/ready")
+    assert resp.status_code == 503
+    assert resp.get_json()["checks"]["upstream_probed"] is False
+    assert client.get("/health").get_json()["airtable"]["error"] == "pending"
+
+
+def test_failing_upstream_flips_ready(client, prober, standin, monkeypatch,
+                                      no_rate_limit, cold_bank):
+    monkeypatch.setitem(standin.error_rate, "airtable", 1.0)
+    prober.run_once()
+    with pytest.raises(QuestionBankError):
+        cold_bank.ensure_started()
+    resp = client.get("/ready")
+    assert resp.status_code == 503
+    checks = resp.get_json()["checks"]
+    assert checks["airtable"] is False and checks["question_bank"] is False
+    assert checks["upstream_probed"] is True
+    health = client.get("/health").get_json()
+    assert health["status"] == "ok"  # /health décrit, ne filtre pas
+    assert health["airtable"]["ok"] is False
+    assert health["airtable"]["error"].startswith("5")
+    assert health["airtable"]["consecutive_failures"] == 1
+    assert health["notion"]["ok"] is True
+
+    monkeypatch.setitem(standin.error_rate, "airtable", 0.0)
+    prober.run_once()
+    cold_bank.ensure_started()
+    assert client.get("/ready").status_code == 200
+    assert client.get("/health").get_json()["airtable"][
+        "consecutive_failures"] == 0
+
+
+def test_cached_bank_keeps_ready_when_airtable_fails(client, prober, standin,
+                                                     monkeypatch,
+                                                     no_rate_limit):
+    monkeypatch.setitem(standin.error_rate, "airtable", 1.0)
+    prober.run_once()
+    resp = client.get("/ready")
+    assert resp.status_code == 200
+    assert resp.get_json()["checks"]["airtable"] is True
+
+
+def test_probes_shed_instead_of_queueing(client, prober, monkeypatch):
+    waits = []
+    acquire = rate_limit.TokenBucket.acquire
+
+    def spy(self, max_wait):
+        waits.append(max_wait)
+        return acquire(self, max_wait)
+
+    monkeypatch.setattr(rate_limit.TokenBucket, "acquire", spy)
+    prober.run_once()
+    # un créneau libre ou l'échec, jamais d'attente derrière le trafic
+    assert waits and all(w == 0.0 for w in waits)
+
+    def drained(self, max_wait):
+        raise rate_limit.RateLimited(self.name, 0.5)
+
+    monkeypatch.setattr(rate_limit.TokenBucket, "acquire", drained)
+    with upstream.count_calls() as counter:
+        prober.run_once()
+    assert counter.total == 0
+    status = prober.status()
+    assert "rate limited" in status["airtable"]["error"]
+    assert "rate limited" in status["notion"]["error"]
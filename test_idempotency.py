@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Dédoublonnage des complétions — begin / complete / release
+==========================================================
+Sans réseau : store SQLite temporaire.
+
+    python -m pytest -q test_idempotency.py
+"""
+
+import time
+
+import pytest
+
+import idempotency
+from idempotency import (CONFLICT, DONE, IN_PROGRESS, NEW, IdempotencyStore,
+                         fingerprint)
+
+COMPLETION = {
+    "attempt_id": "att-1",
+    "telegram_user_id": "101",
+    "score_raw": 11,
+    "score_max": 15,
+    "completed_at": "2026-01-01T00:00:00Z",
+    "client_payload": {"score": 11, "total": 15},
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return IdempotencyStore(str(tmp_path / "idem.sqlite3"))
+
+
+def test_first_caller_reserves_then_replays(store):
+    fp = fingerprint(COMPLETION)
+    assert store.begin("ritual_complete", "att-1", fp) == (NEW, None)
+    assert store.begin("ritual_complete", "att-1", fp) == (IN_PROGRESS, None)
+
+    store.complete("ritual_complete", "att-1", {"status": 202})
+    assert store.begin("ritual_complete", "att-1", fp) == (DONE,
+                                                           {"status": 202})
+    # portées indépendantes
+    assert store.begin("notion_exam", "att-1")[0] == NEW
+
+
+def test_release_frees_key(store):
+    assert store.begin("s", "k")[0] == NEW
+    store.release("s", "k")
+    assert store.begin("s", "k")[0] == NEW
+
+    # release après complete : le résultat reste
+    store.complete("s", "k", {"ok": True})
+    store.release("s", "k")
+    assert store.begin("s", "k") == (DONE, {"ok": True})
+
+
+def test_retry_with_new_completed_at_is_same_completion(store):
+    assert store.begin("s", "att-1", fingerprint(COMPLETION))[0] == NEW
+    store.complete("s", "att-1", {"ok": True})
+
+    retry = dict(COMPLETION, completed_at="2026-01-01T00:00:07Z")
+    assert store.begin("s", "att-1", fingerprint(retry)) == (DONE,
+                                                             {"ok": True})
+
+
+def test_changed_score_conflicts(store):
+    assert store.begin("s", "att-1", fingerprint(COMPLETION))[0] == NEW
+    changed = dict(COMPLETION, score_raw=12)
+    assert store.begin("s", "att-1", fingerprint(changed)) == (CONFLICT, None)
+
+    store.complete("s", "att-1", {"ok": True})
+    nested = dict(COMPLETION, client_payload={"score": 12, "total": 15})
+    assert store.begin("s", "att-1", fingerprint(nested)) == (CONFLICT, None)
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    store = IdempotencyStore(str(tmp_path / "idem.sqlite3"),
+                             lease_seconds=0.05)
+    assert store.begin("s", "k")[0] == NEW
+    assert store.begin("s", "k")[0] == IN_PROGRESS
+    time.sleep(0.1)
+    assert store.begin("s", "k")[0] == NEW
+
+
+def test_fingerprint_ignores_key_order_and_volatile_fields():
+    a = {"x": 1, "y": [1, 2], "completed_at": "t1"}
+    b = {"y": [1, 2], "x": 1, "completed_at": "t2"}
+    assert fingerprint(a) == fingerprint(b)
+    assert fingerprint(a) != fingerprint(dict(a, y=[2, 1]))
+    assert "completed_at" in idempotency.VOLATILE_FIELDS
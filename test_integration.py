@@ -15,6 +15,12 @@ from dotenv import load_dotenv
 # Charger les variables d'environnement
 load_dotenv()
 
+# Surchargeables pour viser standin_server.py
+AIRTABLE_API_URL = os.getenv("AIRTABLE_API_URL",
+                             "https://api.airtable.com/v0").rstrip("/")
+NOTION_API_URL = os.getenv("NOTION_API_URL",
+                           "https://api.notion.com/v1").rstrip("/")
+
 # Couleurs pour le terminal
 GREEN = "\033[92m"
 RED = "\033[91m"
@@ -100,7 +106,7 @@ def test_airtable_connection():
     # Test sur la table players (dans CORE base)
     table_name = os.getenv("AIRTABLE_PLAYERS_TABLE", "players")
     print_info(f"Test sur base CORE: {base_id[:10]}...")
-    url = f"https://api.airtable.com/v0/{base_id}/{table_name}"
+    url = f"{AIRTABLE_API_URL}/{base_id}/{table_name}"
     
     try:
         response = requests.get(
@@ -145,7 +151,7 @@ def test_notion_connection():
     }
     
     # Récupérer les infos de la database
-    url = f"https://api.notion.com/v1/databases/{db_id}"
+    url = f"{NOTION_API_URL}/databases/{db_id}"
     
     try:
         response = requests.get(url, headers=headers, timeout=10)
@@ -210,7 +216,7 @@ def test_airtable_write():
         "Content-Type": "application/json"
     }
     
-    url = f"https://api.airtable.com/v0/{base_id}/{table_name}"
+    url = f"{AIRTABLE_API_URL}/{base_id}/{table_name}"
     
     # Créer un joueur de test
     test_id = f"TEST_{int(datetime.now(timezone.utc).timestamp())}"
@@ -269,7 +275,7 @@ def test_notion_write():
         "Content-Type": "application/json"
     }
     
-    url = "https://api.notion.com/v1/pages"
+    url = f"{NOTION_API_URL}/pages"
     
     # Créer une page de test
     test_id = f"TEST_{int(datetime.now(timezone.utc).timestamp())}"
@@ -360,7 +366,8 @@ def test_local_server():
         if response.status_code == 200:
             data = response.json()
             print_success(f"Serveur OK - Version: {data.get('version', 'N/A')}")
-            print_info(f"Airtable: {data.get('airtable_ok', False)}")
+            print_info(f"Airtable: {(data.get('airtable') or {}).get('ok', False)}")
+            print_info(f"Notion: {(data.get('notion') or {}).get('ok', False)}")
             return True
         else:
             print_error(f"Serveur erreur: {response.status_code}")
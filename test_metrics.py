@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Métriques — rendu texte Prometheus et fusion multi-workers (METRICS_DIR)
+========================================================================
+Sans réseau : registre du process + snapshots JSON écrits à la main pour
+simuler d'autres workers gunicorn (vivants ou terminés).
+
+    python -m pytest -q test_metrics.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import metrics
+import server
+
+COUNTER = metrics.Counter("test_jobs_total", "Jobs by kind")
+HISTO = metrics.Histogram("test_duration_seconds", "Duration",
+                          buckets=(0.1, 1.0))
+_gauges = {"depth": 0}
+
+
+@metrics.register_collector
+def _test_gauges():
+    yield ("test_queue_depth", "gauge", "Shared queue depth", {},
+           _gauges["depth"], "max")
+    yield ("test_local_items", "gauge", "Per-worker items", {}, 2)
+
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _lines(text, name):
+    return [l for l in text.splitlines()
+            if l.startswith(name) and not l.startswith("#")]
+
+
+def _sample(text, series):
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def _worker_snapshot(directory, pid, jobs, depth, durations):
+    hist = [0, 0, 0, 0.0, 0]  # buckets 0.1 / 1.0 / +Inf, sum, count
+    for d in durations:
+        hist[0 if d <= 0.1 else 1 if d <= 1.0 else 2] += 1
+        hist[3] += d
+        hist[4] += 1
+    snap = {"pid": pid, "written_at": 0, "metrics": {
+        "test_jobs_total": {"type": "counter", "help": "Jobs by kind",
+                            "buckets": None, "agg": "sum",
+                            "samples": [[[["kind", "a"]], jobs]]},
+        "test_duration_seconds": {"type": "histogram", "help": "Duration",
+                                  "buckets": [0.1, 1.0], "agg": "sum",
+                                  "samples": [[[], hist]]},
+        "test_queue_depth": {"type": "gauge", "help": "Shared queue depth",
+                             "buckets": None, "agg": "max",
+                             "samples": [[[], float(depth)]]},
+        "test_local_items": {"type": "gauge", "help": "Per-worker items",
+                             "buckets": None, "agg": "sum",
+                             "samples": [[[], 5.0]]},
+    }}
+    path = os.path.join(directory, f"metrics_{pid}.json")
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(snap, fh)
+
+
+def test_text_format():
+    COUNTER.inc(kind='quo"te\n')
+    HISTO.observe(0.05, kind="render")
+    HISTO.observe(0.5, kind="render")
+    HISTO.observe(3.0, kind="render")
+    text = metrics.render()
+
+    assert text.endswith("\n")
+    assert "# HELP test_jobs_total Jobs by kind" in text
+    assert "# TYPE test_jobs_total counter" in text
+    assert "# TYPE test_duration_seconds histogram" in text
+    assert "# TYPE test_queue_depth gauge" in text
+    assert _sample(text, 'test_jobs_total{kind="quo\\"te\\n"}') == 1
+
+    # buckets cumulés, +Inf == _count
+    assert _lines(text, "test_duration_seconds") == [
+        'test_duration_seconds_bucket{kind="render",le="0.1"} 1',
+        'test_duration_seconds_bucket{kind="render",le="1"} 2',
+        'test_duration_seconds_bucket{kind="render",le="+Inf"} 3',
+        'test_duration_seconds_sum{kind="render"} 3.55',
+        'test_duration_seconds_count{kind="render"} 3',
+    ]
+
+
+def test_bucket_bound_is_inclusive():
+    h = metrics.Histogram("test_bound_seconds", "Bound", buckets=(1.0,))
+    h.observe(1.0)
+    text = metrics.render()
+    assert _sample(text, 'test_bound_seconds_bucket{le="1"}') == 1
+
+
+def test_redeclare_with_other_type_fails():
+    with pytest.raises(ValueError):
+        metrics.Histogram("test_jobs_total", "clash")
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    return str(tmp_path)
+
+
+def test_cross_worker_merge(metrics_dir):
+    COUNTER.inc(2, kind="a")
+    _gauges["depth"] = 4
+    alive, dead = os.getppid(), _dead_pid()
+    _worker_snapshot(metrics_dir, alive, jobs=3, depth=9, durations=[0.05])
+    _worker_snapshot(metrics_dir, dead, jobs=10, depth=50,
+                     durations=[0.5, 2.0])
+
+    text = metrics.render()
+    # le process courant a écrit son propre snapshot au scrape
+    assert os.path.exists(os.path.join(metrics_dir,
+                                       f"metrics_{os.getpid()}.json"))
+
+    # counters : somme de tous les workers, process terminés compris
+    assert _sample(text, 'test_jobs_total{kind="a"}') == 2 + 3 + 10
+    # histogrammes : somme bucket par bucket (ici séries sans label)
+    assert [l for l in _lines(text, "test_duration_seconds")
+            if "kind=" not in l] == [
+        'test_duration_seconds_bucket{le="0.1"} 1',
+        'test_duration_seconds_bucket{le="1"} 2',
+        'test_duration_seconds_bucket{le="+Inf"} 3',
+        'test_duration_seconds_sum 2.55',
+        'test_duration_seconds_count 3',
+    ]
+    # gauge partagée : max des vivants, le worker terminé est ignoré
+    assert _sample(text, "test_queue_depth") == 9
+    # gauge par worker : somme des vivants
+    assert _sample(text, "test_local_items") == 2 + 5
+
+
+def test_truncated_snapshot_is_skipped(metrics_dir):
+    with open(os.path.join(metrics_dir, "metrics_1.json"), "w") as fh:
+        fh.write('{"pid": 1, "metr')
+    text = metrics.render()
+    assert "# TYPE test_jobs_total counter" in text
+
+
+def test_no_metrics_dir_warns_once(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "METRICS_DIR", "")
+    monkeypatch.setattr(metrics, "_flusher_pid", None)
+    with caplog.at_level("WARNING", logger="metrics"):
+        metrics.ensure_flusher()
+        metrics.ensure_flusher()
+    warnings = [r for r in caplog.records if "METRICS_DIR" in r.getMessage()]
+    assert len(warnings) == 1
+    assert str(os.getpid()) in warnings[0].getMessage()
+
+
+# -------------------------------------------------
+# Routes de diagnostic : même contrôle que /__debug/events
+# -------------------------------------------------
+DIAG_ROUTES = ["/__debug/events", "/__upstream", "/__caches"]
+
+
+@pytest.mark.parametrize("path", DIAG_ROUTES)
+def test_diagnostics_disabled_without_token(client, monkeypatch, path):
+    monkeypatch.setattr(server, "DEBUG_EVENTS_TOKEN", "")
+    assert client.get(path).status_code == 404
+
+
+@pytest.mark.parametrize("path", DIAG_ROUTES)
+def test_diagnostics_require_token(client, monkeypatch, path):
+    monkeypatch.setattr(server, "DEBUG_EVENTS_TOKEN", "s3cret")
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={"X-Debug-Token": "nope"}).status_code \
+        == 403
+    resp = client.get(path, headers={"X-Debug-Token": "s3cret"})
+    assert resp.status_code == 200
+    assert resp.get_json()["ok"] is True
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Banque de questions — snapshot disque et tirage
+===============================================
+Sans réseau : les pages Airtable sont simulées par `fetch_page`.
+
+    python -m pytest -q test_question_bank.py
+"""
+
+import os
+import random
+
+import pytest
+
+from question_bank import (QuestionBank, QuestionSnapshot, MappedQuestions,
+                           write_snapshot)
+from seen_sets import SeenQuestions
+
+QUESTIONS = [{
+    "id": f"Q{i:03d}",
+    "question": f"Question n°{i} — é ?",
+    "options": ["A", "B", "C", "D"],
+    "correct_index": i % 4,
+    "explanation": "-",
+    "domaine": ("Histoire", "Art", "Sciences")[i % 3],
+    "niveau": f"N{i % 5 + 1}",
+} for i in range(40)]
+
+
+def _records(questions):
+    return [{
+        "fields": {
+            "ID_question": q["id"],
+            "Question": q["question"],
+            "Options (JSON)": q["options"],
+            "Correct_index": q["correct_index"],
+            "Explication": q["explanation"],
+            "Domaine": q["domaine"],
+            "Niveau": q["niveau"],
+        }
+    } for q in questions]
+
+
+def _unreachable(offset=None):
+    raise AssertionError("Airtable ne doit pas être appelé")
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "q.snap")
+    write_snapshot(path, MappedQuestions(QUESTIONS))
+
+    snap = QuestionSnapshot(path)
+    assert len(snap) == len(QUESTIONS)
+    assert list(snap) == QUESTIONS
+    assert snap[-1] == QUESTIONS[-1]
+    assert snap.fragment(3) == MappedQuestions(QUESTIONS).fragment(3)
+
+
+@pytest.mark.parametrize("damage", ["magic", "truncated", "empty", "offsets"])
+def test_corrupted_snapshot_rejected(tmp_path, damage):
+    path = str(tmp_path / "q.snap")
+    write_snapshot(path, QUESTIONS)
+    with open(path, "rb") as fh:
+        raw = bytearray(fh.read())
+    if damage == "magic":
+        raw[:4] = b"XXXX"
+    elif damage == "truncated":
+        raw = raw[:len(raw) - 10]
+    elif damage == "empty":
+        raw = b""
+    else:
+        raw[24:28] = (2**31).to_bytes(4, "little")  # offset de la 1re question
+    with open(path, "wb") as fh:
+        fh.write(raw)
+
+    with pytest.raises(ValueError):
+        QuestionSnapshot(path)
+    # la banque ignore le fichier au lieu de servir des questions fausses
+    assert not QuestionBank(_unreachable, snapshot_path=path).load_snapshot()
+
+
+def test_seed_snapshot_serves_cold_start(tmp_path):
+    seed = str(tmp_path / "seed.snap")
+    write_snapshot(seed, QUESTIONS)
+
+    # /tmp vide (cold start serverless) : le snapshot embarqué prend le relais
+    bank = QuestionBank(_unreachable,
+                        snapshot_path=str(tmp_path / "missing.snap"),
+                        seed_path=seed)
+    assert bank.load_snapshot()
+    assert len(bank) == len(QUESTIONS)
+    assert bank.status()["source"] == "snapshot"
+    assert bank.stale_age() is not None
+
+
+def test_bake_writes_seed(tmp_path):
+    pages = {None: (_records(QUESTIONS[:25]), "p2"),
+             "p2": (_records(QUESTIONS[25:]), None)}
+    bank = QuestionBank(lambda offset=None: pages[offset])
+    seed = str(tmp_path / "data" / "questions.snap")
+    os.makedirs(os.path.dirname(seed))
+
+    assert bank.bake(seed) == len(QUESTIONS)
+    assert list(QuestionSnapshot(seed)) == QUESTIONS
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_seen_questions_not_repeated_while_unseen_remain(seed):
+    random.seed(seed)
+    bank_questions = [dict(q, id=f"Q{i:03d}")
+                      for i, q in enumerate(QUESTIONS * 3)]  # 120
+    bank = QuestionBank(lambda offset=None: (_records(bank_questions), None),
+                        seen=SeenQuestions())
+    bank.load()
+
+    served = []
+    for _ in range(len(bank_questions) // 15):
+        served += [q["id"] for q in bank.draw(15, player_id="42")]
+    # 8 tirages de 15 : toute la banque, sans doublon
+    assert len(set(served)) == len(served) == len(bank_questions)
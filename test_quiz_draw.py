@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tirage stratifié — quotas, minimums, échantillonnage par rejet
+==============================================================
+
+    python -m pytest -q test_quiz_draw.py
+"""
+
+import random
+from collections import Counter
+
+import pytest
+
+from quiz_draw import (DrawIndex, Quota, QuotaError, parse_quota_specs,
+                       sample_into, stratified_draw)
+
+DOMAINS = ("Histoire", "Art", "Sciences", "Géographie")
+# 4 domaines × 5 niveaux, sauf N5 : seulement 2 questions
+QUESTIONS = [{
+    "id": f"Q{i:03d}",
+    "domaine": DOMAINS[i % 4],
+    "niveau": f"N{(i // 4) % 4 + 1}",
+} for i in range(96)] + [
+    {"id": "Q900", "domaine": "Art", "niveau": "N5"},
+    {"id": "Q901", "domaine": "Sciences", "niveau": "n5"},
+]
+
+
+@pytest.fixture
+def index():
+    random.seed(3)
+    return DrawIndex(QUESTIONS)
+
+
+def _keys(index, positions):
+    return [index.keys[i] for i in positions]
+
+
+# -------------------------------------------------
+# Syntaxe
+# -------------------------------------------------
+def test_parse_quota_forms():
+    quotas = parse_quota_specs(
+        ["niveau=N5:3", "domaine=Histoire:2, domaine=Art;niveau=n3:1", ""])
+    assert [(q.count, q.domaine, q.niveau) for q in quotas] == [
+        (3, None, "5"),
+        (2, "histoire", None),
+        (1, "art", "3"),
+    ]
+    assert parse_quota_specs([]) == []
+
+
+@pytest.mark.parametrize("spec", [
+    "niveau=N5", "niveau=N5:x", "niveau=N5:-1", "couleur=bleu:1",
+    "domaine=:1", "domaine=Art;:1", ":2",
+])
+def test_parse_quota_rejects(spec):
+    with pytest.raises(QuotaError):
+        parse_quota_specs([spec])
+
+
+def test_invalid_quota_is_400(client):
+    resp = client.get("/questions/random?count=5&quota=niveau=N5")
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "invalid_quota"
+
+
+def test_route_applies_repeatable_quotas(client):
+    resp = client.get("/questions/random?count=10&quota=niveau=N5:3"
+                      "&quota=domaine=Art;niveau=N2:2")
+    assert resp.status_code == 200
+    qs = resp.get_json()["questions"]
+    assert len(qs) == 10
+    assert sum(q["niveau"] == "N5" for q in qs) >= 3
+    assert sum(q["domaine"] == "Art" and q["niveau"] == "N2"
+               for q in qs) >= 2
+
+
+# -------------------------------------------------
+# Tirage
+# -------------------------------------------------
+def test_quotas_satisfied(index):
+    quotas = [Quota(4, niveau="N1"), Quota(3, domaine="Art", niveau="N2"),
+              Quota(2, domaine="Sciences")]
+    for _ in range(50):
+        out = stratified_draw(index, 15, quotas)
+        keys = _keys(index, out)
+        assert len(out) == len(set(out)) == 15
+        assert sum(lv == "1" for _, lv in keys) >= 4
+        assert keys.count(("art", "2")) >= 3
+        assert sum(d == "sciences" for d, _ in keys) >= 2
+
+
+def test_min_per_domain_and_level(index):
+    for _ in range(50):
+        # 4 × 2 + 5 × 1 <= 15 : les deux minimums tiennent ensemble
+        keys = _keys(index, stratified_draw(index, 15, min_per_domain=2,
+                                            min_per_level=1))
+        domains = Counter(d for d, _ in keys)
+        levels = Counter(lv for _, lv in keys)
+        assert all(domains[d.casefold()] >= 2 for d in DOMAINS)
+        assert set(levels) == {"1", "2", "3", "4", "5"}
+
+
+def test_unsatisfiable_quota_takes_what_exists(index):
+    quotas = [Quota(5, niveau="N5"), Quota(3, domaine="Inconnu")]
+    out = stratified_draw(index, 15, quotas)
+    keys = _keys(index, out)
+    # les 2 seules N5, le reste complété au hasard
+    assert len(out) == len(set(out)) == 15
+    assert sum(lv == "5" for _, lv in keys) == 2
+
+
+def test_quotas_capped_by_count(index):
+    out = stratified_draw(index, 4, [Quota(10, niveau="N1")])
+    assert len(out) == 4
+    assert all(lv == "1" for _, lv in _keys(index, out))
+    assert len(stratified_draw(index, 500)) == index.size
+
+
+def test_exclude_served_first_then_completed(index):
+    unseen = set(random.sample(range(index.size), 6))
+    out = stratified_draw(index, 10, exclude=lambda i: i not in unseen)
+    assert unseen <= set(out)
+    assert len(out) == len(set(out)) == 10
+
+
+# -------------------------------------------------
+# Rejet aléatoire -> parcours
+# -------------------------------------------------
+def test_rejection_fallback_finds_last_positions():
+    pool = list(range(1000))
+    chosen = set(range(1000)) - {17, 503, 998}
+    out = []
+    # 3 restants sur 1000 : les essais aléatoires ne suffisent pas
+    assert sample_into(pool, 5, chosen, out) == 3
+    assert sorted(out) == [17, 503, 998]
+
+
+def test_rejection_fallback_with_exclude():
+    unseen = {5, 640, 999}
+    out = []
+    added = sample_into(None, 10, set(), out, size=1000,
+                        exclude=lambda i: i not in unseen)
+    assert added == 3 and set(out) == unseen
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Token buckets partagés — recharge, verrou fichier, délestage
+============================================================
+Sans réseau : les buckets vivent dans un dossier temporaire.
+
+    python -m pytest -q test_rate_limit.py
+"""
+
+import multiprocessing
+import time
+
+import pytest
+
+import rate_limit
+from rate_limit import RateLimited, TokenBucket
+
+needs_flock = pytest.mark.skipif(rate_limit.fcntl is None,
+                                 reason="flock indisponible")
+
+
+def test_refill_after_burst():
+    b = TokenBucket("refill", rate=10, burst=2)
+    assert b.reserve(0) == 0
+    assert b.reserve(0) == 0
+    with pytest.raises(RateLimited) as exc:
+        b.reserve(0)
+    assert 0.05 < exc.value.retry_after <= 0.1
+
+    time.sleep(0.12)
+    assert b.reserve(0) == 0
+
+
+def test_queue_waits_for_slot():
+    b = TokenBucket("queue", rate=20, burst=1)
+    t0 = time.monotonic()
+    waits = [b.acquire(1.0) for _ in range(5)]
+    assert waits[0] == 0
+    # 4 créneaux de 50 ms après le premier
+    assert time.monotonic() - t0 >= 0.18
+
+
+def _drain(state_dir, n, out):
+    b = TokenBucket("shared", rate=20, burst=1, state_dir=state_dir)
+    for _ in range(n):
+        b.acquire(5.0)
+        out.put(time.time())
+
+
+@needs_flock
+def test_file_bucket_shared_across_processes(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    procs = [
+        ctx.Process(target=_drain, args=(str(tmp_path), 10, out))
+        for _ in range(2)
+    ]
+    for p in procs:
+        p.start()
+    stamps = sorted(out.get(timeout=10) for _ in range(20))
+    for p in procs:
+        p.join(5)
+
+    # 20 appels à 20/s à deux : ~0.95 s ; un bucket par process ferait
+    # moitié moins
+    assert stamps[-1] - stamps[0] >= 0.85
+
+
+@needs_flock
+def test_shed_when_other_process_drained(tmp_path):
+    a = TokenBucket("shed", rate=1, burst=2, state_dir=str(tmp_path))
+    a.reserve(0)
+    a.reserve(0)
+
+    def other(out):
+        b = TokenBucket("shed", rate=1, burst=2, state_dir=str(tmp_path))
+        try:
+            b.reserve(0)
+            out.put(None)
+        except RateLimited as e:
+            out.put(e.retry_after)
+
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    p = ctx.Process(target=other, args=(out, ))
+    p.start()
+    retry_after = out.get(timeout=5)
+    p.join(5)
+    assert retry_after is not None and 0 < retry_after <= 1.0
+
+
+def test_penalize_blocks_everyone():
+    b = TokenBucket("penalty", rate=100, burst=5)
+    b.penalize(retry_after=0.3)
+    with pytest.raises(RateLimited) as exc:
+        b.reserve(0.1)
+    assert exc.value.retry_after > 0.2
+
+    b.reward()
+    assert b.acquire(0.5) >= 0.2
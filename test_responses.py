@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Corps JSON pré-encodés — assemblage des fragments et compression
+================================================================
+/questions/random et /ritual/bootstrap joignent les fragments encodés au
+chargement de la banque : le JSON décodé doit rester celui de l'ancien
+jsonify, quelle que soit la négociation Accept-Encoding.
+
+    python -m pytest -q test_responses.py
+"""
+
+import gzip
+import json
+import zlib
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def fixed_draw(client, monkeypatch):
+    bank = server.QUESTION_BANK
+    positions = [3, 0, 41, 7, 118, 12, 5, 64, 99, 2]
+
+    def draw_positions(count, **options):
+        return bank._questions, positions[:count]
+
+    monkeypatch.setattr(bank, "draw_positions", draw_positions)
+    return [bank._questions[i] for i in positions]
+
+
+def _decoded(resp):
+    data = resp.get_data()
+    encoding = resp.headers.get("Content-Encoding")
+    if encoding == "gzip":
+        data = gzip.decompress(data)
+    elif encoding == "deflate":
+        data = zlib.decompress(data)
+    else:
+        assert encoding is None
+    return json.loads(data)
+
+
+def test_fragments_match_jsonify_shape(client, fixed_draw):
+    resp = client.get("/questions/random?count=10")
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/json"
+    # ce que renvoyait jsonify({"count": ..., "questions": [dicts]})
+    expected = json.loads(
+        server.app.json.dumps({"count": 10, "questions": fixed_draw}))
+    assert _decoded(resp) == expected
+    assert [set(q) for q in expected["questions"]] == [{
+        "id", "question", "options", "correct_index", "explanation",
+        "domaine", "niveau"
+    }] * 10
+
+
+@pytest.mark.parametrize("accept, encoding", [
+    ("gzip", "gzip"),
+    ("gzip, deflate, br", "gzip"),
+    ("deflate", "deflate"),
+    ("gzip;q=0, deflate", "deflate"),
+    ("br", None),
+    ("identity", None),
+    (None, None),
+])
+def test_accept_encoding_negotiation(client, fixed_draw, accept, encoding):
+    headers = {"Accept-Encoding": accept} if accept else {}
+    resp = client.get("/questions/random?count=10", headers=headers)
+    assert resp.headers.get("Content-Encoding") == encoding
+    assert resp.headers["Vary"] == "Accept-Encoding"
+    assert _decoded(resp)["questions"][0] == json.loads(
+        server.app.json.dumps(fixed_draw[0]))
+
+
+def test_small_body_not_compressed(client, monkeypatch):
+    monkeypatch.setattr(server, "RESPONSE_COMPRESS_MIN_BYTES", 1 << 20)
+    resp = client.get("/questions/random?count=10",
+                      headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in resp.headers
+    assert resp.headers["Vary"] == "Accept-Encoding"
+    assert len(_decoded(resp)["questions"]) == 10
+
+
+def test_bootstrap_merges_meta_and_fragments(client, fixed_draw):
+    resp = client.post("/ritual/bootstrap",
+                       json={"telegram_user_id": "417", "count": 10},
+                       headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    body = _decoded(resp)
+    assert body["ok"] is True and body["attempt_id"]
+    assert body["count"] == 10
+    assert body["questions"] == json.loads(server.app.json.dumps(fixed_draw))
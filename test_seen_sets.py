@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Questions déjà vues par joueur — ordre, remise à zéro, concurrence
+==================================================================
+
+    python -m pytest -q test_seen_sets.py
+"""
+
+import random
+import threading
+
+import pytest
+
+from question_bank import QuestionBank
+from seen_sets import PlayerSeen, SeenQuestions
+
+
+def _bank(ids):
+    records = [{
+        "fields": {
+            "ID_question": qid,
+            "Question": f"q{n}",
+            "Options (JSON)": ["A", "B"],
+            "Correct_index": 0,
+            "Domaine": "Art",
+            "Niveau": "N1",
+        }
+    } for n, qid in enumerate(ids)]
+    bank = QuestionBank(lambda offset=None: (records, None),
+                        seen=SeenQuestions())
+    bank.load()
+    return bank
+
+
+@pytest.fixture(autouse=True)
+def _seed():
+    random.seed(11)
+
+
+def test_unseen_first_then_reset_when_exhausted():
+    bank = _bank([f"Q{i}" for i in range(30)])
+    draws = [{q["id"] for q in bank.draw(10, player_id="7")}
+             for _ in range(3)]
+    assert set.union(*draws) == {f"Q{i}" for i in range(30)}
+
+    # tout vu : nouveau cycle au lieu de resservir les mêmes restes
+    fourth = bank.draw(10, player_id="7")
+    assert len({q["id"] for q in fourth}) == 10
+    seen, _ = bank.seen.for_player("7", bank._index_for(bank._questions), 0)
+    assert seen.count == 10
+
+    # autre joueur : historique séparé
+    assert len(bank.draw(10, player_id="8")) == 10
+
+
+def test_questions_without_id_never_share_a_slot():
+    bank = _bank(["Q1", "Q2", None, "", None, "Q3"])
+    index = bank._index_for(bank._questions)
+    _, slots = bank.seen.for_player("7", index, 0)
+    assert [s is None for s in slots] == [False, False, True, True, True,
+                                         False]
+
+    bank.draw(3, player_id="7")
+    seen, _ = bank.seen.for_player("7", index, 0)
+    assert seen.count <= 3
+    assert not seen.has(None)
+
+
+def test_concurrent_draws_keep_every_bit():
+    bank = _bank([f"Q{i}" for i in range(1000)])
+    drawn, lock = [], threading.Lock()
+
+    def player():
+        for _ in range(20):
+            ids = [q["id"] for q in bank.draw(2, player_id="9")]
+            with lock:
+                drawn.extend(ids)
+
+    threads = [threading.Thread(target=player) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    seen, _ = bank.seen.for_player("9", bank._index_for(bank._questions), 0)
+    assert seen.count == len(set(drawn))
+
+
+def test_player_seen_bits():
+    seen = PlayerSeen()
+    for slot in (0, 7, 8, 100):
+        seen.add(slot)
+    seen.add(7)
+    assert seen.count == 4
+    assert [seen.has(s) for s in (0, 1, 7, 8, 99, 100, 5000)] == [
+        True, False, True, True, False, True, False
+    ]
+    seen.reset()
+    assert seen.count == 0 and not seen.has(0)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tracing — spans par étape et en-tête Server-Timing
+==================================================
+Spans imbriqués et concurrents via fanout.run_stages (copie du contexte),
+no-op hors requête tracée, en-tête Server-Timing des routes /ritual/*
+(upstreams servis par standin_server, conftest.py).
+
+    python -m pytest -q test_tracing.py
+"""
+
+import re
+import threading
+
+import pytest
+
+import tracing
+from fanout import run_stages
+
+import server
+from test_call_budgets import completion_payload
+
+# RFC 8673 : metric *( ";" param ), metrics séparées par ", "
+_ENTRY_RE = re.compile(r"^[A-Za-z0-9_.-]+;dur=\d+\.\d$")
+
+
+def _entries(header):
+    """Server-Timing -> [(nom, ms)] en validant chaque entrée."""
+    out = []
+    for part in header.split(", "):
+        assert _ENTRY_RE.match(part), header
+        name, dur = part.split(";dur=")
+        out.append((name, float(dur)))
+    return out
+
+
+@pytest.fixture
+def trace():
+    token = tracing.start()
+    try:
+        yield tracing.current()
+    finally:
+        tracing.finish(token)
+
+
+def test_span_is_noop_outside_a_trace():
+    assert tracing.current() is None
+    with tracing.span("background"):
+        pass
+
+    # thread de fond (worker write-behind) lancé pendant une requête :
+    # contexte neuf, donc pas de trace
+    token = tracing.start()
+    seen = []
+    t = threading.Thread(target=lambda: seen.append(tracing.current()))
+    t.start()
+    t.join()
+    trace = tracing.finish(token)
+    assert seen == [None] and trace.spans == []
+    assert tracing.current() is None
+
+
+def test_nested_spans(trace):
+    with tracing.span("outer"):
+        with tracing.span("inner"):
+            pass
+    # fermeture dans l'ordre : l'étape interne d'abord
+    assert [n for n, _ in trace.spans] == ["inner", "outer"]
+    assert trace.spans[1][1] >= trace.spans[0][1]
+
+
+def test_run_stages_records_concurrent_and_nested_spans(trace):
+    barrier = threading.Barrier(2, timeout=5)
+
+    def stage(inner):
+        def fn():
+            barrier.wait()  # les deux étapes tournent en même temps
+            with tracing.span(inner):
+                return threading.current_thread().name
+        return fn
+
+    results = run_stages({"a": stage("a_inner"), "b": stage("b_inner")},
+                         max_in_flight=2)
+    assert results["a"] != results["b"]  # deux threads du pool
+    assert sorted(n for n, _ in trace.spans) == ["a", "a_inner", "b",
+                                                 "b_inner"]
+    # chaque étape voit la trace de la requête qui l'a lancée
+    assert run_stages({"probe": tracing.current}) == {"probe": trace}
+
+
+def test_server_timing_format(trace):
+    trace.spans.append(("player upsert/é", 84.23))
+    trace.spans.append(("draw", 1.0))
+    entries = _entries(tracing.server_timing(trace))
+    assert [n for n, _ in entries] == ["player_upsert__", "draw", "total"]
+    assert entries[0][1] == 84.2
+
+
+# -------------------------------------------------
+# En-têtes des routes Flask
+# -------------------------------------------------
+def _stage_names(resp):
+    assert resp.headers["Timing-Allow-Origin"] == "*"
+    entries = _entries(resp.headers["Server-Timing"])
+    assert entries[-1][0] == "total"
+    assert all(ms <= entries[-1][1] for _, ms in entries)
+    return {n for n, _ in entries}
+
+
+def test_ritual_start_header(client):
+    server.PLAYER_ID_CACHE.clear()
+    resp = client.post("/ritual/start", json={"telegram_user_id": "707"})
+    assert resp.status_code == 200
+    assert {"player_upsert", "attempt_create"} <= _stage_names(resp)
+
+
+def test_ritual_bootstrap_header(client):
+    resp = client.post("/ritual/bootstrap",
+                       json={"telegram_user_id": "708", "count": 15})
+    assert resp.status_code == 200
+    # étapes du fan-out et spans imbriqués dans leurs threads
+    assert {"questions", "attempt", "player_upsert",
+            "attempt_create"} <= _stage_names(resp)
+
+
+def test_questions_random_header(client):
+    resp = client.get("/questions/random?count=15")
+    assert resp.status_code == 200
+    assert {"bank_ready", "draw"} <= _stage_names(resp)
+
+
+def test_ritual_complete_headers(client, monkeypatch):
+    start = client.post("/ritual/start",
+                        json={"telegram_user_id": "709"}).get_json()
+    payload = completion_payload(client, "709", start["attempt_id"])
+    resp = client.post("/ritual/complete", json=payload)
+    assert resp.status_code == 202
+    assert {"dedupe", "enqueue"} <= _stage_names(resp)
+
+    monkeypatch.setattr(server, "WRITE_BEHIND_ENABLED", False)
+    start = client.post("/ritual/start",
+                        json={"telegram_user_id": "710"}).get_json()
+    payload = completion_payload(client, "710", start["attempt_id"])
+    resp = client.post("/ritual/complete", json=payload)
+    assert resp.status_code == 200, resp.get_json()
+    assert {"dedupe", "player_upsert", "payload", "attempt", "answers",
+            "notion"} <= _stage_names(resp)
+
+
+def test_untraced_route_has_no_header(client):
+    resp = client.get("/health")
+    assert "Server-Timing" not in resp.headers
+    assert tracing.current() is None  # trace libérée en fin de requête
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Logging non bloquant — formatage paresseux, handlers, arrêt
+===========================================================
+
+    python -m pytest -q test_velvet_log.py
+"""
+
+import logging
+import os
+import queue
+import subprocess
+import sys
+import textwrap
+
+import velvet_log
+
+
+def _record(msg, args):
+    return logging.LogRecord("velvet.test", logging.INFO, __file__, 1, msg,
+                             args, None)
+
+
+def test_mutable_args_snapshot_in_caller_thread():
+    handler = velvet_log._LazyQueueHandler(queue.SimpleQueue())
+    rows = [1, 2]
+    record = handler.prepare(_record("rows=%s state=%s", (rows, {"k": 1})))
+    rows.append(3)
+    assert record.getMessage() == "rows=[1, 2] state={'k': 1}"
+
+
+def test_immutable_args_stay_lazy():
+    handler = velvet_log._LazyQueueHandler(queue.SimpleQueue())
+    record = handler.prepare(_record("%s/%d %s", ("a", 2, (None, 1.5))))
+    assert record.msg == "%s/%d %s" and record.args == ("a", 2, (None, 1.5))
+
+
+SCRIPT = textwrap.dedent("""
+    import io, logging, sys
+
+    captured = io.StringIO()
+    sys.stderr = captured  # flux de capture actif à l'import (pytest)
+    import velvet_log
+
+    foreign = logging.StreamHandler(io.StringIO())
+    logging.getLogger().addHandler(foreign)
+    velvet_log.setup()
+    assert foreign in logging.getLogger().handlers
+
+    sys.stderr = sys.__stderr__
+    captured.close()
+    logging.getLogger("velvet.test").warning("after %s", "close")
+""")
+
+
+def test_setup_keeps_host_handlers_and_follows_stderr():
+    proc = subprocess.run([sys.executable, "-c", SCRIPT],
+                          capture_output=True, text=True, timeout=30,
+                          cwd=os.path.dirname(os.path.abspath(velvet_log.__file__)))
+    assert proc.returncode == 0, proc.stderr
+    # écrit sur le stderr courant, vidé par l'atexit, sans erreur de flux
+    assert "after close" in proc.stderr
+    assert "closed file" not in proc.stderr
+    assert "Traceback" not in proc.stderr
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Assets WebApp — empreintes, réécriture des références, cache HTTP
+=================================================================
+
+    python -m pytest -q test_webapp_assets.py
+"""
+
+import gzip
+import re
+
+import pytest
+
+import webapp_assets
+from webapp_assets import AssetManifest
+
+INDEX = """<!doctype html>
+<link rel="stylesheet" href="./style.css" />
+<script src="https://telegram.org/js/telegram-web-app.js"></script>
+<img src='logo.svg'><img src="xlogo.svg">
+<script src="./app.js"></script>
+"""
+STYLE = """@font-face { src: url("Font.otf"); }
+@font-face { src: url('Font-Bold.otf'); }
+@font-face { src: url( ./Font-Light.otf ); }
+body { background: url(logo.svg); }
+"""
+
+
+@pytest.fixture
+def webapp(tmp_path):
+    files = {
+        "index.html": INDEX,
+        "style.css": STYLE,
+        "app.js": "console.log('velvet');\n" * 50,
+        "logo.svg": "<svg/>",
+        "Font.otf": "otf-regular",
+        "Font-Bold.otf": "otf-bold",
+        "Font-Light.otf": "otf-light",
+    }
+    for name, text in files.items():
+        (tmp_path / name).write_text(text, encoding="utf-8")
+    (tmp_path / ".DS_Store").write_bytes(b"\0")
+    return tmp_path
+
+
+def test_fingerprinted_names(webapp):
+    m = AssetManifest(str(webapp))
+    assert set(m.by_name) == {"style.css", "app.js", "logo.svg", "Font.otf",
+                              "Font-Bold.otf", "Font-Light.otf"}
+    for name, asset in m.by_name.items():
+        stem, ext = name.rsplit(".", 1)
+        assert re.fullmatch(re.escape(stem) + r"\.[0-9a-f]{12}\." + ext,
+                            asset.hashed_name)
+        assert m.get(asset.hashed_name) is asset
+
+    # même contenu -> mêmes noms et même version ; sinon tout change
+    again = AssetManifest(str(webapp))
+    assert again.version == m.version
+    (webapp / "app.js").write_text("changed", encoding="utf-8")
+    changed = AssetManifest(str(webapp))
+    assert changed.version != m.version
+    assert (changed.by_name["app.js"].hashed_name !=
+            m.by_name["app.js"].hashed_name)
+    assert (changed.by_name["logo.svg"].hashed_name ==
+            m.by_name["logo.svg"].hashed_name)
+
+
+def test_html_references_rewritten(webapp):
+    m = AssetManifest(str(webapp))
+    html = m.index.variants[None].decode("utf-8")
+    hashed = {n: a.hashed_name for n, a in m.by_name.items()}
+    assert f'href="assets/{hashed["style.css"]}"' in html
+    assert f'src="assets/{hashed["app.js"]}"' in html
+    assert f"src='assets/{hashed['logo.svg']}'" in html
+    # URL externe et nom qui ne fait que contenir un asset : intacts
+    assert "https://telegram.org/js/telegram-web-app.js" in html
+    assert 'src="xlogo.svg"' in html
+
+
+def test_css_urls_rewritten(webapp):
+    m = AssetManifest(str(webapp))
+    css = m.by_name["style.css"].variants[None].decode("utf-8")
+    hashed = {n: a.hashed_name for n, a in m.by_name.items()}
+    assert f'url("{hashed["Font.otf"]}")' in css
+    assert f"url('{hashed['Font-Bold.otf']}')" in css
+    assert f'url({hashed["Font-Light.otf"]})' in css
+    assert f'url({hashed["logo.svg"]})' in css
+
+
+# -------------------------------------------------
+# HTTP (webapp/ du dépôt)
+# -------------------------------------------------
+@pytest.fixture
+def served(client):
+    return client, webapp_assets.manifest()
+
+
+def test_index_no_cache_with_etag(served):
+    client, m = served
+    resp = client.get("/webapp/")
+    assert resp.status_code == 200
+    assert resp.headers["Cache-Control"] == "no-cache"
+    etag = resp.headers["ETag"]
+    html = resp.get_data(as_text=True)
+    assert f'assets/{m.by_name["app.js"].hashed_name}' in html
+
+    resp = client.get("/webapp/", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+
+def test_assets_immutable_and_conditional(served):
+    client, m = served
+    asset = m.by_name["app.js"]
+    path = f"/webapp/assets/{asset.hashed_name}"
+    resp = client.get(path)
+    assert resp.status_code == 200
+    assert resp.headers["Cache-Control"] == \
+        "public, max-age=31536000, immutable"
+    assert resp.headers["Vary"] == "Accept-Encoding"
+    assert resp.get_data() == asset.variants[None]
+
+    resp = client.get(path, headers={"If-None-Match": resp.headers["ETag"]})
+    assert resp.status_code == 304
+
+    resp = client.get(path, headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(resp.get_data()) == asset.variants[None]
+
+
+@pytest.mark.parametrize("name", ["app.js", "app.000000000000.js",
+                                  "..%2Fserver.py"])
+def test_unknown_asset_404(client, name):
+    assert client.get(f"/webapp/assets/{name}").status_code == 404
+
+
+def test_audio_range_request(served):
+    client, m = served
+    asset = m.by_name["tick-soft.mp3"]
+    resp = client.get(f"/webapp/assets/{asset.hashed_name}",
+                      headers={"Range": "bytes=0-99"})
+    assert resp.status_code == 206
+    assert resp.get_data() == asset.variants[None][:100]
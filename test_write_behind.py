@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Journal write-behind — claim / finish / bail
+============================================
+Sans réseau : handlers locaux sur un journal SQLite temporaire.
+
+    python -m pytest -q test_write_behind.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from write_behind import PermanentFailure, RetryLater, WriteBehindQueue
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "wb.sqlite3")
+
+
+def _queue(db, **kwargs):
+    kwargs.setdefault("base_delay", 0.0)
+    return WriteBehindQueue(db, **kwargs)
+
+
+def test_claim_and_finish(db):
+    q = _queue(db)
+    q.register("echo", lambda payload, job: {"seen": payload["x"]})
+    receipt = q.enqueue("echo", {"x": 1})
+
+    assert q.run_one()
+    assert not q.run_one()
+    st = q.status(receipt)
+    assert st["status"] == "done"
+    assert st["jobs"][0]["result"] == {"seen": 1}
+    assert st["jobs"][0]["attempts"] == 1
+
+
+def test_spawned_jobs_share_receipt(db):
+    q = _queue(db)
+
+    def parent(payload, job):
+        job.spawn("child", {"n": 1})
+        job.spawn("child", {"n": 2})
+        return {}
+
+    q.register("parent", parent)
+    q.register("child", lambda payload, job: payload)
+    receipt = q.enqueue("parent", {})
+    while q.run_one():
+        pass
+
+    st = q.status(receipt)
+    assert st["status"] == "done"
+    assert [j["kind"] for j in st["jobs"]] == ["parent", "child", "child"]
+
+
+def test_retry_then_dead(db):
+    q = _queue(db, max_attempts=2)
+    calls = []
+
+    def flaky(payload, job):
+        calls.append(payload)
+        raise RetryLater("429", payload={"rows": payload["rows"][1:]})
+
+    q.register("flaky", flaky)
+    receipt = q.enqueue("flaky", {"rows": [1, 2, 3]})
+    assert q.run_one() and q.run_one()
+    assert not q.run_one()
+
+    # la 2e tentative ne reçoit que le payload réduit
+    assert calls == [{"rows": [1, 2, 3]}, {"rows": [2, 3]}]
+    st = q.status(receipt)
+    assert st["status"] == "failed"
+    assert st["jobs"][0]["attempts"] == 2
+
+
+def test_permanent_failure(db):
+    q = _queue(db)
+
+    def broken(payload, job):
+        raise PermanentFailure("missing_airtable_env")
+
+    q.register("broken", broken)
+    receipt = q.enqueue("broken", {})
+    q.run_one()
+    assert q.status(receipt)["jobs"][0]["status"] == "dead"
+
+
+def test_expired_lease_is_reclaimed_and_fenced(db):
+    q = _queue(db, lease_seconds=0.05)
+    q.register("echo", lambda payload, job: {"by": "second"})
+    receipt = q.enqueue("echo", {})
+
+    # worker mort après le claim : ni finish ni renouvellement du bail
+    row = q._claim()
+    assert row is not None
+    time.sleep(0.1)
+
+    assert q.run_one()
+    st = q.status(receipt)["jobs"][0]
+    assert st["status"] == "done" and st["attempts"] == 2
+
+    # l'ancien propriétaire se réveille : sa clôture est refusée
+    from write_behind import Job
+    stale = Job(row["id"], row["receipt"], row["kind"], row["attempts"] + 1)
+    assert not q._finish(stale, "dead", error="late")
+    assert q.status(receipt)["jobs"][0]["result"] == {"by": "second"}
+
+
+def test_lease_extended_while_handler_runs(db):
+    q = _queue(db, lease_seconds=0.3)
+    other = _queue(db, lease_seconds=0.3)  # autre worker, même journal
+    started = threading.Event()
+
+    def slow(payload, job):
+        started.set()
+        time.sleep(1.0)  # > 3 baux : attente rate limit / 429
+        return {"ok": True}
+
+    q.register("slow", slow)
+    other.register("slow", slow)
+    receipt = q.enqueue("slow", {})
+    t = threading.Thread(target=q.run_one)
+    t.start()
+    started.wait(1)
+
+    time.sleep(0.6)
+    assert other._claim() is None
+    t.join()
+    st = q.status(receipt)["jobs"][0]
+    assert st["status"] == "done" and st["attempts"] == 1
@@ -0,0 +1,81 @@
+# tracing.py — spans par étape de requête -> en-tête Server-Timing
+# -----------------------------------------------------
+# - Une trace par requête Flask, portée par un contextvar (les étapes
+#   lancées via fanout.run_stages copient le contexte et y écrivent)
+# - `with span("player_upsert"):` : no-op hors requête tracée (workers
+#   write-behind, threads de fond)
+# - En sortie : `Server-Timing: player_upsert;dur=84.2, ..., total;dur=…`
+#   (lisible dans l'onglet Network / performance.getEntries() de la WebApp)
+# - TRACE_LOG=1 : une ligne JSON par requête tracée (logger velvet.trace)
+
+import contextvars
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("velvet.trace")
+
+TRACE_LOG = os.getenv("TRACE_LOG", "0").strip() in ("1", "true", "yes")
+
+_trace = contextvars.ContextVar("velvet_trace", default=None)
+
+_TOKEN_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class Trace:
+    __slots__ = ("t0", "spans")
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.spans = []  # (nom, durée ms) ; append atomique entre threads
+
+    def total_ms(self):
+        return (time.perf_counter() - self.t0) * 1000.0
+
+
+def start():
+    """Démarre la trace de la requête courante ; renvoie le token à passer
+    à `finish`."""
+    return _trace.set(Trace())
+
+
+def current():
+    return _trace.get()
+
+
+def finish(token):
+    trace = _trace.get()
+    _trace.reset(token)
+    return trace
+
+
+@contextmanager
+def span(name):
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, (time.perf_counter() - t0) * 1000.0))
+
+
+def server_timing(trace):
+    """Valeur de l'en-tête Server-Timing (spans + total)."""
+    parts = [f"{_TOKEN_RE.sub('_', name)};dur={ms:.1f}"
+             for name, ms in trace.spans]
+    parts.append(f"total;dur={trace.total_ms():.1f}")
+    return ", ".join(parts)
+
+
+def log_line(trace, **fields):
+    if not TRACE_LOG:
+        return
+    fields["total_ms"] = round(trace.total_ms(), 1)
+    fields["spans"] = [[name, round(ms, 1)] for name, ms in trace.spans]
+    logger.info(json.dumps(fields, ensure_ascii=False, separators=(",", ":")))
@@ -0,0 +1,455 @@
+# upstream.py — client HTTP partagé (Airtable / Notion)
+# -----------------------------------------------------
+# - Une requests.Session par host : pool de connexions keep-alive,
+#   plus de handshake TCP/TLS à chaque appel
+# - Taille des pools configurable par worker gunicorn
+#   (UPSTREAM_POOL_CONNECTIONS / UPSTREAM_POOL_MAXSIZE)
+# - Stats de timing par appel, agrégées par (host, méthode)
+# - Métriques Prometheus (metrics.py) par (service, table, verbe) : appels
+#   par classe de réponse (2xx / 4xx / 429 / 5xx / error) + latence
+# - Budgets d'appels par route : `count_calls()` compte les appels faits
+#   dans le contexte courant (étapes fanout incluses), `call_budget(n)`
+#   déclare le plafond d'une route (UPSTREAM_CALL_BUDGETS=warn|enforce)
+# - Débit partagé entre process (rate_limit.py) : un bucket par base
+#   Airtable, un par intégration Notion ; 429 -> backoff commun (Retry-After)
+#   et nouvel essai. Politique par site d'appel via `rate_policy()` :
+#   "queue" (attendre un créneau, borné) ou "shed" (échouer tout de suite)
+# - Disjoncteur par service (circuit_breaker.py) : au-delà du taux d'erreur,
+#   CircuitOpen immédiat au lieu d'attendre le timeout d'un upstream mort
+#
+# Utilisé par server.py et bot.py : upstream.get/post/patch/delete ont la
+# même signature que requests.get/post/...
+
+import contextvars
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import circuit_breaker
+import metrics
+import rate_limit
+from circuit_breaker import CircuitOpen
+from rate_limit import RateLimited
+
+logger = logging.getLogger(__name__)
+
+# surchargeables pour pointer sur standin_server.py (tests de charge locaux)
+AIRTABLE_API_URL = os.getenv("AIRTABLE_API_URL",
+                             "https://api.airtable.com/v0").rstrip("/")
+NOTION_API_URL = os.getenv("NOTION_API_URL",
+                           "https://api.notion.com/v1").rstrip("/")
+
+POOL_CONNECTIONS = int(os.getenv("UPSTREAM_POOL_CONNECTIONS", "2"))
+POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", "10"))
+
+_lock = threading.Lock()
+_sessions = {}
+_sessions_pid = None
+_stats = {}
+
+UPSTREAM_CALLS = metrics.Counter(
+    "velvet_upstream_requests_total",
+    "Upstream HTTP calls by service, table, verb and response class")
+UPSTREAM_LATENCY = metrics.Histogram(
+    "velvet_upstream_request_duration_seconds",
+    "Upstream HTTP call latency by service, table and verb")
+UPSTREAM_RATE_LIMITED = metrics.Counter(
+    "velvet_upstream_rate_limited_total",
+    "Upstream calls throttled by bucket and outcome (429 / shed)")
+UPSTREAM_RATE_WAIT = metrics.Histogram(
+    "velvet_upstream_rate_wait_seconds",
+    "Time spent waiting for a rate-limit slot, by bucket")
+
+
+_adapter = None  # transport imposé (bench / tests), sinon HTTPAdapter
+
+
+def install_adapter(adapter):
+    """Remplace le transport de toutes les sessions (ex. adapter branché
+    sur standin_server.StandIn) ; None revient au réseau."""
+    global _adapter
+    with _lock:
+        _adapter = adapter
+        _sessions.clear()
+
+
+def _new_session():
+    s = requests.Session()
+    adapter = _adapter or HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                                      pool_maxsize=POOL_MAXSIZE)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def session_for(url):
+    """Session (pool keep-alive) du host de `url`, créée à la demande.
+
+    Les sessions ne survivent pas à un fork : chaque worker gunicorn
+    ouvre ses propres connexions.
+    """
+    global _sessions_pid
+    host = urlsplit(url).netloc
+    pid = os.getpid()
+    with _lock:
+        if _sessions_pid != pid:
+            _sessions.clear()
+            _sessions_pid = pid
+        s = _sessions.get(host)
+        if s is None:
+            s = _sessions[host] = _new_session()
+    return s
+
+
+def _record(host, method, elapsed_ms, status=None, error=False):
+    key = (host, method)
+    with _lock:
+        st = _stats.get(key)
+        if st is None:
+            st = _stats[key] = {
+                "calls": 0,
+                "errors": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "last_ms": 0.0,
+                "last_status": None,
+            }
+        st["calls"] += 1
+        st["total_ms"] += elapsed_ms
+        st["max_ms"] = max(st["max_ms"], elapsed_ms)
+        st["last_ms"] = elapsed_ms
+        st["last_status"] = status
+        if error or (status is not None and status >= 400):
+            st["errors"] += 1
+
+
+def service_and_table(url):
+    """("airtable", <table>) / ("notion", <ressource>) / (host, "")."""
+    for service, base in (("airtable", AIRTABLE_API_URL),
+                          ("notion", NOTION_API_URL)):
+        if url.startswith(base + "/"):
+            path = [p for p in urlsplit(url[len(base):]).path.split("/") if p]
+            if service == "airtable":
+                # <base>/<table>[/<record>]
+                return service, path[1] if len(path) > 1 else ""
+            # databases/<id>/query, pages[/<id>] : la ressource, pas l'id
+            return service, path[0] if path else ""
+    return urlsplit(url).netloc, ""
+
+
+def _response_class(status):
+    if status is None:
+        return "error"
+    if status == 429:
+        return "429"
+    return f"{status // 100}xx"
+
+
+def _observe(url, method, elapsed_ms, status=None):
+    service, table = service_and_table(url)
+    UPSTREAM_CALLS.inc(service=service, table=table, verb=method,
+                       code=_response_class(status))
+    UPSTREAM_LATENCY.observe(elapsed_ms / 1000.0, service=service, table=table,
+                             verb=method)
+
+
+# -------------------------------------------------
+# Budgets d'appels
+# -------------------------------------------------
+# off : déclaration seule (aucun coût) ; warn : log si dépassé ;
+# enforce : CallBudgetExceeded (mode test)
+CALL_BUDGETS_MODE = os.getenv("UPSTREAM_CALL_BUDGETS", "off").strip().lower()
+
+_counter = contextvars.ContextVar("upstream_call_counter", default=None)
+
+
+class CallBudgetExceeded(AssertionError):
+    pass
+
+
+class CallCounter:
+
+    def __init__(self, parent=None):
+        self.calls = []  # (service, verbe, table) ; append atomique
+        self.parent = parent  # compteur englobant (test + route)
+
+    @property
+    def total(self):
+        return len(self.calls)
+
+    def by_service(self):
+        out = {}
+        for service, _, _ in self.calls:
+            out[service] = out.get(service, 0) + 1
+        return out
+
+    def __repr__(self):
+        return f"CallCounter({self.total}: {self.calls!r})"
+
+
+@contextmanager
+def count_calls():
+    """Compte les appels upstream faits dans ce contexte (et dans les
+    étapes fanout.run_stages, qui en copient le contexte)."""
+    counter = CallCounter(_counter.get())
+    token = _counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _counter.reset(token)
+
+
+def budget_for(fn):
+    """Budget déclaré d'une vue (int) ou None."""
+    budget = getattr(fn, "upstream_call_budget", None)
+    return budget() if callable(budget) else budget
+
+
+def call_budget(max_calls):
+    """Plafond d'appels upstream d'une route, pendant la requête.
+
+    `max_calls` : int, ou callable sans argument si le budget dépend de la
+    configuration (ex. write-behind actif ou non). Les écritures
+    déléguées aux workers de fond ne comptent pas.
+    """
+
+    def decorator(fn):
+        if CALL_BUDGETS_MODE not in ("warn", "enforce"):
+            fn.upstream_call_budget = max_calls
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with count_calls() as counter:
+                result = fn(*args, **kwargs)
+            budget = budget_for(wrapper)
+            if budget is not None and counter.total > budget:
+                message = (f"{fn.__name__}: {counter.total} upstream calls "
+                           f"> budget {budget} ({counter.calls})")
+                if CALL_BUDGETS_MODE == "enforce":
+                    raise CallBudgetExceeded(message)
+                logger.warning("⚠️ call budget exceeded — %s", message)
+            return result
+
+        wrapper.upstream_call_budget = max_calls
+        return wrapper
+
+    return decorator
+
+
+# -------------------------------------------------
+# Rate limiting
+# -------------------------------------------------
+RATE_LIMIT_ENABLED = os.getenv("UPSTREAM_RATE_LIMIT", "1").strip() not in (
+    "0", "false", "FALSE", "no", "NO")
+AIRTABLE_RATE = float(os.getenv("AIRTABLE_RATE_PER_SECOND", "5"))
+NOTION_RATE = float(os.getenv("NOTION_RATE_PER_SECOND", "3"))
+RATE_MAX_WAIT = float(os.getenv("UPSTREAM_RATE_MAX_WAIT", "5"))
+RATE_RETRIES = int(os.getenv("UPSTREAM_429_RETRIES", "2"))
+RATE_DIR = os.getenv("UPSTREAM_RATE_DIR",
+                     os.path.join(tempfile.gettempdir(), "velvet_ratelimit"))
+
+QUEUE = "queue"
+SHED = "shed"
+
+_policy = contextvars.ContextVar("upstream_rate_policy", default=None)
+
+
+@contextmanager
+def rate_policy(mode, max_wait=None):
+    """Politique de débit des appels faits dans ce contexte (utilisable
+    aussi en décorateur).
+
+    - "queue" : attendre un créneau jusqu'à `max_wait` secondes (défaut
+      UPSTREAM_RATE_MAX_WAIT), 429 compris, puis RateLimited
+    - "shed" : aucun temps d'attente ; RateLimited si le bucket est vide,
+      un 429 est renvoyé tel quel à l'appelant
+    """
+    if mode not in (QUEUE, SHED):
+        raise ValueError(f"unknown rate policy {mode!r}")
+    token = _policy.set((mode, RATE_MAX_WAIT if max_wait is None else max_wait))
+    try:
+        yield
+    finally:
+        _policy.reset(token)
+
+
+def _bucket_for(url, headers):
+    if not RATE_LIMIT_ENABLED:
+        return None
+    if url.startswith(AIRTABLE_API_URL + "/"):
+        # 5 req/s par base
+        path = [p for p in urlsplit(url[len(AIRTABLE_API_URL):]).path.split("/")
+                if p]
+        if not path:
+            return None
+        return rate_limit.bucket(f"airtable-{path[0]}", AIRTABLE_RATE, RATE_DIR)
+    if url.startswith(NOTION_API_URL + "/"):
+        # ~3 req/s par intégration (= par token)
+        auth = (headers or {}).get("Authorization", "")
+        key = hashlib.sha1(auth.encode("utf-8")).hexdigest()[:12]
+        return rate_limit.bucket(f"notion-{key}", NOTION_RATE, RATE_DIR)
+    return None
+
+
+def _retry_after(resp):
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# -------------------------------------------------
+# Disjoncteurs
+# -------------------------------------------------
+CIRCUIT_ENABLED = os.getenv("CIRCUIT_BREAKER", "1").strip() not in (
+    "0", "false", "FALSE", "no", "NO")
+
+BREAKERS = {
+    service: circuit_breaker.CircuitBreaker(
+        service,
+        error_rate=float(os.getenv("CIRCUIT_ERROR_RATE", "0.5")),
+        min_calls=int(os.getenv("CIRCUIT_MIN_CALLS", "5")),
+        window=float(os.getenv("CIRCUIT_WINDOW_SECONDS", "30")),
+        open_seconds=float(os.getenv("CIRCUIT_OPEN_SECONDS", "15")))
+    for service in ("airtable", "notion")
+}
+
+
+def breaker(service):
+    return BREAKERS.get(service) if CIRCUIT_ENABLED else None
+
+
+def circuit_status():
+    return {name: b.status() for name, b in BREAKERS.items()}
+
+
+@metrics.register_collector
+def _collect_circuits():
+    for name, b in BREAKERS.items():
+        yield ("velvet_upstream_circuit_state", "gauge",
+               "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+               {"service": name}, circuit_breaker.STATE_VALUES[b.state],
+               "max")
+        yield ("velvet_upstream_circuit_opens_total", "counter",
+               "Circuit breaker openings", {"service": name}, b.opens)
+
+
+def _guarded_send(brk, method, url, **kwargs):
+    if brk is None:
+        return _send(method, url, **kwargs)
+    brk.before_call()
+    try:
+        resp = _send(method, url, **kwargs)
+    except Exception:
+        brk.record(failed=True)
+        raise
+    brk.record(failed=resp.status_code >= 500)
+    return resp
+
+
+def request(method, url, **kwargs):
+    method = method.upper()
+    brk = breaker(service_and_table(url)[0])
+    if brk is not None:
+        brk.check()  # ouvert : pas la peine d'attendre un créneau
+    bucket = _bucket_for(url, kwargs.get("headers"))
+    if bucket is None:
+        return _guarded_send(brk, method, url, **kwargs)
+
+    mode, max_wait = _policy.get() or (QUEUE, RATE_MAX_WAIT)
+    deadline = time.monotonic() + (max_wait if mode == QUEUE else 0.0)
+    resp = None
+    for _ in range(RATE_RETRIES + 1):
+        try:
+            waited = bucket.acquire(max(0.0, deadline - time.monotonic()))
+        except RateLimited:
+            if resp is not None:
+                return resp  # le 429 de l'essai précédent
+            UPSTREAM_RATE_LIMITED.inc(bucket=bucket.name, outcome="shed")
+            raise
+        if waited:
+            UPSTREAM_RATE_WAIT.observe(waited, bucket=bucket.name)
+
+        resp = _guarded_send(brk, method, url, **kwargs)
+        if resp.status_code != 429:
+            if bucket.strikes_hint:
+                bucket.reward()
+            return resp
+        UPSTREAM_RATE_LIMITED.inc(bucket=bucket.name, outcome="429")
+        delay = bucket.penalize(_retry_after(resp))
+        logger.warning("⏳ %s 429 on %s %s, backing off %.1fs", bucket.name,
+                       method, service_and_table(url)[1], delay)
+        if mode != QUEUE:
+            return resp
+    return resp
+
+
+def _send(method, url, **kwargs):
+    host = urlsplit(url).netloc
+    counter = _counter.get()
+    if counter is not None:
+        service, table = service_and_table(url)
+        call = (service, method, table)
+        while counter is not None:
+            counter.calls.append(call)
+            counter = counter.parent
+    t0 = time.perf_counter()
+    try:
+        resp = session_for(url).request(method, url, **kwargs)
+    except Exception:
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        _record(host, method, elapsed_ms, error=True)
+        _observe(url, method, elapsed_ms)
+        raise
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    _record(host, method, elapsed_ms, status=resp.status_code)
+    _observe(url, method, elapsed_ms, resp.status_code)
+    return resp
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return request("PATCH", url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
+
+
+def stats():
+    """Snapshot des stats du process : {"host METHOD": {...}}."""
+    with _lock:
+        out = {}
+        for (host, method), st in _stats.items():
+            row = dict(st)
+            row["avg_ms"] = round(st["total_ms"] / st["calls"], 2)
+            row["total_ms"] = round(st["total_ms"], 2)
+            row["max_ms"] = round(st["max_ms"], 2)
+            row["last_ms"] = round(st["last_ms"], 2)
+            out[f"{host} {method}"] = row
+        return out
@@ -0,0 +1,199 @@
+# velvet_log.py — logging structuré non bloquant (server.py / bot.py)
+# -----------------------------------------------------
+# - Un QueueHandler est ajouté au root logger (les handlers installés par
+#   l'application hôte ou pytest restent en place) : le thread appelant ne
+#   fait qu'un put() ; formatage et écriture se font dans le thread du
+#   QueueListener (relancé après un fork gunicorn, arrêté à la sortie)
+# - Formatage paresseux : le message (msg % args) n'est construit que dans
+#   le listener quand les args sont immuables (str, nombres, tuples de
+#   ceux-ci). Des args mutables (dict, list, objets) sont formatés dans le
+#   thread appelant : le listener verrait sinon leur état ultérieur.
+#   Passer les objets en args (`logger.debug("x=%s", obj)`), jamais de
+#   f-string / json.dumps côté appelant
+# - LOG_FORMAT=json : une ligne JSON par enregistrement (+ extra={"fields": {…}})
+# - Traces de debug échantillonnées (LOG_DEBUG_SAMPLE) via `debug_sampled` :
+#   gardées dans un ring buffer (LOG_RING_SIZE) consultable par les admins,
+#   écrites sur stderr seulement si LOG_LEVEL=DEBUG
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+LOG_LEVEL = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(),
+                    logging.INFO)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").strip().lower()
+LOG_DEBUG_SAMPLE = float(os.getenv("LOG_DEBUG_SAMPLE", "0.05"))
+LOG_RING_SIZE = int(os.getenv("LOG_RING_SIZE", "500"))
+
+TEXT_FORMAT = "%(asctime)s — %(name)s — %(levelname)s — %(message)s"
+
+# loggers applicatifs : "velvet.server", "velvet.bot"...
+ROOT_NAME = "velvet"
+
+
+def get_logger(name):
+    return logging.getLogger(f"{ROOT_NAME}.{name}")
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            out.update(fields)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str,
+                          separators=(",", ":"))
+
+
+class RingBufferHandler(logging.Handler):
+    """Derniers enregistrements (dicts) du process, pour /debuglog."""
+
+    def __init__(self, capacity):
+        super().__init__(logging.DEBUG)
+        self.events = deque(maxlen=max(1, capacity))
+
+    def emit(self, record):
+        try:
+            self.events.append({
+                "ts": round(record.created, 3),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": record.getMessage(),
+            })
+        except Exception:
+            self.handleError(record)
+
+    def recent(self, limit=50, min_level=logging.DEBUG):
+        items = [e for e in list(self.events)
+                 if logging.getLevelName(e["level"]) >= min_level]
+        return items[-limit:] if limit else items
+
+
+_IMMUTABLE = (str, bytes, int, float, complex, bool, type(None))
+
+
+def _frozen(value):
+    if isinstance(value, tuple):
+        return all(_frozen(v) for v in value)
+    return isinstance(value, _IMMUTABLE)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # QueueHandler.prepare formate dans le thread appelant : on garde
+        # msg / args tels quels quand ils ne peuvent plus changer, le
+        # listener formatera
+        if record.args and not _frozen(record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class _StderrHandler(logging.StreamHandler):
+    """StreamHandler sur le sys.stderr courant (résolu à chaque écriture) :
+    pas de flux fermé gardé depuis l'import (pytest, redirections)."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+
+RING = RingBufferHandler(LOG_RING_SIZE)
+
+_lock = threading.Lock()
+_queue = queue.SimpleQueue()
+_listener = None
+_listener_pid = None
+_handler = _LazyQueueHandler(_queue)
+
+
+def setup():
+    """Installe le QueueHandler sur le root logger et démarre le listener
+    du process (idempotent, relancé après un fork)."""
+    global _listener, _listener_pid
+    pid = os.getpid()
+    if _listener_pid == pid:
+        return
+    with _lock:
+        if _listener_pid == pid:
+            return
+        console = _StderrHandler()
+        console.setLevel(LOG_LEVEL)
+        console.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else
+                             logging.Formatter(TEXT_FORMAT))
+
+        root = logging.getLogger()
+        if _handler not in root.handlers:
+            root.addHandler(_handler)
+        root.setLevel(LOG_LEVEL)
+        # le ring buffer reçoit le debug applicatif même si stderr est à INFO
+        if LOG_RING_SIZE > 0 and LOG_DEBUG_SAMPLE > 0:
+            logging.getLogger(ROOT_NAME).setLevel(logging.DEBUG)
+
+        # thread du listener perdu au fork : on en démarre un neuf
+        _listener = logging.handlers.QueueListener(_queue, console, RING,
+                                                   respect_handler_level=True)
+        _listener.start()
+        _listener_pid = pid
+
+
+@atexit.register
+def shutdown():
+    """Vide la file et arrête le listener du process (avant
+    logging.shutdown, qui ferme les handlers)."""
+    global _listener, _listener_pid
+    with _lock:
+        if _listener is None or _listener_pid != os.getpid():
+            return
+        logging.getLogger().removeHandler(_handler)
+        _listener.stop()
+        _listener = None
+        _listener_pid = None
+
+
+def sampled(logger):
+    """True si cette trace de debug doit être émise (niveau + échantillon).
+    À tester avant de calculer des arguments coûteux."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    return LOG_DEBUG_SAMPLE >= 1.0 or random.random() < LOG_DEBUG_SAMPLE
+
+
+def debug_sampled(logger, msg, *args, **kwargs):
+    """logger.debug échantillonné : ni enregistrement ni formatage pour les
+    traces écartées."""
+    if sampled(logger):
+        logger.debug(msg, *args, **kwargs)
+
+
+def recent_events(limit=50, min_level="DEBUG"):
+    level = logging.getLevelName(str(min_level).upper())
+    if not isinstance(level, int):
+        level = logging.DEBUG
+    return RING.recent(limit, level)
+
+
+def format_events(events):
+    return "\n".join(
+        f"{time.strftime('%H:%M:%S', time.gmtime(e['ts']))} {e['level'][0]} "
+        f"{e['logger']} — {e['msg']}" for e in events)
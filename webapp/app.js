@@ -310,6 +310,18 @@ function buildApiHeaders(){
   return headers;
 }
 
+/** détail des étapes backend (en-tête Server-Timing) dans la console */
+function logServerTiming(label, r){
+  const st = r?.headers?.get?.("Server-Timing");
+  if (st) console.log(`⏱️ ${label} Server-Timing →`, st);
+}
+
+/** questions servies depuis la dernière banque connue (Airtable KO côté serveur) */
+function logStaleQuestions(label, r){
+  if (r?.headers?.get?.("X-Questions-Stale") !== "1") return;
+  console.warn(`⚠️ ${label} questions servies en cache (âge ${r.headers.get("X-Questions-Age")}s)`);
+}
+
 /** tente de créer un attempt côté backend (visible dans Network) */
 async function ensureAttemptStarted(){
   if (ritualAttemptId) return ritualAttemptId;
@@ -325,6 +337,7 @@ async function ensureAttemptStarted(){
   try {
     console.log("🟡 HTTP /ritual/start →", url);
     const r = await fetch(url, { method: "POST", headers: buildApiHeaders(), body: JSON.stringify(body), cache: "no-store" });
+    logServerTiming("/ritual/start", r);
     if (!r.ok) throw new Error(`HTTP ${r.status}`);
     const data = await r.json();
     const attempt = data?.attempt_id || data?.attemptId || data?.id || "";
@@ -372,6 +385,7 @@ async function postRitualComplete(payload){
     cache: "no-store",
     keepalive: true
   });
+  logServerTiming("/ritual/complete", r);
 
   let respText = "";
   try { respText = await r.text(); } catch(e){}
@@ -431,7 +445,10 @@ async function fetchQuestionsFromAPI(){
     throw new Error("API_MISSING: QUESTIONS_API_URL non défini");
   }
 
-  const url = `${QUESTIONS_API_URL}/questions/random?count=${encodeURIComponent(QUESTIONS_COUNT)}&t=${Date.now()}`;
+  // telegram_user_id : le backend évite de resservir des questions déjà vues
+  const tgUserId = getTelegramUserId();
+  const userParam = tgUserId ? `&telegram_user_id=${encodeURIComponent(tgUserId)}` : "";
+  const url = `${QUESTIONS_API_URL}/questions/random?count=${encodeURIComponent(QUESTIONS_COUNT)}${userParam}&t=${Date.now()}`;
 
   const initData = tg?.initData || "";
   const headers = { "Accept": "application/json" };
@@ -440,9 +457,15 @@ async function fetchQuestionsFromAPI(){
   console.log("API URL utilisée →", url);
 
   const r = await fetch(url, { method: "GET", headers, cache: "no-store" });
+  logServerTiming("/questions/random", r);
+  logStaleQuestions("/questions/random", r);
   if (!r.ok) throw new Error(`API HTTP ${r.status}`);
 
-  const data = await r.json();
+  return parseQuestionsPayload(await r.json());
+}
+
+/** valide + normalise la liste de questions renvoyée par l'API */
+function parseQuestionsPayload(data){
   const arr = data?.questions || data?.items || data || [];
   if (!Array.isArray(arr) || arr.length < 1) throw new Error("API: aucune question");
 
@@ -458,6 +481,45 @@ async function fetchQuestionsFromAPI(){
   return picked;
 }
 
+/** un seul aller-retour : joueur + attempt + questions (/ritual/bootstrap)
+ *  → false si indisponible : on retombe sur /ritual/start + /questions/random */
+async function bootstrapRitual(){
+  if (!QUESTIONS_API_URL) return false;
+
+  ritualPlayerTelegramUserId = ritualPlayerTelegramUserId || getTelegramUserId();
+
+  const url = `${QUESTIONS_API_URL}/ritual/bootstrap`;
+  const body = {
+    mode: "rituel_full_v1",
+    telegram_user_id: ritualPlayerTelegramUserId || undefined,
+    count: QUESTIONS_COUNT
+  };
+
+  try {
+    console.log("🟡 HTTP /ritual/bootstrap →", url);
+    const r = await fetch(url, { method: "POST", headers: buildApiHeaders(), body: JSON.stringify(body), cache: "no-store" });
+    logServerTiming("/ritual/bootstrap", r);
+    logStaleQuestions("/ritual/bootstrap", r);
+    if (!r.ok) throw new Error(`HTTP ${r.status}`);
+    const data = await r.json();
+
+    QUIZ_DATA = parseQuestionsPayload(data);
+    TOTAL_QUESTIONS = QUESTIONS_COUNT;
+    console.log("✅ QUIZ_DATA chargé via /ritual/bootstrap :", QUIZ_DATA.length);
+
+    if (data?.attempt_id && !ritualAttemptId) {
+      ritualAttemptId = String(data.attempt_id);
+      console.log("✅ attempt_id obtenu =", ritualAttemptId);
+    } else if (!data?.attempt_id) {
+      console.warn("⚠️ bootstrap sans attempt_id | reason:", data?.attempt_error);
+    }
+    return true;
+  } catch (e) {
+    console.warn("⚠️ /ritual/bootstrap indisponible → fallback | reason:", e?.message || e);
+    return false;
+  }
+}
+
 function renderVelvetUnavailableScreen(){
   const el = document.getElementById("app") || document.body;
 
@@ -725,7 +787,8 @@ if (btnStartRitualEl) {
       setTimeout(() => window.Telegram?.WebApp?.expand?.(), 250);
     });
 
-    // ✅ attempt_id: on le démarre tôt (Network visible)
+    // ✅ attempt_id + questions en un seul aller-retour (Network visible)
+    const booted = await bootstrapRitual();
     try { await ensureAttemptStarted(); } catch(e) {}
 
     questionRemaining = 45;
@@ -735,7 +798,7 @@ if (btnStartRitualEl) {
     setTimerMode("question");
     if (quizTimerEl) quizTimerEl.textContent = `Temps · ${formatSeconds(questionRemaining)}`;
 
-    await ensureQuizData();
+    if (!booted) await ensureQuizData();
     startRituel();
   });
 }
@@ -1124,6 +1187,8 @@ if (feedbackFinalSendBtn) {
 
     finalPayload = {
       mode: "rituel_full_v1",
+      // clé d'idempotence commune HTTP + bot : une seule page Notion
+      attempt_id: ritualAttemptId || undefined,
       score: finalScore,
       total: TOTAL_QUESTIONS,
       time_spent_seconds: finalTotalSeconds,
@@ -1155,6 +1220,7 @@ if (feedbackFinalSendBtn) {
       if (!window.Telegram || !window.Telegram.WebApp || !window.Telegram.WebApp.sendData) {
         throw new Error("Telegram WebApp API not available");
       }
+      if (!finalPayload.attempt_id && ritualAttemptId) finalPayload.attempt_id = ritualAttemptId;
       window.Telegram.WebApp.sendData(JSON.stringify(finalPayload));
       finalPayloadSent = true;
       console.log("✅ sendData() envoyé (feedback) — payload_len =", JSON.stringify(finalPayload).length);
@@ -1209,6 +1275,7 @@ if (feedbackFinalCloseBtn) {
         if (!window.Telegram || !window.Telegram.WebApp || !window.Telegram.WebApp.sendData) {
           throw new Error("Telegram WebApp API not available");
         }
+        if (!finalPayload.attempt_id && ritualAttemptId) finalPayload.attempt_id = ritualAttemptId;
         window.Telegram.WebApp.sendData(JSON.stringify(finalPayload));
         finalPayloadSent = true;
         console.log("✅ sendData() envoyé (close fallback) — payload_len =", JSON.stringify(finalPayload).length);
@@ -0,0 +1,129 @@
+# webapp_assets.py — manifest des assets WebApp (fingerprint + précompression)
+# -----------------------------------------------------
+# - Construit une fois par process : chaque fichier de webapp/ reçoit un nom
+#   à empreinte de contenu (app.3f2a9c1b0d4e.js)
+# - Références réécrites : style.css -> polices (url(), avec ou sans
+#   guillemets), index.html -> css/js/svg/mp3
+# - Variantes gzip (et brotli si le module est installé) précalculées
+# - Servi avec ETag + Cache-Control immutable ; index.html en no-cache +
+#   ETag (304) ; `version` ne change que si le contenu change
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:  # optionnel : gzip seul
+    brotli = None
+
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "webapp")
+
+# fichiers texte / polices : précompression utile (mp3 déjà compressé)
+_COMPRESSIBLE = {".js", ".css", ".svg", ".html", ".otf", ".json"}
+# ordre de réécriture : les dépendances avant ceux qui les référencent
+_REWRITE_ORDER = {".css": 1, ".html": 2}
+
+mimetypes.add_type("font/otf", ".otf")
+
+
+class Asset:
+    __slots__ = ("name", "hashed_name", "etag", "mimetype", "variants")
+
+    def __init__(self, name, data, hashed_name=None):
+        digest = hashlib.sha256(data).hexdigest()
+        stem, ext = os.path.splitext(name)
+        self.name = name
+        self.hashed_name = hashed_name or f"{stem}.{digest[:12]}{ext}"
+        self.etag = digest[:32]
+        self.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.variants = {None: data}
+        if ext in _COMPRESSIBLE:
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz) < len(data):
+                self.variants["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(data)
+                if len(br) < len(data):
+                    self.variants["br"] = br
+
+    def variant(self, accept_encodings):
+        """(encoding, bytes) selon Accept-Encoding (werkzeug Accept)."""
+        offered = [e for e in ("br", "gzip") if e in self.variants]
+        encoding = accept_encodings.best_match(offered) if offered else None
+        return encoding, self.variants[encoding]
+
+
+def _rewrite(text, mapping, prefix):
+    """Remplace les références "nom" / "./nom" entre guillemets, et
+    url(nom) sans guillemets (CSS)."""
+    for name, hashed in mapping.items():
+        ref = r'(?:\./)?' + re.escape(name)
+        text = re.sub(r'(["\'])' + ref + r'\1',
+                      lambda m: f"{m.group(1)}{prefix}{hashed}{m.group(1)}",
+                      text)
+        text = re.sub(r'url\(\s*' + ref + r'\s*\)',
+                      lambda m: f"url({prefix}{hashed})", text)
+    return text
+
+
+class AssetManifest:
+
+    def __init__(self, root=WEBAPP_DIR):
+        self.root = root
+        self.assets = {}  # hashed_name -> Asset
+        self.by_name = {}  # nom source -> Asset
+        self.index = None
+        self.version = None
+
+        names = sorted(
+            (n for n in os.listdir(root)
+             if not n.startswith(".") and os.path.isfile(os.path.join(root, n))),
+            key=lambda n: (_REWRITE_ORDER.get(os.path.splitext(n)[1], 0), n))
+
+        mapping = {}
+        for name in names:
+            with open(os.path.join(root, name), "rb") as fh:
+                data = fh.read()
+            ext = os.path.splitext(name)[1]
+            if ext == ".css":
+                # les polices sont à côté de la feuille dans /assets/
+                data = _rewrite(data.decode("utf-8"), mapping, "").encode("utf-8")
+            if name == "index.html":
+                html = _rewrite(data.decode("utf-8"), mapping, "assets/")
+                self.index = Asset(name, html.encode("utf-8"),
+                                   hashed_name=name)
+                continue
+            asset = Asset(name, data)
+            mapping[name] = asset.hashed_name
+            self.assets[asset.hashed_name] = asset
+            self.by_name[name] = asset
+
+        self.version = hashlib.sha256("".join(
+            sorted(a.etag for a in self.assets.values()) +
+            [self.index.etag if self.index else ""]).encode()).hexdigest()[:12]
+
+    def get(self, hashed_name):
+        return self.assets.get(hashed_name)
+
+
+_lock = threading.Lock()
+_manifest = None
+
+
+def manifest():
+    """Manifest du process, construit au premier appel."""
+    global _manifest
+    if _manifest is None:
+        with _lock:
+            if _manifest is None:
+                _manifest = AssetManifest()
+    return _manifest
+
+
+def is_built():
+    return _manifest is not None
@@ -0,0 +1,377 @@
+# write_behind.py — journal durable des écritures upstream (write-behind)
+# -----------------------------------------------------
+# - Journal SQLite en mode WAL (WRITE_BEHIND_DB), partagé par les workers
+#   gunicorn d'un même host
+# - Un endpoint enregistre le travail (enqueue) et répond tout de suite avec
+#   un reçu ; des threads de fond vident le journal vers Airtable / Notion
+# - Retries avec backoff exponentiel, jobs "dead" après max_attempts
+# - Survit aux redémarrages (jobs "running" repris à expiration du bail)
+#   et se vide au shutdown propre (atexit, WRITE_BEHIND_DRAIN_SECONDS)
+# - Bail prolongé tant que le handler tourne (attente rate limit, 429) :
+#   un job n'est repris que si son process est mort ; le nombre de
+#   tentatives sert de jeton, un ancien propriétaire ne peut plus le clore
+# - Le journal doit vivre sur un disque persistant : sur un /tmp éphémère
+#   (serverless) les jobs en attente sont perdus au recyclage de l'instance
+
+import atexit
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    receipt TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, next_at);
+CREATE INDEX IF NOT EXISTS jobs_receipt ON jobs(receipt);
+"""
+
+
+class RetryLater(Exception):
+    """Échec transitoire : le job sera retenté (backoff).
+
+    `payload` remplace le payload du job pour les tentatives suivantes
+    (ex. ne renvoyer que les records d'un batch qui ont échoué).
+    """
+
+    def __init__(self, reason, payload=None):
+        super().__init__(reason)
+        self.payload = payload
+
+
+class PermanentFailure(Exception):
+    """Échec définitif : le job passe directement en "dead"."""
+
+
+class Job:
+    """Contexte passé aux handlers : permet d'enchaîner des sous-jobs qui
+    partagent le reçu et sont commités avec la fin du job courant."""
+
+    def __init__(self, job_id, receipt, kind, attempts):
+        self.id = job_id
+        self.receipt = receipt
+        self.kind = kind
+        self.attempts = attempts
+        self.spawned = []
+
+    def spawn(self, kind, payload):
+        self.spawned.append((kind, payload))
+
+
+class WriteBehindQueue:
+
+    def __init__(self,
+                 path,
+                 workers=2,
+                 max_attempts=8,
+                 base_delay=2.0,
+                 max_delay=300.0,
+                 lease_seconds=120.0,
+                 retention_seconds=7 * 86400):
+        self.path = path
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.lease_seconds = float(lease_seconds)
+        self.retention_seconds = float(retention_seconds)
+        self._handlers = {}
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._last_prune = 0.0
+
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    # -------------------------------------------------
+    # SQLite
+    # -------------------------------------------------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path,
+                                   timeout=10,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _insert(self, conn, receipt, kind, payload, now):
+        conn.execute(
+            "INSERT INTO jobs (receipt, kind, payload, next_at, created_at,"
+            " updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (receipt, kind, json.dumps(payload, ensure_ascii=False), now, now,
+             now))
+
+    # -------------------------------------------------
+    # API
+    # -------------------------------------------------
+    def register(self, kind, handler):
+        """`handler(payload, job)` ; lever RetryLater / PermanentFailure
+        pour signaler un échec, toute autre exception est retentée."""
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind, payload, receipt=None):
+        """Écrit le job dans le journal (durable) et renvoie son reçu."""
+        if kind not in self._handlers:
+            raise KeyError(f"no write-behind handler for {kind!r}")
+        receipt = receipt or uuid.uuid4().hex
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._insert(conn, receipt, kind, payload, time.time())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._wakeup.set()
+        return receipt
+
+    def status(self, receipt):
+        rows = self._conn().execute(
+            "SELECT kind, status, attempts, last_error, result FROM jobs"
+            " WHERE receipt = ? ORDER BY id", (receipt, )).fetchall()
+        if not rows:
+            return None
+
+        states = {r["status"] for r in rows}
+        if "dead" in states:
+            overall = "failed"
+        elif states == {"done"}:
+            overall = "done"
+        else:
+            overall = "pending"
+        return {
+            "receipt": receipt,
+            "status": overall,
+            "jobs": [{
+                "kind": r["kind"],
+                "status": r["status"],
+                "attempts": r["attempts"],
+                "last_error": r["last_error"],
+                "result": json.loads(r["result"]) if r["result"] else None,
+            } for r in rows],
+        }
+
+    def depth(self):
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        out = {"pending": 0, "running": 0, "done": 0, "dead": 0}
+        out.update({r["status"]: r["n"] for r in rows})
+        return out
+
+    # -------------------------------------------------
+    # Traitement
+    # -------------------------------------------------
+    def _claim(self):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, receipt, kind, payload, attempts FROM jobs"
+                " WHERE (status = 'pending' AND next_at <= ?)"
+                " OR (status = 'running' AND lease_until < ?)"
+                " ORDER BY id LIMIT 1", (now, now)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', lease_until = ?,"
+                    " attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (now + self.lease_seconds, now, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _finish(self, job, status, result=None, error=None, payload=None,
+                delay=0.0):
+        """Clôt la tentative `job.attempts`. Renvoie False si le job a été
+        repris entre-temps par un autre worker (rien n'est écrit)."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, next_at = ?, lease_until = NULL,"
+                " last_error = ?, result = ?, updated_at = ?,"
+                " payload = COALESCE(?, payload)"
+                " WHERE id = ? AND attempts = ? AND status = 'running'",
+                (status, now + delay, error,
+                 json.dumps(result, ensure_ascii=False, default=str)
+                 if result is not None else None, now,
+                 json.dumps(payload, ensure_ascii=False)
+                 if payload is not None else None, job.id,
+                 job.attempts)).rowcount
+            if not updated:
+                conn.execute("ROLLBACK")
+                logger.warning("write-behind %s#%s attempt %s lost its lease",
+                               job.kind, job.id, job.attempts)
+                return False
+            if status == "done":
+                for kind, child in job.spawned:
+                    self._insert(conn, job.receipt, kind, child, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if job.spawned and status == "done":
+            self._wakeup.set()
+        return True
+
+    def _renew_lease(self, job):
+        return self._conn().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND attempts = ?"
+            " AND status = 'running'",
+            (time.time() + self.lease_seconds, job.id, job.attempts)).rowcount
+
+    def _heartbeat(self, job, done):
+        # le handler peut attendre bien plus que le bail (rate limit, 429,
+        # timeouts) : on prolonge tant qu'il tourne
+        while not done.wait(self.lease_seconds / 3):
+            try:
+                if not self._renew_lease(job):
+                    return
+            except sqlite3.Error as e:
+                logger.warning("write-behind %s#%s lease renewal failed: %s",
+                               job.kind, job.id, e)
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * (2**(attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _call(self, handler, payload, job):
+        """handler(payload, job), bail prolongé pendant l'appel."""
+        done = threading.Event()
+        threading.Thread(target=self._heartbeat,
+                         args=(job, done),
+                         name=f"write-behind-lease-{job.id}",
+                         daemon=True).start()
+        try:
+            return handler(payload, job)
+        finally:
+            done.set()
+
+    def run_one(self):
+        """Traite un job prêt. Renvoie False si le journal n'a rien à faire."""
+        row = self._claim()
+        if row is None:
+            return False
+
+        job = Job(row["id"], row["receipt"], row["kind"], row["attempts"] + 1)
+        handler = self._handlers.get(job.kind)
+        if handler is None:
+            self._finish(job, "dead", error=f"no handler for {job.kind!r}")
+            return True
+
+        try:
+            result = self._call(handler, json.loads(row["payload"]), job)
+        except PermanentFailure as e:
+            logger.error("🪦 write-behind %s#%s dead: %s", job.kind, job.id, e)
+            self._finish(job, "dead", error=str(e)[:1000])
+        except Exception as e:
+            payload = e.payload if isinstance(e, RetryLater) else None
+            if job.attempts >= self.max_attempts:
+                logger.error("🪦 write-behind %s#%s dead after %s attempts: %s",
+                             job.kind, job.id, job.attempts, e)
+                self._finish(job, "dead", error=str(e)[:1000], payload=payload)
+            else:
+                delay = self._backoff(job.attempts)
+                logger.warning("↻ write-behind %s#%s retry in %.1fs: %s",
+                               job.kind, job.id, delay, e)
+                self._finish(job,
+                             "pending",
+                             error=str(e)[:1000],
+                             payload=payload,
+                             delay=delay)
+        else:
+            self._finish(job, "done", result=result)
+        return True
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 600:
+            return
+        self._last_prune = now
+        self._conn().execute(
+            "DELETE FROM jobs WHERE status = 'done' AND updated_at < ?",
+            (now - self.retention_seconds, ))
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_one():
+                    continue
+                self._prune()
+            except Exception as e:
+                logger.exception("write-behind worker error: %s", e)
+            self._wakeup.wait(0.5)
+            self._wakeup.clear()
+
+    def start(self):
+        """Lance les workers du process (relancés après un fork)."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._worker,
+                                 name=f"write-behind-{i}",
+                                 daemon=True) for i in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+            atexit.register(self.drain)
+
+    def drain(self, timeout=None):
+        """Shutdown propre : laisse les workers vider les jobs prêts puis
+        les arrête. Les jobs en attente de retry restent dans le journal."""
+        if self._pid != os.getpid():
+            return
+        if timeout is None:
+            timeout = float(os.getenv("WRITE_BEHIND_DRAIN_SECONDS", "25"))
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            ready = self._conn().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'pending'"
+                " AND next_at <= ?", (time.time(), )).fetchone()[0]
+            if not ready:
+                break
+            self._wakeup.set()
+            time.sleep(0.1)
+        # les jobs en cours sur nos threads se terminent avant le join
+        self._stop.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout=max(0.0, deadline - time.time()))
+        self._pid = None